@@ -31,3 +31,5 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 """The Achieve Django app."""
+
+default_app_config = 'achieve.apps.AchieveConfig'
@@ -0,0 +1,14 @@
+"""App configuration for Achieve."""
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class AchieveConfig(AppConfig):
+    """Configuration of the Achieve app."""
+
+    name = 'achieve'
+
+    def ready(self):
+        """Connect signals that need the app registry."""
+        from achieve import fulltext
+        post_migrate.connect(fulltext.ensure_sqlite_triggers, sender=self)
@@ -0,0 +1,21 @@
+"""Authentication backends for Achieve."""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class ProfileModelBackend(ModelBackend):
+    """ModelBackend that loads the AchieveProfile together with the user.
+
+    Almost every request needs the profile (time zone, badges), this saves a
+    query on each of them.
+    """
+
+    def get_user(self, user_id):
+        """Get a user and their profile."""
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('achieveprofile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,223 @@
+"""Synthetic datasets and view measurements, for benchmarks and query budgets.
+
+generate_user() creates a user with tasks, projects and tags that look like
+real data: due dates, reminders, pins, closed projects, done and trashed
+tasks, and tags on tasks and projects.  The first items of every user are
+the same at every size, so that pages show the same kinds of items: the
+first task, project and tag are pinned, tagged and found by a search for
+"review", the first task has a due date and a reminder, and the second
+task is in the Trash.
+
+Every view in achieve.urls has a query budget: the number of SQL queries a
+GET runs without cached data, which must not grow with the amount of data.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from achieve import queries, scheduler, transfer, urls
+from achieve.helpers import bulk_create_slugged, update_badges
+from achieve.models import Task, Project, Tag
+
+WORDS = (
+    'call', 'email', 'write', 'review', 'plan', 'buy', 'fix', 'clean', 'book', 'pay', 'read', 'update',
+    'report', 'meeting', 'invoice', 'garden', 'kitchen', 'car', 'dentist', 'tickets', 'budget', 'draft',
+    'slides', 'server', 'backup', 'groceries', 'birthday', 'present', 'insurance', 'taxes', 'website',
+    'newsletter', 'bug', 'release', 'notes', 'the', 'for', 'with', 'about', 'next', 'week', 'monday',
+)
+
+# URL names that are not measured, and why.
+SKIPPED = {
+    'reminders_stream': "a long-lived event stream",
+}
+
+# The model whose first item (of the user) is passed as the slug, by URL name.
+SLUG_MODELS = {
+    'tag': Tag,
+    'projects_with_tag': Tag,
+    'tasks_with_tag': Tag,
+    'project': Project,
+    'task': Task,
+}
+
+# Query strings of URLs that need them.
+QUERY_STRINGS = {
+    'search': 'q=review',
+}
+
+# The number of SQL queries of a GET of every view, without cached data (for
+# export, with fewer than transfer.CHUNK_SIZE items of every kind).
+QUERY_BUDGETS = {
+    'index': 11,
+    'auth_profile': 5,
+    'quick_add': 2,
+    'add': 7,
+    'collection': 5,
+    'search': 11,
+    'tags': 6,
+    'tag': 10,
+    'projects_with_tag': 8,
+    'tasks_with_tag': 10,
+    'projects': 7,
+    'project_add': 6,
+    'project': 11,
+    'tasks': 8,
+    'task': 9,
+    'inbox': 9,
+    'due_soon': 9,
+    'trash': 8,
+    'trash_empty': 2,
+    'export': 7,
+    'import_data': 5,
+    'reminders_soon': 3,
+}
+
+
+def sentence(rng, words):
+    """Make up a sentence."""
+    return ' '.join(rng.choice(WORDS) for i in range(words)).capitalize()
+
+
+def description(rng):
+    """Make up a Markdown description (or none)."""
+    if rng.random() < 0.5:
+        return ''
+    items = '\n'.join('* ' + sentence(rng, rng.randint(2, 6)) for i in range(rng.randint(0, 4)))
+    return '{0}.\n\n{1}'.format(sentence(rng, rng.randint(5, 20)), items).strip()
+
+
+def generate_user(username, tasks, projects, tags, rng):
+    """Create a user with `tasks` tasks, `projects` projects and `tags` tags, and return the user.
+
+    Markdown is not rendered (run render_markdown to render it).
+    """
+    now = timezone.now()
+    user = User.objects.create(username=username)
+    bulk_create_slugged(Tag, user.pk, [
+        Tag(user=user, title='Review' if i == 0 else sentence(rng, rng.randint(1, 2)),
+            pinned=i == 0 or rng.random() < 0.05)
+        for i in range(tags)])
+    bulk_create_slugged(Project, user.pk, [
+        Project(user=user, title='Review the website' if i == 0 else sentence(rng, rng.randint(2, 5)),
+                description=description(rng), priority=rng.randint(1, 5), open=i == 0 or rng.random() < 0.8,
+                pinned=i == 0 or rng.random() < 0.05)
+        for i in range(projects)], markdown=False)
+    tag_ids = list(queries.tags_user(user).order_by('pk').values_list('pk', flat=True))
+    project_ids = list(queries.projects_user(user).order_by('pk').values_list('pk', flat=True))
+
+    objs = []
+    for i in range(tasks):
+        task = Task(user=user, title=sentence(rng, rng.randint(2, 8)), description=description(rng),
+                    priority=rng.randint(1, 5), folder=rng.choice(('inbox', 'tasks', 'tasks', 'tasks', 'trash')),
+                    done=rng.random() < 0.4, pinned=rng.random() < 0.03)
+        if project_ids and rng.random() < 0.6:
+            task.project_id = rng.choice(project_ids)
+        if rng.random() < 0.4:
+            task.due = now + timedelta(hours=rng.randint(-14 * 24, 30 * 24))
+        if rng.random() < 0.1:
+            task.reminder = now + timedelta(hours=rng.randint(-2 * 24, 7 * 24))
+            task.reminder_seen = task.reminder < now and rng.random() < 0.5
+        if i == 0:
+            task.title, task.folder, task.done, task.pinned = 'Review the budget', 'inbox', False, True
+            task.due = task.reminder = now + timedelta(hours=1)
+            task.project_id = project_ids[0] if project_ids else None
+        elif i == 1:
+            task.folder = 'trash'
+        objs.append(task)
+    bulk_create_slugged(Task, user.pk, objs, markdown=False)
+
+    if tag_ids:
+        through = Task.tags.through
+        through.objects.bulk_create([
+            through(task_id=pk, tag_id=tag_id)
+            for i, pk in enumerate(queries.tasks_user(user).order_by('pk').values_list('pk', flat=True))
+            for tag_id in ([tag_ids[0]] if i == 0 else rng.sample(tag_ids, min(rng.randint(0, 3), len(tag_ids))))])
+        through = Project.tags.through
+        through.objects.bulk_create([
+            through(project_id=pk, tag_id=tag_id)
+            for i, pk in enumerate(project_ids)
+            for tag_id in ([tag_ids[0]] if i == 0 else rng.sample(tag_ids, min(rng.randint(0, 2), len(tag_ids))))])
+    update_badges(user)
+    return user
+
+
+def query_budget(name, tasks, projects, tags):
+    """Get the query budget of a view, for a user with the given numbers of items."""
+    budget = QUERY_BUDGETS[name]
+    if name == 'export':
+        # Another query for every further chunk of items, and of their links to tags.
+        for count, links in ((tasks, True), (projects, True), (tags, False)):
+            budget += count // transfer.CHUNK_SIZE
+            if links and count:
+                budget += (count - 1) // transfer.CHUNK_SIZE
+    return budget
+
+
+def dataset_sizes(tasks):
+    """Get the default numbers of (projects, tags) for a number of tasks."""
+    return max(tasks // 20, 1), max(tasks // 50, 1)
+
+
+def view_urls(user):
+    """Get the views to measure and their URLs for a user, as (URL name, URL)."""
+    result = []
+    for pattern in urls.urlpatterns:
+        if pattern.name in SKIPPED:
+            continue
+        args = ()
+        if pattern.name in SLUG_MODELS:
+            args = (SLUG_MODELS[pattern.name].objects.filter(user=user).order_by('pk').first().slug,)
+        url = reverse('achieve:' + pattern.name, args=args)
+        if pattern.name in QUERY_STRINGS:
+            url += '?' + QUERY_STRINGS[pattern.name]
+        result.append((pattern.name, url))
+    return result
+
+
+def login(user):
+    """Get a test client logged in as a user."""
+    client = Client()
+    client.force_login(user, backend=settings.AUTHENTICATION_BACKENDS[0])
+    return client
+
+
+def get(client, url):
+    """GET a URL with a test client, reading all of a streamed response."""
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, url, repeat=1):
+    """Measure GETs of a URL.
+
+    Returns the status, the queries run without cached data (this clears the
+    cache), the time of that request, and the best time of `repeat` requests
+    with cached data, in seconds.
+    """
+    # Let lazily updated data (like the due-soon badge) settle first.
+    get(client, url)
+    cache.clear()
+    scheduler.queue.reset()
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        response = get(client, url)
+        cold_time = time.perf_counter() - start
+    # Later requests reset the query log.
+    captured = ctx.captured_queries
+    warm_times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        get(client, url)
+        warm_times.append(time.perf_counter() - start)
+    return response.status_code, captured, cold_time, min(warm_times)
@@ -0,0 +1,120 @@
+"""Per-user caches for data shown on every page.
+
+Cached values are not invalidated; their keys include everything they
+depend on instead, like the data generation of the user (see
+achieve.counters), which every change bumps, so changes made in other
+processes and by bulk updates are seen too.  Per-request values (the CSRF
+token and the current path) of fragments are left out as markers and
+filled in after the cache lookup.
+"""
+
+import collections
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.defaulttags import CsrfTokenNode
+from django.utils import timezone
+from django.utils.html import escape, mark_safe
+
+from achieve import queries
+from achieve.conditional import time_bucket
+from achieve.models import MD_VERSION
+
+PINNED_KEY = 'achieve:pinned:{0}:{1}'
+
+FRAGMENT_KEY = 'achieve:fragment:{0}'
+# Bump this when the fragment templates change.
+FRAGMENT_REVISION = 2
+# HTML comments cannot come from user input: titles are escaped and Markdown
+# is sanitized by bleach, which strips comments.
+CSRF_MARKER = mark_safe('<!--achieve:csrf-->')
+PATH_MARKER = mark_safe('<!--achieve:path-->')
+
+
+class Pin(collections.namedtuple('Pin', 'title url')):
+    """A pinned item, as shown in the sidebar."""
+
+    __slots__ = ()
+
+    def get_absolute_url(self):
+        """Get the absolute URL of the item."""
+        return self.url
+
+
+def pinned_items(user):
+    """Get the pinned items of a user."""
+    key = PINNED_KEY.format(user.pk, user.achieveprofile.generation)
+    pins = cache.get(key)
+    if pins is None:
+        items = list(queries.pinned_tasks_user(user).order_by("title"))
+        items += queries.pinned_open_projects_user(user).order_by("title")
+        items += queries.pinned_tags_user(user).order_by("title")
+        pins = [Pin(i.title, i.get_absolute_url()) for i in items]
+        cache.set(key, pins, settings.ACHIEVE_PINNED_CACHE_TIMEOUT)
+    return pins
+
+
+def fragment_key(*parts):
+    """Get the cache key of a fragment identified by `parts`."""
+    key = repr((FRAGMENT_REVISION, MD_VERSION) + parts)
+    return FRAGMENT_KEY.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def table_key(request, kind, *args):
+    """Get the cache key of a table on the current page.
+
+    Tables are identified by their kind and arguments, the page and its
+    query string (sorting, filters, pagination), and the data generation and
+    time zone of the user.  The time bucket makes tasks that became overdue
+    show up (see achieve.conditional).
+    """
+    profile = request.user.achieveprofile
+    return fragment_key('table', kind, args, request.user.pk, profile.generation, profile.timezone,
+                        time_bucket().timestamp(), request.path, sorted(request.GET.lists()))
+
+
+def cached_fragment(key, render):
+    """Get a cached fragment, rendering and caching it if necessary."""
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = render()
+        cache.set(key, fragment, settings.ACHIEVE_FRAGMENT_CACHE_TIMEOUT)
+    return fragment
+
+
+def cached_rows(items, row_key, render):
+    """Render table rows, reusing the cached ones.
+
+    `row_key(item)` returns the parts identifying a row, `render(item)` renders it.
+    """
+    keys = [fragment_key('row', row_key(item)) for item in items]
+    cached = cache.get_many(keys)
+    rendered = {}
+    rows = []
+    for key, item in zip(keys, items):
+        row = cached.get(key)
+        if row is None:
+            row = rendered[key] = render(item)
+        rows.append(mark_safe(row))
+    if rendered:
+        cache.set_many(rendered, settings.ACHIEVE_FRAGMENT_CACHE_TIMEOUT)
+    return rows
+
+
+def fill_markers(fragment, context):
+    """Replace the per-request markers in a fragment."""
+    fragment = fragment.replace(CSRF_MARKER, CsrfTokenNode().render(context))
+    return mark_safe(fragment.replace(PATH_MARKER, escape(context['request'].path)))
+
+
+def task_row_key(task):
+    """Get the parts identifying a task table row."""
+    project = task.project
+    return ('task', task.pk, task.modified.timestamp(), timezone.get_current_timezone_name(), task.overdue(),
+            project and (project.pk, project.modified.timestamp()))
+
+
+def project_row_key(project):
+    """Get the parts identifying a project table row."""
+    return ('project', project.pk, project.modified.timestamp(), project.progress())
@@ -0,0 +1,57 @@
+"""Conditional GET support (ETag and Last-Modified) for per-user pages.
+
+Pages are identified by the user's data generation (bumped on every change,
+see achieve.counters), their time zone and CSRF cookie (both of which affect
+the rendered HTML), and a time bucket, as due dates become due with time.
+Validators are computed from the profile only, which is loaded with the user.
+"""
+
+import datetime
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def time_bucket(now=None):
+    """Get the start of the current time bucket."""
+    now = timezone.now() if now is None else now
+    size = settings.ACHIEVE_CONDITIONAL_BUCKET
+    return datetime.datetime.fromtimestamp(now.timestamp() // size * size, tz=datetime.timezone.utc)
+
+
+def page_etag(request, *args, **kwargs):
+    """Compute the ETag of a page, or None if it must not be cached."""
+    if not request.user.is_authenticated() or len(get_messages(request)):
+        return None
+    profile = request.user.achieveprofile
+    key = '{0}:{1}:{2}:{3}:{4}'.format(
+        request.user.pk, profile.generation, profile.timezone,
+        request.META.get('CSRF_COOKIE', ''), time_bucket().timestamp())
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def page_last_modified(request, *args, **kwargs):
+    """Get the Last-Modified time of a page, or None if it must not be cached."""
+    if not request.user.is_authenticated() or len(get_messages(request)):
+        return None
+    return max(request.user.achieveprofile.changed, time_bucket())
+
+
+def conditional_page(view):
+    """Answer conditional GETs of a per-user page with 304 Not Modified.
+
+    Responses must be revalidated on every use, as they can change at any time.
+    """
+    conditional_view = condition(etag_func=page_etag, last_modified_func=page_last_modified)(view)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
@@ -0,0 +1,283 @@
+"""Incremental maintenance of the per-user counters stored in AchieveProfile.
+
+Besides the badges, every change bumps the profile's generation counter and
+change time, which identify the state of a user's data (see
+achieve.conditional).
+
+Changes are applied immediately, unless they happen inside a ``deferred()``
+block.  Deferred changes are collected and applied once per affected user.
+
+Subscribers are told the new generation of a user once it is committed, if
+all the changes behind it were made by saving or deleting items one by one
+(and so were published to achieve.events.hub as well).
+"""
+
+import collections
+import contextlib
+import copy
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from achieve import queries
+from achieve.models import AchieveProfile, Task, Project
+
+BADGE_FIELDS = ('badge_inbox', 'badge_all_tasks', 'badge_trash', 'badge_projects')
+DUE_SOON_FIELDS = ('badge_due_soon', 'badge_due_soon_expires')
+# Recount the due-soon badge at least this often, even if nothing changed.
+DUE_SOON_MAX_AGE = timedelta(days=7)
+
+_local = threading.local()
+_subscribers = []
+
+
+class PendingChanges(object):
+    """Counter changes collected for a single user."""
+
+    def __init__(self):
+        self.deltas = collections.Counter()
+        self.recount = False
+        self.due_soon_stale = False
+        self.touched = False
+        # Changes made without item signals (bulk updates), which subscribers have not seen.
+        self.unsignalled = False
+
+    def apply(self, user_id):
+        """Apply the changes to the database, with a single UPDATE (and a read of the new generation)."""
+        now = timezone.now()
+        if self.recount:
+            values = count_badges(user_id)
+        else:
+            values = {name: F(name) + d for name, d in self.deltas.items() if d}
+        if self.recount or self.due_soon_stale:
+            # A new timestamp, so that recounts started earlier don’t store their result.
+            values['badge_due_soon_expires'] = now
+        if self.recount or self.touched:
+            values['generation'] = F('generation') + 1
+            values['changed'] = now
+        if not values:
+            return
+        profile = AchieveProfile.objects.filter(user_id=user_id)
+        if 'generation' not in values or self.unsignalled or not _subscribers:
+            profile.update(**values)
+            return
+        # The row stays locked until the end of the transaction, so this reads our own generation.
+        with transaction.atomic():
+            profile.update(**values)
+            generation = profile.values_list('generation', flat=True).first()
+        if generation is not None:
+            transaction.on_commit(lambda: publish_generation(user_id, generation))
+
+
+def subscribe(callback):
+    """Call `callback(user_id, 'generation', {'generation': generation})` for new generations (see above)."""
+    _subscribers.append(callback)
+
+
+def publish_generation(user_id, generation):
+    """Tell the subscribers about a committed generation of a user."""
+    for callback in _subscribers:
+        callback(user_id, 'generation', {'generation': generation})
+
+
+def _pending():
+    """Return the changes collected by the current deferred() block, if any."""
+    return getattr(_local, 'pending', None)
+
+
+@contextlib.contextmanager
+def changes_for(user_id):
+    """Collect changes for a user, applied at the end of the block or with the deferred() block."""
+    pending = _pending()
+    if pending is not None:
+        yield pending[user_id]
+    else:
+        changes = PendingChanges()
+        yield changes
+        changes.apply(user_id)
+
+
+def flush(pending):
+    """Apply collected changes, once per user."""
+    for user_id, changes in pending.items():
+        changes.apply(user_id)
+
+
+@contextlib.contextmanager
+def deferred():
+    """Collect counter changes made in the block and apply them once per user.
+
+    The block runs in a transaction.  If it is the outermost transaction, the
+    changes are applied with transaction.on_commit; if it is nested in another
+    transaction, they are applied at the end of the block.  Nested deferred()
+    blocks are merged into the outermost one.
+    """
+    pending = _pending()
+    if pending is not None:
+        saved = copy.deepcopy(pending)
+        try:
+            with transaction.atomic():
+                yield
+        except BaseException:
+            # The savepoint was rolled back, and so were the changes.
+            pending.clear()
+            pending.update(saved)
+            raise
+        return
+
+    outermost = not transaction.get_connection().in_atomic_block
+    pending = _local.pending = collections.defaultdict(PendingChanges)
+    try:
+        with transaction.atomic():
+            yield
+            if outermost:
+                transaction.on_commit(lambda: flush(pending))
+    finally:
+        _local.pending = None
+    if not outermost:
+        flush(pending)
+
+
+def task_badges(folder, done):
+    """Return the badges a task in the given state counts towards."""
+    return {
+        'badge_inbox': int(folder == 'inbox' and not done),
+        'badge_all_tasks': int(folder != 'trash' and not done),
+        'badge_trash': int(folder == 'trash'),
+    }
+
+
+def project_badges(open):
+    """Return the badges a project in the given state counts towards."""
+    return {'badge_projects': int(bool(open))}
+
+
+def badges_for(obj, loaded=False):
+    """Return the badges an item counts towards, in its current or loaded state."""
+    value = obj.loaded_value if loaded else lambda field: getattr(obj, field)
+    if isinstance(obj, Task):
+        return task_badges(value('folder'), value('done'))
+    elif isinstance(obj, Project):
+        return project_badges(value('open'))
+    else:
+        return {}
+
+
+def badge_deltas(before, after):
+    """Compute the changes between two badge states."""
+    deltas = {}
+    for name in set(before) | set(after):
+        d = after.get(name, 0) - before.get(name, 0)
+        if d:
+            deltas[name] = d
+    return deltas
+
+
+def apply_deltas(user_id, deltas):
+    """Apply badge deltas to a user’s profile (deferred if possible)."""
+    with changes_for(user_id) as changes:
+        changes.deltas.update(deltas)
+        changes.touched = True
+        changes.unsignalled = True
+
+
+def count_badges(user):
+    """Count all badges for a user from scratch."""
+    return {
+        'badge_inbox': queries.inbox_user_notdone(user).count(),
+        'badge_all_tasks': queries.incomplete_tasks_user(user).count(),
+        'badge_trash': queries.trash_user(user).count(),
+        'badge_projects': queries.open_projects_user(user).count(),
+    }
+
+
+def recount_badges(user_id):
+    """Recount all badges for a user (deferred if possible)."""
+    with changes_for(user_id) as changes:
+        changes.recount = True
+        changes.unsignalled = True
+
+
+def touch(user_id, signalled=False):
+    """Record that data of a user changed, without affecting badges (deferred if possible).
+
+    `signalled` is true if the change cannot affect anything published to
+    achieve.events.hub (like reminders).
+    """
+    with changes_for(user_id) as changes:
+        changes.touched = True
+        changes.unsignalled |= not signalled
+
+
+def count_due_soon(user, now):
+    """Count tasks due soon, and find when the count changes next.
+
+    The count only grows with time, when a task due later comes within a day
+    of its due date.
+    """
+    count = queries.due_soon_user(user, now).count()
+    due_next = queries.due_later_user(user, now).aggregate(due=Min('due'))['due']
+    if due_next is None:
+        return count, now + DUE_SOON_MAX_AGE
+    return count, min(due_next - queries.DUE_SOON, now + DUE_SOON_MAX_AGE)
+
+
+def due_soon_badge(user):
+    """Get the due-soon badge of a user, recounting it if it expired."""
+    profile = user.achieveprofile
+    now = timezone.now()
+    expires = profile.badge_due_soon_expires
+    if expires is not None and expires > now:
+        return profile.badge_due_soon
+    count, new_expires = count_due_soon(user, now)
+    # Don’t overwrite the result of a newer expire_due_soon() call.
+    AchieveProfile.objects.filter(pk=profile.pk, badge_due_soon_expires=expires).update(
+        badge_due_soon=count, badge_due_soon_expires=new_expires)
+    profile.badge_due_soon = count
+    profile.badge_due_soon_expires = new_expires
+    return count
+
+
+def expire_due_soon(user_id):
+    """Mark the due-soon badge of a user for recounting (deferred if possible)."""
+    with changes_for(user_id) as changes:
+        changes.due_soon_stale = True
+
+
+def affects_due_soon(obj, loaded=False):
+    """Check if a task can be (or become) due soon, in its current or loaded state."""
+    value = obj.loaded_value if loaded else lambda field: getattr(obj, field)
+    return isinstance(obj, Task) and value('due') is not None and not value('done') and value('folder') != 'trash'
+
+
+def item_saved(obj, created):
+    """Update badges after an item was saved."""
+    with changes_for(obj.user_id) as changes:
+        changes.touched = True
+        if created:
+            changes.deltas.update(badges_for(obj))
+            changes.due_soon_stale |= affects_due_soon(obj)
+        elif obj._loaded_values is None or obj.loaded_value('user_id') != obj.user_id:
+            # We don’t know the previous state, fall back to a full recount.
+            changes.recount = True
+        else:
+            changes.deltas.update(badge_deltas(badges_for(obj, loaded=True), badges_for(obj)))
+            if isinstance(obj, Task) and obj.has_changed('due', 'done', 'folder') and \
+                    (affects_due_soon(obj) or affects_due_soon(obj, loaded=True)):
+                changes.due_soon_stale = True
+    old_user = obj.loaded_value('user_id')
+    if not created and old_user is not None and old_user != obj.user_id:
+        recount_badges(old_user)
+
+
+def item_deleted(obj):
+    """Update badges after an item was deleted."""
+    loaded = obj._loaded_values is not None
+    state = badges_for(obj, loaded=loaded)
+    with changes_for(obj.user_id) as changes:
+        changes.touched = True
+        changes.deltas.update({name: -d for name, d in state.items() if d})
+        changes.due_soon_stale |= affects_due_soon(obj, loaded=loaded)
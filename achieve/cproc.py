@@ -1,36 +1,41 @@
-"""Context processors for Achieve."""
+"""Context processors for Achieve.
 
-from achieve import queries, models
+The values are lazy, so pages that do not display them do not query the
+database (like redirects, JSON and streaming responses).
+"""
 
+from django.utils.functional import SimpleLazyObject
 
-def badges(request):
-    """Generate badges to show off some numbers."""
+from achieve import caching, counters
+
+
+def _badges(request):
+    """Compute the badges."""
     if not request.user.is_authenticated():
-        return {'badges': {}}
+        return {}
     b = {}
 
     b['inbox'] = request.user.achieveprofile.badge_inbox
     b['all_tasks'] = request.user.achieveprofile.badge_all_tasks
-    b['due_soon'] = queries.due_soon(request).count()
+    b['due_soon'] = counters.due_soon_badge(request.user)
     b['trash'] = request.user.achieveprofile.badge_trash
     b['projects'] = request.user.achieveprofile.badge_projects
 
-    return {'badges': b}
+    return b
 
 
-def pinned(request):
-    """Add pinned tasks to context."""
-    if not request.user.is_authenticated():
-        return {'pinned_items': []}
-    pins = []
+def badges(request):
+    """Generate badges to show off some numbers."""
+    return {'badges': SimpleLazyObject(lambda: _badges(request))}
 
-    for i in queries.pinned_tasks(request).order_by("title"):
-        pins.append(i)
 
-    for i in models.Project.objects.filter(pinned=True, user=request.user, open=True).order_by("title"):
-        pins.append(i)
+def _pinned(request):
+    """Get the pinned items."""
+    if not request.user.is_authenticated():
+        return []
+    return caching.pinned_items(request.user)
 
-    for i in models.Tag.objects.filter(pinned=True, user=request.user).order_by("title"):
-        pins.append(i)
 
-    return {"pinned_items": pins}
+def pinned(request):
+    """Add pinned tasks to context."""
+    return {"pinned_items": SimpleLazyObject(lambda: _pinned(request))}
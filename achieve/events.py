@@ -0,0 +1,171 @@
+"""In-process publish/subscribe hub for pushing reminder changes to browsers.
+
+Events are kept in a small per-user ring buffer, so that reconnecting
+clients (which send the ID of the last event they got) receive only what
+they missed.  Event IDs are ``<epoch>-<sequence>``; the epoch changes when
+the process restarts, and clients with IDs from another epoch, or that
+missed more events than the buffer holds, get a full snapshot instead.
+
+The hub only sees changes made in its own process.  Streams also check the
+user's data generation (see achieve.counters) at every heartbeat and send
+a snapshot if it changed, which picks up changes made by other processes.
+"""
+
+import collections
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from achieve import counters
+from achieve.models import AchieveProfile
+from achieve.scheduler import reminder_active, reminder_data
+from achieve.scheduler import queue as reminder_queue
+
+
+class Hub(object):
+    """A publish/subscribe hub with per-user event buffers."""
+
+    def __init__(self, buffer_size):
+        """Create a hub."""
+        self.epoch = uuid.uuid4().hex[:12]
+        self.buffer_size = buffer_size
+        self.seq = 0
+        self.buffers = {}
+        self.subscribers = []
+        self.condition = threading.Condition()
+
+    def subscribe(self, callback):
+        """Call `callback(user_id, event, data)` for every event published in this process."""
+        self.subscribers.append(callback)
+
+    def publish(self, user_id, event, data):
+        """Publish an event to the streams of a user."""
+        with self.condition:
+            self.seq += 1
+            buf = self.buffers.get(user_id)
+            if buf is None:
+                buf = self.buffers[user_id] = collections.deque(maxlen=self.buffer_size)
+            buf.append((self.seq, event, data))
+            self.condition.notify_all()
+        for callback in self.subscribers:
+            callback(user_id, event, data)
+
+    def since(self, user_id, seq):
+        """Get the events of a user after `seq`, or None if some of them were dropped."""
+        with self.condition:
+            buf = self.buffers.get(user_id, ())
+            if len(buf) == self.buffer_size and buf[0][0] > seq + 1:
+                return None
+            return [e for e in buf if e[0] > seq]
+
+    def wait(self, user_id, seq, timeout):
+        """Wait up to `timeout` seconds for events of a user after `seq`, and return them like since()."""
+        with self.condition:
+            self.condition.wait_for(lambda: self._latest(user_id) > seq, timeout)
+            return self.since(user_id, seq)
+
+    def _latest(self, user_id):
+        """Get the sequence number of the latest event of a user."""
+        buf = self.buffers.get(user_id)
+        return buf[-1][0] if buf else 0
+
+    def event_id(self, seq):
+        """Format an event ID."""
+        return '{0}-{1}'.format(self.epoch, seq)
+
+    def parse_id(self, event_id):
+        """Parse an event ID from this process, return its sequence number or None."""
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+
+hub = Hub(settings.ACHIEVE_EVENT_BUFFER_SIZE)
+hub.subscribe(reminder_queue.apply)
+counters.subscribe(reminder_queue.apply)
+
+
+def publish_on_commit(user_id, event, data):
+    """Publish an event once the current transaction commits."""
+    transaction.on_commit(lambda: hub.publish(user_id, event, data))
+
+
+def task_saved(task, created):
+    """Publish reminder changes after a task was saved."""
+    if reminder_active(task):
+        if created or task.has_changed('reminder', 'reminder_seen', 'done', 'folder', 'title', 'description',
+                                       'slug', 'user_id'):
+            publish_on_commit(task.user_id, 'reminder', reminder_data(task))
+    elif not created and (task._loaded_values is None or reminder_active(task, loaded=True)):
+        publish_on_commit(task.user_id, 'cancel', {'id': task.pk})
+    old_user = task.loaded_value('user_id')
+    if old_user is not None and old_user != task.user_id:
+        publish_on_commit(old_user, 'cancel', {'id': task.pk})
+
+
+def task_deleted(task):
+    """Publish reminder cancellations after a task was deleted."""
+    if task._loaded_values is None or reminder_active(task, loaded=True):
+        publish_on_commit(task.user_id, 'cancel', {'id': task.pk})
+
+
+def format_event(event, data, event_id=None):
+    """Format an event for the text/event-stream format."""
+    lines = []
+    if event_id is not None:
+        lines.append('id: ' + event_id)
+    lines.append('event: ' + event)
+    lines.append('data: ' + json.dumps(data))
+    return '\n'.join(lines) + '\n\n'
+
+
+def snapshot(request, generation):
+    """Format a snapshot of all reminders due soon, for data generation `generation`."""
+    seq = hub.seq
+    data = {'reminders': reminder_queue.reminders_soon(request.user, generation)}
+    return format_event('snapshot', data, hub.event_id(seq)), seq
+
+
+def generation(user):
+    """Get the data generation of a user."""
+    return AchieveProfile.objects.filter(user=user).values_list('generation', flat=True).first()
+
+
+def reminder_stream(request, last_event_id=None):
+    """Stream reminder events to a client until the maximum stream duration.
+
+    The client reconnects afterwards (resuming from the last event ID), which
+    keeps long-lived connections from piling up.
+    """
+    deadline = time.monotonic() + settings.ACHIEVE_EVENT_STREAM_DURATION
+    seq = hub.parse_id(last_event_id)
+    events = None if seq is None else hub.since(request.user.pk, seq)
+    current = generation(request.user)
+
+    yield 'retry: {0}\n\n'.format(settings.ACHIEVE_EVENT_RETRY * 1000)
+    if events is None:
+        chunk, seq = snapshot(request, current)
+        yield chunk
+    else:
+        for seq, event, data in events:
+            yield format_event(event, data, hub.event_id(seq))
+
+    while time.monotonic() < deadline:
+        timeout = min(settings.ACHIEVE_EVENT_HEARTBEAT, deadline - time.monotonic())
+        events = hub.wait(request.user.pk, seq, max(timeout, 0))
+        if events:
+            for seq, event, data in events:
+                yield format_event(event, data, hub.event_id(seq))
+            continue
+        new = generation(request.user)
+        if events is None or new != current:
+            current = new
+            chunk, seq = snapshot(request, current)
+            yield chunk
+        else:
+            yield ': heartbeat\n\n'
@@ -1,8 +1,10 @@
 """Forms for Achieve."""
 
 from django import forms
+from achieve import transfer
 from achieve.models import Task, Project, Tag
 from django.utils.html import format_html
+from django.utils.text import slugify
 
 TInput = forms.TextInput(attrs={'class': 'form-control'})
 TArea = forms.Textarea(attrs={'class': 'form-control'})
@@ -101,6 +103,11 @@ class AddEditTagForm(forms.ModelForm):
         }
 
 
+def split_tags(value):
+    """Split a comma-separated list of tags into their slugs."""
+    return sorted({slugify(tag) for tag in value.split(',') if slugify(tag)})
+
+
 class TaskFilterForm(forms.Form):
     """A form used to filter tasks."""
     prefix = "f"
@@ -118,6 +125,18 @@ class TaskFilterForm(forms.Form):
     has_reminder = forms.BooleanField(required=False)
     no_project = forms.BooleanField(required=False)
     pinned = forms.BooleanField(required=False)
+    tags = forms.CharField(
+        required=False, widget=forms.TextInput(
+            attrs={'class': 'form-control', 'placeholder': 'tag, tag…'}))
+    tag_mode = forms.ChoiceField(
+        (
+            ("all", "All tags"),
+            ("any", "Any tag"),
+        ), initial="all", required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}))
+    exclude_tags = forms.CharField(
+        required=False, widget=forms.TextInput(
+            attrs={'class': 'form-control', 'placeholder': 'tag, tag…'}))
     search = forms.CharField(
         required=False, widget=forms.TextInput(
             attrs={'class': 'form-control', 'type': 'search', 'placeholder': 'Search'}))
@@ -129,6 +148,89 @@ class TaskFilterForm(forms.Form):
             return self.fields['done'].initial
         return self.cleaned_data['done']
 
+    def clean_tags(self):
+        return split_tags(self.cleaned_data['tags'])
+
+    def clean_tag_mode(self):
+        return self.cleaned_data['tag_mode'] or self.fields['tag_mode'].initial
+
+    def clean_exclude_tags(self):
+        return split_tags(self.cleaned_data['exclude_tags'])
+
+
+class IntegerListField(forms.Field):
+    """A list of integers, from repeated values (like checkboxes with the same name)."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            return [int(v) for v in value or ()]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Enter whole numbers.")
+
+
+class BulkTaskForm(forms.Form):
+    """A form used to apply an action to many tasks at once."""
+    prefix = "b"
+    action = forms.ChoiceField(
+        (
+            ("done", "Mark as done"),
+            ("undone", "Mark as not done"),
+            ("folder", "Move to folder"),
+            ("priority", "Set priority"),
+            ("project", "Set project"),
+            ("add_tag", "Add tag"),
+            ("remove_tag", "Remove tag"),
+            ("pin", "Pin"),
+            ("unpin", "Unpin"),
+            ("trash", "Move to Trash"),
+        ), widget=forms.Select(attrs={'class': 'form-control bulk-action'}))
+    scope = forms.ChoiceField(
+        (
+            ("selected", "Selected tasks"),
+            ("all", "All matching tasks"),
+        ), initial="selected", widget=forms.Select(attrs={'class': 'form-control'}))
+    tasks = IntegerListField(required=False)
+    folder = forms.ChoiceField(
+        Task._meta.get_field('folder').choices, required=False,
+        widget=forms.Select(attrs={'class': 'form-control', 'data-bulk-action': 'folder'}))
+    priority = forms.IntegerField(
+        # The largest value of a PositiveSmallIntegerField.
+        min_value=1, max_value=32767, required=False, widget=forms.NumberInput(
+            attrs={'class': 'form-control', 'min': '1', 'data-bulk-action': 'priority'}))
+    project = forms.ModelChoiceField(
+        Project.objects.none(), required=False, empty_label="(no project)",
+        widget=forms.Select(attrs={'class': 'form-control', 'data-bulk-action': 'project'}))
+    tag = forms.ModelChoiceField(
+        Tag.objects.none(), required=False,
+        widget=forms.Select(attrs={'class': 'form-control', 'data-bulk-action': 'add_tag remove_tag'}))
+
+    # The value each action needs (the project may be empty).
+    action_values = {'folder': 'folder', 'priority': 'priority', 'add_tag': 'tag', 'remove_tag': 'tag'}
+
+    def __init__(self, user, *args, **kwargs):
+        self.user = user
+        super().__init__(*args, **kwargs)
+        self.fields['project'].queryset = Project.objects.filter(user=self.user).order_by('title')
+        self.fields['tag'].queryset = Tag.objects.filter(user=self.user).order_by('title')
+
+    def clean(self):
+        """Check that the action has a value and tasks to apply to."""
+        cleaned_data = super().clean()
+        field = self.action_values.get(cleaned_data.get('action'))
+        if field and field not in self.errors and cleaned_data.get(field) in (None, ''):
+            self.add_error(field, "This action needs a {0}.".format(field))
+        if cleaned_data.get('scope') == 'selected' and not cleaned_data.get('tasks'):
+            raise forms.ValidationError("No tasks selected.")
+        return cleaned_data
+
+    def value(self):
+        """Get the value for the chosen action."""
+        action = self.cleaned_data['action']
+        if action == 'project':
+            return self.cleaned_data['project']
+        return self.cleaned_data.get(self.action_values.get(action))
+
 
 class ProjectFilterForm(forms.Form):
     """A form used to filter projects."""
@@ -178,3 +280,17 @@ class AchieveProfileForm(forms.Form):
         widget=forms.TextInput(attrs={'class': 'form-control'}))
     email = forms.CharField(required=True, widget=forms.TextInput(
         attrs={'class': 'form-control', 'type': 'email'}))
+
+
+class ImportForm(forms.Form):
+    """A form used to upload data to import."""
+    file = forms.FileField(help_text="JSON Lines (.jsonl) or CSV (.csv), as exported, optionally gzip compressed (.gz).")
+
+    def clean_file(self):
+        """Check that the format of the file is known."""
+        f = self.cleaned_data['file']
+        try:
+            self.cleaned_data['format'], self.cleaned_data['compressed'] = transfer.import_format(f.name)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return f
@@ -0,0 +1,236 @@
+"""Full-text search for tasks, projects and tags.
+
+SQLite uses FTS5 tables kept in sync by triggers, PostgreSQL uses tsvector
+columns with GIN indexes, also kept in sync by triggers.  Other databases
+(and SQLite builds without FTS5) fall back to substring search.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, connections, OperationalError
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from achieve.models import Task, Project, Tag
+
+SEARCH_MODELS = (Task, Project, Tag)
+POSTGRESQL_CONFIG = 'english'
+# Weights for the search fields of a model, in order (title first).
+SQLITE_WEIGHTS = ('10.0', '5.0', '1.0')
+POSTGRESQL_WEIGHTS = ('A', 'B', 'C')
+
+_backend = None
+
+
+def tokenize(terms):
+    """Split search terms into words."""
+    return re.findall(r'\w+', terms)
+
+
+def fts_table(model):
+    """Return the name of the FTS5 table for a model."""
+    return model._meta.db_table + '_fts'
+
+
+def sqlite_triggers(model):
+    """Return statements that create FTS5 triggers for a model."""
+    table = model._meta.db_table
+    fts = fts_table(model)
+    fields = ', '.join(model.search_fields)
+    new = ', '.join('new.' + f for f in model.search_fields)
+    old = ', '.join('old.' + f for f in model.search_fields)
+    insert = "INSERT INTO {fts}(rowid, {fields}) VALUES (new.id, {new});"
+    delete = "INSERT INTO {fts}({fts}, rowid, {fields}) VALUES ('delete', old.id, {old});"
+    return [s.format(table=table, fts=fts, fields=fields, new=new, old=old) for s in (
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN " + insert + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN " + delete + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {fields} ON {table} BEGIN " + delete + " " + insert + " END",
+    )]
+
+
+def sqlite_install(model):
+    """Return statements that create the FTS5 table and triggers for a model."""
+    fts = fts_table(model)
+    return [
+        "CREATE VIRTUAL TABLE {fts} USING fts5({fields}, content='{table}', content_rowid='id')".format(
+            fts=fts, fields=', '.join(model.search_fields), table=model._meta.db_table),
+    ] + sqlite_triggers(model) + [
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=fts),
+    ]
+
+
+def sqlite_uninstall(model):
+    """Return statements that drop the FTS5 table and triggers for a model."""
+    fts = fts_table(model)
+    return ["DROP TRIGGER IF EXISTS {0}_{1}".format(fts, t) for t in ('ai', 'ad', 'au')] + [
+        "DROP TABLE IF EXISTS {0}".format(fts)]
+
+
+def postgresql_vector(model, record):
+    """Return an SQL expression that builds the search vector of a record."""
+    return ' || '.join(
+        "setweight(to_tsvector('pg_catalog.{config}', coalesce({record}.{field}, '')), '{weight}')".format(
+            config=POSTGRESQL_CONFIG, record=record, field=field, weight=weight)
+        for field, weight in zip(model.search_fields, POSTGRESQL_WEIGHTS))
+
+
+def postgresql_install(model):
+    """Return statements that create the search vector column, index and trigger for a model."""
+    table = model._meta.db_table
+    return [
+        "ALTER TABLE {table} ADD COLUMN search_vector tsvector".format(table=table),
+        "UPDATE {table} SET search_vector = {vector}".format(table=table, vector=postgresql_vector(model, table)),
+        "CREATE INDEX {table}_search_vector ON {table} USING gin(search_vector)".format(table=table),
+        """CREATE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {vector};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""".format(table=table, vector=postgresql_vector(model, 'NEW')),
+        "CREATE TRIGGER {table}_search_vector_trigger BEFORE INSERT OR UPDATE OF {fields} ON {table} "
+        "FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update()".format(
+            table=table, fields=', '.join(model.search_fields)),
+    ]
+
+
+def postgresql_uninstall(model):
+    """Return statements that drop the search vector column and trigger for a model."""
+    table = model._meta.db_table
+    return [
+        "DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}".format(table=table),
+        "DROP FUNCTION IF EXISTS {table}_search_vector_update()".format(table=table),
+        "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector".format(table=table),
+    ]
+
+
+def ensure_sqlite_triggers(using='default', **kwargs):
+    """Recreate FTS5 triggers that were lost when SQLite migrations rebuilt a table."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {name for type, name in cursor.fetchall()}
+        for model in SEARCH_MODELS:
+            fts = fts_table(model)
+            triggers = {'{0}_{1}'.format(fts, t) for t in ('ai', 'ad', 'au')}
+            if fts not in existing or triggers <= existing:
+                continue
+            for statement in sqlite_triggers(model):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=fts))
+
+
+class SearchBackend(object):
+    """Substring search, for databases without full-text search support."""
+
+    def filter(self, queryset, terms):
+        """Filter a queryset to items matching the search terms."""
+        words = tokenize(terms) or [terms.strip()]
+        for word in words:
+            q = Q()
+            for field in queryset.model.search_fields:
+                q |= Q(**{field + '__icontains': word})
+            queryset = queryset.filter(q)
+        return queryset
+
+    def ranked_ids(self, queryset, terms, limit):
+        """Return the primary keys of the best matching items, best first."""
+        return list(self.filter(queryset, terms).order_by('title').values_list('pk', flat=True)[:limit])
+
+    def search(self, queryset, terms, limit, load=None):
+        """Return the best matching items, best first.
+
+        The items are loaded from the `load` queryset (default: `queryset`),
+        which may contain annotations.
+        """
+        ids = self.ranked_ids(queryset, terms, limit)
+        items = (queryset if load is None else load).in_bulk(ids)
+        return [items[pk] for pk in ids if pk in items]
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Full-text search with SQLite FTS5."""
+
+    def match(self, terms):
+        """Build an FTS5 query, matching all words as prefixes."""
+        return ' '.join('"{0}"*'.format(word) for word in tokenize(terms))
+
+    def filter(self, queryset, terms):
+        """Filter a queryset to items matching the search terms."""
+        match = self.match(terms)
+        if not match:
+            return super().filter(queryset, terms)
+        where = '"{table}"."id" IN (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s)'.format(
+            table=queryset.model._meta.db_table, fts=fts_table(queryset.model))
+        return queryset.extra(where=[where], params=[match])
+
+    def ranked_ids(self, queryset, terms, limit):
+        """Return the primary keys of the best matching items, best first."""
+        match = self.match(terms)
+        if not match:
+            return super().ranked_ids(queryset, terms, limit)
+        model = queryset.model
+        fts = fts_table(model)
+        queryset = queryset.extra(
+            tables=[fts],
+            where=['"{fts}".rowid = "{table}"."id"'.format(fts=fts, table=model._meta.db_table),
+                   '"{fts}" MATCH %s'.format(fts=fts)],
+            params=[match],
+            select={'search_rank': 'bm25("{fts}", {weights})'.format(
+                fts=fts, weights=', '.join(SQLITE_WEIGHTS[:len(model.search_fields)]))},
+            order_by=['search_rank'])
+        return [pk for pk, rank in queryset.values_list('pk', 'search_rank')[:limit]]
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """Full-text search with PostgreSQL tsvector columns."""
+
+    def tsquery(self, terms):
+        """Build a tsquery, matching all words as prefixes."""
+        return ' & '.join(word + ':*' for word in tokenize(terms))
+
+    def filter(self, queryset, terms):
+        """Filter a queryset to items matching the search terms."""
+        tsquery = self.tsquery(terms)
+        if not tsquery:
+            return super().filter(queryset, terms)
+        where = '"{table}"."search_vector" @@ to_tsquery(%s, %s)'.format(table=queryset.model._meta.db_table)
+        return queryset.extra(where=[where], params=[POSTGRESQL_CONFIG, tsquery])
+
+    def ranked_ids(self, queryset, terms, limit):
+        """Return the primary keys of the best matching items, best first."""
+        tsquery = self.tsquery(terms)
+        if not tsquery:
+            return super().ranked_ids(queryset, terms, limit)
+        rank = 'ts_rank("{table}"."search_vector", to_tsquery(%s, %s))'.format(table=queryset.model._meta.db_table)
+        queryset = self.filter(queryset, terms).extra(
+            select={'search_rank': rank}, select_params=[POSTGRESQL_CONFIG, tsquery], order_by=['-search_rank'])
+        return [pk for pk, rank in queryset.values_list('pk', 'search_rank')[:limit]]
+
+
+def detect_backend():
+    """Pick the best search backend for the database."""
+    if connection.vendor == 'postgresql':
+        return PostgreSQLSearchBackend()
+    elif connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts_table(Task)])
+                if cursor.fetchone():
+                    return SQLiteSearchBackend()
+        except OperationalError:
+            pass
+    return SearchBackend()
+
+
+def get_backend():
+    """Return the configured search backend (ACHIEVE_SEARCH_BACKEND), or detect one."""
+    global _backend
+    if _backend is None:
+        if settings.ACHIEVE_SEARCH_BACKEND:
+            _backend = import_string(settings.ACHIEVE_SEARCH_BACKEND)()
+        else:
+            _backend = detect_backend()
+    return _backend
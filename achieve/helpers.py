@@ -1,14 +1,24 @@
 """Achieve helpers."""
 
+import base64
+import binascii
+import collections.abc
+import json
+import time
+
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
+from django.db import transaction, IntegrityError
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
 from django.http import HttpResponseRedirect
 from django.middleware import csrf
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.text import slugify
-from achieve.models import Task
-from achieve import queries
+from achieve.models import Task, MD_VERSION, SLUG_ATTEMPTS, render_markdown
+from achieve import counters, queries
 
 
 def get_next(request, best_guess=None):
@@ -44,7 +54,151 @@ def add_to_inbox(request, title, save=True):
     return t
 
 
-def update_slug(obj, force=False, save=True):
+def add_to_inbox_bulk(request, titles):
+    """Add many tasks to Inbox at once and return them."""
+    tasks = [add_to_inbox(request, title, save=False) for title in titles]
+    with counters.deferred():
+        bulk_create_slugged(Task, request.user.pk, tasks)
+        deltas = collections.Counter()
+        for t in tasks:
+            deltas.update(counters.badges_for(t))
+        counters.apply_deltas(request.user.pk, deltas)
+    return tasks
+
+
+def bulk_create_slugged(model, user_id, objs, markdown=True):
+    """Create many items of a user with bulk_create, allocating slugs in batch.
+
+    Signals are not sent, the caller is responsible for updating badges.  If
+    `markdown` is false, Markdown fields are not rendered (they are rendered
+    when displayed, or by the render_markdown command).
+    """
+    for obj in objs:
+        if markdown and hasattr(obj, 'markdown_fields'):
+            update_markdown(obj)
+    for attempt in range(SLUG_ATTEMPTS):
+        allocate_slugs(model, user_id, objs)
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objs, batch_size=settings.ACHIEVE_BULK_BATCH_SIZE)
+            return
+        except IntegrityError:
+            # Someone else took one of our slugs, try again with fresh data.
+            pass
+    # Give up on batches and insert the items one by one.
+    for obj in objs:
+        for attempt in range(SLUG_ATTEMPTS):
+            update_slug(obj, force=True, save=False, min_suffix=obj.slug_suffix + 1 if attempt else 0)
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create([obj])
+                break
+            except IntegrityError:
+                if attempt + 1 == SLUG_ATTEMPTS:
+                    raise
+
+
+def purge_tasks(tasks, batch_size=None, pause=0):
+    """Delete tasks in batches of primary keys and return the number of deleted tasks.
+
+    Unlike QuerySet.delete(), this does not load the tasks and deletes them
+    (and their links to tags) in a short transaction per batch.  Signals are
+    not sent; the badges of the affected users are recounted once at the end.
+    `pause` is the time to sleep between batches, in seconds.
+    """
+    batch_size = batch_size or settings.ACHIEVE_BULK_BATCH_SIZE
+    tasks = tasks.order_by('pk').values_list('pk', 'user_id')
+    deleted = 0
+    users = set()
+    last = 0
+    try:
+        while True:
+            with transaction.atomic():
+                # Lock the batch, so that no task can leave the Trash before it is deleted.
+                rows = list(tasks.select_for_update().filter(pk__gt=last)[:batch_size])
+                if not rows:
+                    break
+                pks = [pk for pk, user_id in rows]
+                queries.task_tags(pks).delete()
+                Task.objects.filter(pk__in=pks)._raw_delete(Task.objects.db)
+            last = pks[-1]
+            deleted += len(pks)
+            users.update(user_id for pk, user_id in rows)
+            if pause and len(rows) == batch_size:
+                time.sleep(pause)
+    finally:
+        for user_id in users:
+            counters.recount_badges(user_id)
+    return deleted
+
+
+# Bulk task actions that change the badges (folder or done).
+BULK_RECOUNT_ACTIONS = {'done', 'undone', 'folder', 'trash'}
+
+
+def bulk_task_values(action, value=None):
+    """Get the field values set by a bulk action on tasks."""
+    if action == 'done':
+        # Like marking a single task as done, which moves it out of the Inbox.
+        return {'done': True, 'folder': Case(When(folder='inbox', then=Value('tasks')), default=F('folder'))}
+    elif action == 'undone':
+        return {'done': False}
+    elif action == 'folder':
+        return {'folder': value}
+    elif action == 'trash':
+        return {'folder': 'trash'}
+    elif action == 'priority':
+        return {'priority': value}
+    elif action == 'project':
+        return {'project': value}
+    elif action in ('pin', 'unpin'):
+        return {'pinned': action == 'pin'}
+    raise ValueError("Unknown bulk action: {0}".format(action))
+
+
+def bulk_update_tasks(user_id, tasks, action, value=None):
+    """Apply a bulk action to tasks of a user and return the number of changed tasks.
+
+    Every action is a single UPDATE, or a single insert into (or delete from)
+    the links between tasks and tags.  Signals are not sent; the badges are
+    refreshed once instead, which also bumps the data generation (so tables
+    and reminders are reloaded), and the pinned items are invalidated if the
+    action can change them.
+    """
+    with counters.deferred():
+        if action == 'add_tag':
+            pks = tasks.exclude(pk__in=queries.tagged_tasks([value.pk])).values_list('pk', flat=True)
+            links = [Task.tags.through(task_id=pk, tag_id=value.pk) for pk in pks]
+            Task.tags.through.objects.bulk_create(links)
+            changed = len(links)
+        elif action == 'remove_tag':
+            changed = queries.task_tags(tasks.values('pk')).filter(tag_id=value.pk).delete()[0]
+        else:
+            # Row fragments are cached by modification time, so set it like save() does.
+            changed = tasks.update(modified=timezone.now(), **bulk_task_values(action, value))
+        if action in BULK_RECOUNT_ACTIONS:
+            counters.recount_badges(user_id)
+        else:
+            counters.touch(user_id)
+    return changed
+
+
+def allocate_slugs(model, user_id, objs):
+    """Allocate slugs for many new items of a user."""
+    next_suffix = {}
+    bases = list({slugify(obj.title) for obj in objs})
+    samebase = model.objects.filter(user_id=user_id).values_list('slugbase').annotate(m=Max('slug_suffix'))
+    # Chunk the bases to stay within the SQL variable limits.
+    for i in range(0, len(bases), settings.ACHIEVE_BULK_BATCH_SIZE):
+        next_suffix.update((base, m + 1) for base, m in samebase.filter(slugbase__in=bases[i:i + settings.ACHIEVE_BULK_BATCH_SIZE]))
+    for obj in objs:
+        obj.slugbase = slugify(obj.title)
+        obj.slug_suffix = next_suffix.get(obj.slugbase, 0)
+        obj.slug = make_slug(obj.slugbase, obj.slug_suffix)
+        next_suffix[obj.slugbase] = obj.slug_suffix + 1
+
+
+def update_slug(obj, force=False, save=True, min_suffix=0):
     """Update the slug for an item."""
     # The slugbase is used to identify things with the same slug base.
     slugbase = slugify(obj.title)
@@ -52,37 +206,50 @@ def update_slug(obj, force=False, save=True):
         # Assuming DB consistency, the slug is fine
         return
 
-    samebase = obj.__class__.objects.filter(user=obj.user, slugbase=slugbase)
-    if not samebase:
-        # New slug base.
-        final_slug = slugbase
-    elif len(samebase) == 1 and samebase[0] == obj:
-        # (If forced) only slug like this.
-        final_slug = slugbase
-    else:
-        # We need to find a new slug for ourselves.
-        others = samebase.exclude(slug=slugbase)
-        if others:
-            nums = [int(i.slug.split('-')[-1]) for i in others.all()]
-            final_num = max(nums) + 1
-        else:
-            final_num = 1
-        final_slug = "{0}-{1}".format(slugbase, final_num)
+    # Find the highest suffix used by other items with this base (NULL if there are none).
+    samebase = obj.__class__.objects.filter(user_id=obj.user_id, slugbase=slugbase)
+    if obj.pk is not None:
+        samebase = samebase.exclude(pk=obj.pk)
+    max_suffix = samebase.aggregate(m=Max('slug_suffix'))['m']
+    suffix = 0 if max_suffix is None else max_suffix + 1
+    suffix = max(suffix, min_suffix)
 
     obj.slugbase = slugbase
-    obj.slug = final_slug
+    obj.slug_suffix = suffix
+    obj.slug = make_slug(slugbase, suffix)
     if save:
         obj.save()
 
 
+def make_slug(slugbase, suffix):
+    """Make a slug out of a base and a numeric suffix."""
+    if suffix:
+        return "{0}-{1}".format(slugbase, suffix)
+    else:
+        return slugbase
+
+
+def update_markdown(obj, force=False):
+    """Render the Markdown fields of an item and store the HTML."""
+    stale = force or obj.md_version != MD_VERSION
+    for source, dest in obj.markdown_fields:
+        if stale or obj.has_changed(source):
+            setattr(obj, dest, render_markdown(getattr(obj, source)))
+    obj.md_version = MD_VERSION
+
+
 def update_badges(user):
-    """Update all badges for a user/AchieveProfile."""
+    """Recount all badges for a user/AchieveProfile.
+
+    Badges are normally kept up to date incrementally (see achieve.counters),
+    this is used to reconcile them.
+    """
     p = user.achieveprofile
-    p.badge_inbox = queries.inbox_user_notdone(user).count()
-    p.badge_all_tasks = queries.incomplete_tasks_user(user).count()
-    p.badge_trash = queries.trash_user(user).count()
-    p.badge_projects = queries.open_projects_user(user).count()
-    p.save()
+    for name, value in counters.count_badges(user).items():
+        setattr(p, name, value)
+    p.badge_due_soon_expires = timezone.now()
+    p.save(update_fields=counters.BADGE_FIELDS + ('badge_due_soon_expires',))
+    counters.touch(user.pk)
 
 
 def process_sorting(request, table, sortable, default_sort):
@@ -116,3 +283,160 @@ def process_pagination(request, table, identifier=''):
         table = paginator.page(paginator.num_pages)
 
     return table
+
+
+class KeysetPage(collections.abc.Sequence):
+    """A page of results, paginated with cursors instead of page numbers."""
+
+    # For the filter forms, which keep the current page number.
+    number = ''
+
+    def __init__(self, object_list, next_cursor, previous_cursor, identifier=''):
+        """Create a page."""
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.identifier = identifier
+
+    def __len__(self):
+        """Return the number of items on the page."""
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        """Return an item on the page."""
+        return self.object_list[index]
+
+    def has_next(self):
+        """Check if there is a next page."""
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Check if there is a previous page."""
+        return self.previous_cursor is not None
+
+
+def keyset_keys(table):
+    """Get the sort keys of a queryset as (field, descending) pairs, or None if they are not supported."""
+    opts = table.model._meta
+    keys = []
+    for name in table.query.order_by or opts.ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        keys.append((field, descending))
+        if field.primary_key:
+            return keys
+    # The primary key breaks ties.
+    keys.append((opts.pk, False))
+    return keys
+
+
+def keyset_names(keys):
+    """Get the names of sort keys, as used in order_by."""
+    return [('-' if descending else '') + field.attname for field, descending in keys]
+
+
+def encode_cursor(keys, obj):
+    """Encode the sort keys of an object as a cursor."""
+    data = {
+        'o': keyset_names(keys),
+        'v': [getattr(obj, field.attname) for field, descending in keys],
+    }
+    # isoformat() keeps microseconds, which DjangoJSONEncoder would truncate.
+    data = json.dumps(data, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(keys, cursor):
+    """Decode a cursor, return None if it is invalid or does not match the sort keys."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if data['o'] != keyset_names(keys) or len(data['v']) != len(keys):
+            return None
+        return [None if value is None else field.to_python(value) for (field, descending), value in zip(keys, data['v'])]
+    except (ValueError, TypeError, KeyError, binascii.Error, ValidationError):
+        return None
+
+
+def keyset_filter(keys, values, after):
+    """Build a filter for items after (or before) the given sort key values.
+
+    NULLs are sorted after all other values.
+    """
+    condition = Q()
+    equal = Q()
+    for (field, descending), value in zip(keys, values):
+        name = field.attname
+        if value is None:
+            # Nothing sorts after NULL, everything else sorts before it.
+            if not after:
+                condition |= equal & Q(**{name + '__isnull': False})
+            equal &= Q(**{name + '__isnull': True})
+            continue
+        step = Q(**{name + ('__lt' if descending == after else '__gt'): value})
+        if after and field.null:
+            step |= Q(**{name + '__isnull': True})
+        condition |= equal & step
+        equal &= Q(**{name: value})
+    return condition
+
+
+def keyset_order(table, keys, reverse):
+    """Order a queryset by sort keys, with NULLs last (first if reversed)."""
+    order = []
+    for field, descending in keys:
+        if field.null:
+            nullkey = 'keyset_null_' + field.attname
+            isnull = When(**{field.attname + '__isnull': True, 'then': Value(1)})
+            table = table.annotate(**{nullkey: Case(isnull, default=Value(0), output_field=IntegerField())})
+            order.append('-' + nullkey if reverse else nullkey)
+        order.append(field.attname if descending == reverse else '-' + field.attname)
+    return table.order_by(*order)
+
+
+def process_keyset_pagination(request, table, identifier=''):
+    """Process pagination with cursors, falling back to page numbers for unsupported sort keys.
+
+    Pages are selected with the `after` and `before` parameters, which take
+    cursors built from the sort keys of the last/first item shown.
+    """
+    keys = keyset_keys(table)
+    if keys is None:
+        return process_pagination(request, table, identifier)
+    per_page = settings.ACHIEVE_ITEMS_PER_PAGE
+
+    before = request.GET.get('before' + identifier)
+    after = request.GET.get('after' + identifier)
+    values = None
+    backwards = False
+    if before:
+        values = decode_cursor(keys, before)
+        backwards = values is not None
+    if values is None and after:
+        values = decode_cursor(keys, after)
+
+    table = keyset_order(table, keys, backwards)
+    if values is not None:
+        table = table.filter(keyset_filter(keys, values, not backwards))
+    items = list(table[:per_page + 1])
+    more = len(items) > per_page
+    items = items[:per_page]
+
+    if backwards:
+        items.reverse()
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, values is not None
+    if not items:
+        return KeysetPage(items, None, None, identifier)
+    return KeysetPage(items,
+                      encode_cursor(keys, items[-1]) if has_next else None,
+                      encode_cursor(keys, items[0]) if has_previous else None,
+                      identifier)
@@ -0,0 +1,123 @@
+"""Jinja2 template backend for the Achieve templates.
+
+The Jinja2 versions of the templates live in the ``jinja2`` directory and
+use the helpers from achieve.templatetags.achieve_extras as global
+functions.  Select the engine with ACHIEVE_TEMPLATE_ENGINE.
+"""
+
+import functools
+
+import jinja2
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.urlresolvers import reverse
+from django.template import defaultfilters
+from django.template.backends import jinja2 as jinja2_backend
+from django.template.loader import render_to_string
+from django.utils.functional import cached_property
+from django.utils.html import mark_safe
+from django.utils.module_loading import import_string
+from django.utils.timezone import template_localtime
+
+from achieve.templatetags import achieve_extras
+
+# The name of the engine (NAME in the TEMPLATES setting).
+JINJA2_ENGINE = 'jinja2'
+
+
+class Jinja2(jinja2_backend.Jinja2):
+    """A Jinja2 backend that runs context processors, like the Django backend does."""
+
+    def __init__(self, params):
+        """Create the backend."""
+        params = params.copy()
+        options = params.pop('OPTIONS', {}).copy()
+        self.context_processors = options.pop('context_processors', [])
+        params['OPTIONS'] = options
+        super().__init__(params)
+
+    @cached_property
+    def template_context_processors(self):
+        """Get the context processor functions."""
+        return [import_string(path) for path in self.context_processors]
+
+    def from_string(self, template_code):
+        """Create a template from a string."""
+        return Template(super().from_string(template_code), self)
+
+    def get_template(self, template_name):
+        """Load a template."""
+        return Template(super().get_template(template_name), self)
+
+
+class Template(object):
+    """A Jinja2 template that runs context processors when rendered with a request."""
+
+    def __init__(self, template, backend):
+        """Wrap a template of the backend."""
+        self.template = template
+        self.backend = backend
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        """Render the template, with the context taking precedence over context processors."""
+        data = {}
+        if request is not None:
+            for processor in self.backend.template_context_processors:
+                data.update(processor(request))
+        data.update(context or {})
+        return self.template.render(data, request)
+
+
+def url(viewname, *args):
+    """Reverse a URL, like the {% url %} tag."""
+    return reverse(viewname, args=args)
+
+
+def date(value, arg=None):
+    """Format a date in the current time zone, like the date filter."""
+    return defaultfilters.date(template_localtime(value), arg)
+
+
+def context_tag(func, **kwargs):
+    """Make a template tag that takes the context into a Jinja2 global."""
+    # Jinja2 only passes the context to plain functions, not to partials.
+    @jinja2.contextfunction
+    @functools.wraps(func)
+    def tag(context, *args):
+        return func(context, *args, **kwargs)
+    return tag
+
+
+def inclusion_tag(func, template_name):
+    """Make an inclusion tag into a Jinja2 global."""
+    @jinja2.contextfunction
+    def render(context, *args, **kwargs):
+        return mark_safe(render_to_string(template_name, func(context, *args, **kwargs), using=JINJA2_ENGINE))
+    return render
+
+
+def environment(**options):
+    """Create the Jinja2 environment."""
+    # Missing variables render as empty strings, as in Django templates.
+    options['undefined'] = jinja2.Undefined
+    env = jinja2.Environment(**options)
+    env.globals.update({
+        'static': static,
+        'url': url,
+        'badge': context_tag(achieve_extras.badge),
+        'badge_count': achieve_extras.badge_count,
+        'navbar_entry': context_tag(achieve_extras.navbar_entry),
+        'navbar_user_entry': context_tag(achieve_extras.navbar_user_entry),
+        'navbar_pin': context_tag(achieve_extras.navbar_pin),
+        'navbar_badge': context_tag(achieve_extras.navbar_badge),
+        'folder_link': achieve_extras.folder_link,
+        'task_table': context_tag(achieve_extras.task_table, using=JINJA2_ENGINE),
+        'project_table': context_tag(achieve_extras.project_table, using=JINJA2_ENGINE),
+        'task_bulk': context_tag(achieve_extras.task_bulk, using=JINJA2_ENGINE),
+        'task_filters': inclusion_tag(achieve_extras.task_filters, 'achieve/inc_task_filters.html'),
+        'project_filters': inclusion_tag(achieve_extras.project_filters, 'achieve/inc_project_filters.html'),
+        'pagination': context_tag(achieve_extras.pagination),
+        'sortable_head': context_tag(achieve_extras.sortable_head),
+    })
+    env.filters['date'] = date
+    return env
@@ -0,0 +1,74 @@
+"""Compare how fast the template engines render task tables."""
+
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template import engines
+from django.test import RequestFactory
+
+from achieve.models import Task, Project
+from achieve.templatetags.achieve_extras import render_rows, render_table_fragment
+
+
+# Template engine names (NAME in the TEMPLATES setting).
+DJANGO_ENGINE = 'django'
+JINJA2_ENGINE = 'jinja2'
+
+
+class Rollback(Exception):
+    """Raised to roll back the seeded data."""
+
+
+def seed(rows):
+    """Create a user with `rows` tasks, and return the tasks."""
+    user = User.objects.create(username='benchmark-templates')
+    projects = [Project.objects.create(user=user, title='Project {0}'.format(i)) for i in range(5)]
+    Task.objects.bulk_create([
+        Task(user=user, title='Task {0}'.format(i), slug='task-{0}'.format(i), slugbase='task-{0}'.format(i),
+             project=projects[i % 6] if i % 6 < 5 else None, priority=i % 5, done=i % 3 == 0)
+        for i in range(rows)])
+    return user, list(Task.objects.select_related('project').filter(user=user).order_by('pk'))
+
+
+def render_table(engine, tasks, request):
+    """Render a task table, without the fragment cache."""
+    rows = render_rows('task', tasks, using=engine)
+    return render_table_fragment('task', rows, '', True, request, using=engine)
+
+
+class Command(BaseCommand):
+    help = ("Render task tables with the Django and Jinja2 template engines (on data that is rolled back "
+            "afterwards) and report the fastest time of each.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[15, 500],
+                            help="Table sizes to render (default: 15 500).")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of renders to take the best of (default: 5).")
+
+    def handle(self, *args, **options):
+        if JINJA2_ENGINE not in engines.templates:
+            raise CommandError("The Jinja2 template engine is not configured (is Jinja2 installed?).")
+
+        results = []
+        try:
+            with transaction.atomic():
+                user, tasks = seed(max(options['rows']))
+                request = RequestFactory().get('/tasks/')
+                request.user = user
+                for rows in options['rows']:
+                    times = {}
+                    for engine in (DJANGO_ENGINE, JINJA2_ENGINE):
+                        render_table(engine, tasks[:rows], request)  # load and compile the templates
+                        times[engine] = min(timeit.repeat(lambda: render_table(engine, tasks[:rows], request),
+                                                          number=1, repeat=options['repeat']))
+                    results.append((rows, times[DJANGO_ENGINE], times[JINJA2_ENGINE]))
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write("{0:>6} {1:>12} {2:>12} {3:>8}".format("Rows", "Django (ms)", "Jinja2 (ms)", "Speedup"))
+        for rows, django_time, jinja2_time in results:
+            self.stdout.write("{0:>6} {1:>12.2f} {2:>12.2f} {3:>7.1f}x".format(
+                rows, django_time * 1000, jinja2_time * 1000, django_time / jinja2_time))
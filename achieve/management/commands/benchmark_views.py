@@ -0,0 +1,68 @@
+"""Time every view at several data sizes."""
+
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from achieve import benchmark
+
+# The benchmark clears the cache, so it uses its own.
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'achieve-benchmark',
+    },
+}
+
+
+class Rollback(Exception):
+    """Raised to roll back the generated data."""
+
+
+class Command(BaseCommand):
+    help = ("Time a GET of every view in achieve.urls for users with different numbers of tasks (on data that is "
+            "rolled back afterwards), and report the queries without cached data against the query budgets.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                            help="Numbers of tasks to measure with (default: 100 1000).")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of requests with cached data to take the best of (default: 5).")
+        parser.add_argument('--view', dest='views', action='append',
+                            help="Only measure the view with this URL name (can be repeated).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['views'] or ()) - set(benchmark.QUERY_BUDGETS)
+        if unknown:
+            raise CommandError("Unknown views: {0}".format(', '.join(sorted(unknown))))
+
+        results = []
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES), transaction.atomic():
+                rng = random.Random(options['seed'])
+                for size in options['sizes']:
+                    projects, tags = benchmark.dataset_sizes(size)
+                    user = benchmark.generate_user('benchmark-views-{0}'.format(size), size, projects, tags, rng)
+                    client = benchmark.login(user)
+                    for name, url in benchmark.view_urls(user):
+                        if options['views'] and name not in options['views']:
+                            continue
+                        status, queries, cold, warm = benchmark.measure(client, url, options['repeat'])
+                        budget = benchmark.query_budget(name, size, projects, tags)
+                        results.append((size, name, status, len(queries), budget, cold, warm))
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write("{0:>6} {1:<18} {2:>6} {3:>7} {4:>6} {5:>9} {6:>9}".format(
+            "Tasks", "View", "Status", "Queries", "Budget", "Cold (ms)", "Warm (ms)"))
+        over = 0
+        for size, name, status, queries, budget, cold, warm in results:
+            over += queries > budget
+            self.stdout.write("{0:>6} {1:<18} {2:>6} {3:>7} {4:>6} {5:>9.1f} {6:>9.1f}{7}".format(
+                size, name, status, queries, budget, cold * 1000, warm * 1000, "  over budget" if queries > budget else ""))
+        if over:
+            self.stdout.write("{0} measurement(s) over the query budget.".format(over))
@@ -0,0 +1,34 @@
+"""Delete old tasks from the Trash of all users."""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from achieve import queries
+from achieve.helpers import purge_tasks
+
+
+class Command(BaseCommand):
+    help = ("Delete tasks that have been in the Trash (unmodified) for longer than the given number of days, "
+            "for all users, in small batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ACHIEVE_TRASH_EXPIRY_DAYS,
+                            help="Age of tasks to delete (default: ACHIEVE_TRASH_EXPIRY_DAYS, {0}).".format(
+                                settings.ACHIEVE_TRASH_EXPIRY_DAYS))
+        parser.add_argument('--batch-size', type=int, default=settings.ACHIEVE_BULK_BATCH_SIZE,
+                            help="Number of tasks to delete per transaction (default: {0}).".format(
+                                settings.ACHIEVE_BULK_BATCH_SIZE))
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help="Seconds to sleep between batches, to let other writers in (default: 0.1).")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        # Found from the tasks, not the Trash badges, which could be out of date.
+        users = list(queries.expired_trash_users(before))
+        deleted = 0
+        for user_id in users:
+            deleted += purge_tasks(queries.expired_trash_user(user_id, before), options['batch_size'], options['sleep'])
+        self.stdout.write("Deleted {0} task(s) older than {1} day(s) from the Trash.".format(deleted, options['days']))
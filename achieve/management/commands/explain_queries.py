@@ -0,0 +1,164 @@
+"""Check that the queries in achieve.queries can use indexes."""
+
+import inspect
+import random
+import re
+import types
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from achieve import queries
+from achieve.models import Task, Project, Tag
+
+# Each check gets a fake request, its user, and a tag and project of that user.
+CHECKS = [
+    ('inbox', lambda r, u, tag, project: queries.inbox(r)),
+    ('inbox_user_notdone', lambda r, u, tag, project: queries.inbox_user_notdone(u)),
+    ('all_tasks', lambda r, u, tag, project: queries.all_tasks(r)),
+    ('incomplete_tasks_user', lambda r, u, tag, project: queries.incomplete_tasks_user(u)),
+    ('projects_with_tag', lambda r, u, tag, project: queries.projects_with_tag(r, tag)),
+    ('tasks_with_tag', lambda r, u, tag, project: queries.tasks_with_tag(r, tag)),
+    ('tags_by_slug', lambda r, u, tag, project: queries.tags_by_slug(r, [tag.slug])),
+    ('tagged_tasks', lambda r, u, tag, project: queries.tagged_tasks([tag.pk])),
+    ('with_any_tags', lambda r, u, tag, project: queries.with_any_tags(queries.all_tasks(r), [tag.pk])),
+    ('with_all_tags', lambda r, u, tag, project: queries.with_all_tags(
+        queries.all_tasks(r), Tag.objects.filter(user=u).values_list('pk', flat=True)[:3])),
+    ('without_tags', lambda r, u, tag, project: queries.without_tags(queries.all_tasks(r), [tag.pk])),
+    ('tasks_in_project', lambda r, u, tag, project: queries.tasks_in_project(r, project)),
+    ('trash', lambda r, u, tag, project: queries.trash(r)),
+    ('trash_user', lambda r, u, tag, project: queries.trash_user(u)),
+    ('expired_trash_user', lambda r, u, tag, project: queries.expired_trash_user(u, timezone.now())),
+    ('expired_trash_users', lambda r, u, tag, project: queries.expired_trash_users(timezone.now())),
+    ('tags', lambda r, u, tag, project: queries.tags(r)),
+    ('open_projects', lambda r, u, tag, project: queries.open_projects(r)),
+    ('open_projects_user', lambda r, u, tag, project: queries.open_projects_user(u)),
+    ('projects', lambda r, u, tag, project: queries.projects(r)),
+    ('due_soon', lambda r, u, tag, project: queries.due_soon(r)),
+    ('due_soon_user', lambda r, u, tag, project: queries.due_soon_user(u, timezone.now())),
+    ('due_later_user', lambda r, u, tag, project: queries.due_later_user(u, timezone.now())),
+    ('reminders_soon', lambda r, u, tag, project: queries.reminders_soon(r)),
+    ('pending_reminders', lambda r, u, tag, project: queries.pending_reminders()),
+    ('pending_reminders_user', lambda r, u, tag, project: queries.pending_reminders_user(u)),
+    ('pinned_tasks', lambda r, u, tag, project: queries.pinned_tasks(r)),
+    ('pinned_tasks_srp', lambda r, u, tag, project: queries.pinned_tasks_srp(r)),
+    ('pinned_tasks_user', lambda r, u, tag, project: queries.pinned_tasks_user(u)),
+    ('pinned_open_projects_user', lambda r, u, tag, project: queries.pinned_open_projects_user(u)),
+    ('pinned_tags_user', lambda r, u, tag, project: queries.pinned_tags_user(u)),
+    ('tasks_user', lambda r, u, tag, project: queries.tasks_user(u)),
+    ('projects_user', lambda r, u, tag, project: queries.projects_user(u)),
+    ('tags_user', lambda r, u, tag, project: queries.tags_user(u)),
+    ('task_tags', lambda r, u, tag, project: queries.task_tags(
+        list(Task.objects.filter(user=u).values_list('pk', flat=True)[:100]))),
+    ('project_tags', lambda r, u, tag, project: queries.project_tags([project.pk])),
+]
+
+# Functions that modify querysets rather than query the database.
+NOT_QUERIES = {'with_progress'}
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?! USING)(?:\s|$)')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Rollback(Exception):
+    """Raised to roll back the seeded data."""
+
+
+def seed(users, tasks, rng):
+    """Create a dataset for the checks and return one user to check with."""
+    now = timezone.now()
+    created = []
+    for u in range(users):
+        user = User.objects.create(username='explain-queries-{0}-{1}'.format(u, rng.random()))
+        created.append(user)
+        projects = [Project(user=user, title='Project {0}'.format(i), slug='project-{0}'.format(i),
+                            slugbase='project-{0}'.format(i), open=rng.random() < 0.7, pinned=rng.random() < 0.1)
+                    for i in range(max(tasks // 50, 1))]
+        Project.objects.bulk_create(projects)
+        tags = [Tag(user=user, title='Tag {0}'.format(i), slug='tag-{0}'.format(i),
+                    slugbase='tag-{0}'.format(i), pinned=rng.random() < 0.1)
+                for i in range(max(tasks // 100, 1))]
+        Tag.objects.bulk_create(tags)
+        projects = list(Project.objects.filter(user=user))
+        tags = list(Tag.objects.filter(user=user))
+        Task.objects.bulk_create([
+            Task(user=user, title='Task {0}'.format(i), slug='task-{0}'.format(i), slugbase='task-{0}'.format(i),
+                 folder=rng.choice(('inbox', 'tasks', 'tasks', 'trash')), done=rng.random() < 0.5,
+                 project=rng.choice(projects) if rng.random() < 0.5 else None,
+                 due=now + timedelta(hours=rng.randint(-500, 500)) if rng.random() < 0.3 else None,
+                 reminder=now + timedelta(hours=rng.randint(-100, 100)) if rng.random() < 0.1 else None,
+                 reminder_seen=rng.random() < 0.5, pinned=rng.random() < 0.02)
+            for i in range(tasks)])
+        through = Task.tags.through
+        through.objects.bulk_create([
+            through(task_id=pk, tag_id=rng.choice(tags).pk)
+            for pk in Task.objects.filter(user=user).values_list('pk', flat=True) if rng.random() < 0.3])
+        through = Project.tags.through
+        through.objects.bulk_create([
+            through(project_id=project.pk, tag_id=rng.choice(tags).pk)
+            for project in projects if rng.random() < 0.3])
+    return created[0]
+
+
+def find_scans(sql, params):
+    """Run EXPLAIN for a query and return the tables it scans sequentially."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            scans = [m.group(1) for m in map(SQLITE_SCAN.match, plan) if m]
+        elif connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = [row[0] for row in cursor.fetchall()]
+            scans = [m.group(1) for m in map(POSTGRESQL_SCAN.search, plan) if m]
+        else:
+            raise CommandError("EXPLAIN checks are not supported on {0}.".format(connection.vendor))
+    return plan, [table for table in scans if table.startswith('achieve_')]
+
+
+class Command(BaseCommand):
+    help = ("Run EXPLAIN for every query in achieve.queries on a seeded dataset (rolled back afterwards) "
+            "and fail if any of them scans a table sequentially.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help="Number of users to seed (default: 5).")
+        parser.add_argument('--tasks', type=int, default=2000, help="Number of tasks per user (default: 2000).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+
+    def handle(self, *args, **options):
+        checked = {name for name, check in CHECKS} | NOT_QUERIES
+        missing = [name for name, f in inspect.getmembers(queries, inspect.isfunction)
+                   if f.__module__ == queries.__name__ and name not in checked]
+        if missing:
+            raise CommandError("No EXPLAIN check for: {0}".format(', '.join(missing)))
+
+        failures = []
+        try:
+            with transaction.atomic():
+                user = seed(options['users'], options['tasks'], random.Random(options['seed']))
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                    if connection.vendor == 'postgresql':
+                        # Only fail if there is no index the planner could use.
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+
+                request = types.SimpleNamespace(user=user)
+                tag = Tag.objects.filter(user=user).first()
+                project = Project.objects.filter(user=user).first()
+                for name, check in CHECKS:
+                    sql, params = check(request, user, tag, project).query.sql_with_params()
+                    plan, scans = find_scans(sql, params)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write('{0}:\n    {1}'.format(name, '\n    '.join(plan)))
+                    if scans:
+                        failures.append('{0} (scans {1})'.format(name, ', '.join(scans)))
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError("Sequential scans found in: {0}".format('; '.join(failures)))
+        self.stdout.write("All {0} queries use indexes.".format(len(CHECKS)))
@@ -0,0 +1,35 @@
+"""Export the data of a user."""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from achieve import transfer
+
+
+class Command(BaseCommand):
+    help = "Export the tasks, projects and tags of a user as JSON Lines or CSV (see achieve.transfer)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User to export.")
+        parser.add_argument('--format', choices=sorted(transfer.EXPORT_FORMATS), default='jsonl',
+                            help="Output format (default: jsonl).")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip (needs --output).")
+        parser.add_argument('--output', '-o', help="File to write to (default: standard output).")
+        parser.add_argument('--chunk-size', type=int, default=transfer.CHUNK_SIZE,
+                            help="Number of rows to read per query (default: {0}).".format(transfer.CHUNK_SIZE))
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError("User {0} does not exist.".format(options['username']))
+
+        if options['output'] is None:
+            if options['gzip']:
+                raise CommandError("Compressed output needs --output.")
+            for text in transfer.export_text(user, options['format'], options['chunk_size']):
+                self.stdout.write(text, ending='')
+        else:
+            with open(options['output'], 'wb') as f:
+                for data in transfer.export_stream(user, options['format'], options['gzip'], options['chunk_size']):
+                    f.write(data)
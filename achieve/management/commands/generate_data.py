@@ -0,0 +1,46 @@
+"""Generate users with synthetic data, for benchmarks and testing."""
+
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from achieve import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Create users with realistic tasks, projects and tags (with due dates, reminders, pins and a Trash), "
+            "named <prefix>-1, <prefix>-2, and so on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help="Number of users to create (default: 1).")
+        parser.add_argument('--tasks', type=int, default=1000, help="Number of tasks per user (default: 1000).")
+        parser.add_argument('--projects', type=int, help="Number of projects per user (default: tasks / 20).")
+        parser.add_argument('--tags', type=int, help="Number of tags per user (default: tasks / 50).")
+        parser.add_argument('--prefix', default='generated', help="Prefix of the user names (default: generated).")
+        parser.add_argument('--password', help="Password of the users (default: none, they cannot log in).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+
+    def handle(self, *args, **options):
+        projects, tags = benchmark.dataset_sizes(options['tasks'])
+        if options['projects'] is not None:
+            projects = options['projects']
+        if options['tags'] is not None:
+            tags = options['tags']
+        usernames = ['{0}-{1}'.format(options['prefix'], i) for i in range(1, options['users'] + 1)]
+        taken = User.objects.filter(username__in=usernames).values_list('username', flat=True)
+        if taken:
+            raise CommandError("Users already exist: {0}".format(', '.join(sorted(taken))))
+
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        for username in usernames:
+            user = benchmark.generate_user(username, options['tasks'], projects, tags, rng)
+            if options['password']:
+                user.set_password(options['password'])
+                user.save(update_fields=['password'])
+            self.stdout.write("Created {0}".format(username))
+        self.stdout.write("Created {0} user(s) with {1} tasks, {2} projects and {3} tags each in {4:.1f} s.".format(
+            len(usernames), options['tasks'], projects, tags, time.perf_counter() - start))
+        self.stdout.write("Run ./manage.py render_markdown to render their descriptions.")
@@ -0,0 +1,58 @@
+"""Import data into the account of a user."""
+
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from achieve import transfer
+
+
+class Command(BaseCommand):
+    help = ("Import tasks, projects and tags of a user from JSON Lines or CSV files, as written by export_data "
+            "(see achieve.transfer).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User to import into.")
+        parser.add_argument('file', help="File to read (- for standard input, which needs --format).")
+        parser.add_argument('--format', choices=sorted(transfer.IMPORT_FORMATS),
+                            help="Input format (default: from the file name).")
+        parser.add_argument('--gzip', action='store_true', help="The input is gzip compressed (default: from the file name).")
+        parser.add_argument('--chunk-size', type=int, default=transfer.CHUNK_SIZE,
+                            help="Number of items to insert at a time (default: {0}).".format(transfer.CHUNK_SIZE))
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.select_related('achieveprofile').get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError("User {0} does not exist.".format(options['username']))
+
+        format, compressed = options['format'], options['gzip']
+        if format is None:
+            try:
+                format, compressed = transfer.import_format(options['file'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            compressed = compressed or options['gzip']
+
+        def progress(importer):
+            if options['verbosity'] >= 1:
+                self.stdout.write("{0} records imported ({1:.0f} records/s)".format(
+                    importer.imported, importer.imported / importer.elapsed))
+
+        if options['file'] == '-':
+            f = sys.stdin.buffer
+        else:
+            try:
+                f = open(options['file'], 'rb')
+            except OSError as e:
+                raise CommandError(str(e))
+        with f:
+            importer = transfer.import_stream(user, transfer.open_import(f, compressed), format,
+                                              options['chunk_size'], progress)
+
+        self.stdout.write(transfer.import_summary(importer))
+        for error in importer.errors:
+            self.stderr.write(error)
+        if importer.error_count:
+            raise CommandError("{0} record(s) could not be imported.".format(importer.error_count))
@@ -0,0 +1,25 @@
+"""Rebuild the reminder queue and verify it against the database."""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from achieve import scheduler
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the in-process reminder queue (see achieve.scheduler) from the database, "
+            "verify it against the database, and report how long the rebuild took.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        scheduler.queue.load()
+        elapsed = time.perf_counter() - start
+        reminders = sum(len(queue.reminders) for queue in scheduler.queue.queues.values())
+        self.stdout.write("Loaded {0} reminder(s) of {1} user(s) in {2:.3f} s.".format(
+            reminders, len(scheduler.queue.queues), elapsed))
+        mismatched = scheduler.queue.verify()
+        if mismatched:
+            raise CommandError("Reminder queue differs from the database for user(s): {0}".format(
+                ', '.join(map(str, mismatched))))
+        self.stdout.write("Reminder queue matches the database.")
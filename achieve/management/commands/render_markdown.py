@@ -0,0 +1,87 @@
+"""Render stored Markdown HTML for tasks and projects."""
+
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from achieve.models import Task, Project, MD_VERSION, render_markdown
+
+
+def render_chunk(rows):
+    """Render a chunk of (pk, source, ...) rows into (pk, html, ...) rows."""
+    return [(row[0],) + tuple(render_markdown(text) for text in row[1:]) for row in rows]
+
+
+class Command(BaseCommand):
+    help = "Render Markdown HTML for tasks and projects that are missing it or have a stale version."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help="Re-render all items, even if they are up to date.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Number of items rendered in a single job (default: 500).")
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes (default: number of CPUs).")
+
+    def handle(self, *args, **options):
+        jobs = max(options['jobs'], 1)
+        if jobs > 1:
+            # Workers only render text; they must not inherit open connections.
+            connections.close_all()
+            executor = ProcessPoolExecutor(jobs)
+        else:
+            executor = None
+
+        try:
+            for model in (Project, Task):
+                count = self.render_model(model, executor, jobs, options['chunk_size'], options['all'])
+                self.stdout.write("{0}: rendered {1} item(s).".format(model._meta.verbose_name_plural.capitalize(), count))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def chunks(self, model, chunk_size, force):
+        """Yield chunks of rows that need rendering, in primary key order."""
+        sources = [source for source, dest in model.markdown_fields]
+        queryset = model.objects.order_by('pk')
+        if not force:
+            queryset = queryset.exclude(md_version=MD_VERSION)
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).values_list('pk', *sources)[:chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield rows
+
+    def render_model(self, model, executor, jobs, chunk_size, force):
+        """Render all stale items of a model."""
+        count = 0
+        pending = collections.deque()
+        for rows in self.chunks(model, chunk_size, force):
+            if executor is None:
+                count += self.store(model, rows, render_chunk(rows))
+                continue
+            pending.append((rows, executor.submit(render_chunk, rows)))
+            if len(pending) >= jobs * 2:
+                rows, future = pending.popleft()
+                count += self.store(model, rows, future.result())
+        while pending:
+            rows, future = pending.popleft()
+            count += self.store(model, rows, future.result())
+        return count
+
+    def store(self, model, rows, rendered):
+        """Store rendered HTML, skipping items that were edited in the meantime."""
+        sources = [source for source, dest in model.markdown_fields]
+        dests = [dest for source, dest in model.markdown_fields]
+        count = 0
+        with transaction.atomic():
+            for row, html in zip(rows, rendered):
+                unchanged = dict(zip(sources, row[1:]))
+                values = dict(zip(dests, html[1:]))
+                count += model.objects.filter(pk=row[0], **unchanged).update(md_version=MD_VERSION, **values)
+        return count
@@ -0,0 +1,23 @@
+"""Recount badges for all users."""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from achieve.helpers import update_badges
+
+
+class Command(BaseCommand):
+    help = "Recount badges for all users (or the specified users) to reconcile them with the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Users to update (default: all users).")
+
+    def handle(self, *args, **options):
+        users = User.objects.select_related('achieveprofile')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        count = 0
+        for user in users.iterator():
+            update_badges(user)
+            count += 1
+        self.stdout.write("Updated badges for {0} user(s).".format(count))
@@ -1,8 +1,32 @@
 """Middleware for Achieve."""
 
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+
 import pytz
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends import django as django_backend
 from django.utils import timezone
 
+logger = logging.getLogger('achieve.timing')
+
+_local = threading.local()
+
+
+@functools.lru_cache(maxsize=128)
+def get_timezone(tzname):
+    """Get a time zone by name (cached)."""
+    return pytz.timezone(tzname)
+
 
 class TimezoneMiddleware(object):  # pragma: no cover
     """Middleware to apply user time zone."""
@@ -10,12 +34,217 @@ class TimezoneMiddleware(object):  # pragma: no cover
         self.get_response = get_response
 
     def __call__(self, request):
+        tzname = None
         if request.user.is_authenticated():
             tzname = request.user.achieveprofile.timezone
-            if tzname:
-                timezone.activate(pytz.timezone(tzname))
-            else:
-                timezone.deactivate()
+        if tzname:
+            timezone.activate(get_timezone(tzname))
+        else:
+            # Don’t leave the time zone of the previous request active.
+            timezone.deactivate()
 
         response = self.get_response(request)
         return response
+
+
+def call_site(depth=3):
+    """Describe where the current code was called from, as the innermost frames of the project."""
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        in_project = filename.startswith(settings.BASE_DIR) and 'site-packages' not in filename
+        if not in_project or filename == os.path.abspath(__file__):
+            continue
+        frames.append('{0}:{1} ({2})'.format(os.path.relpath(filename, settings.BASE_DIR), frame.lineno, frame.name))
+        if len(frames) == depth:
+            break
+    return ' < '.join(frames) or '(unknown)'
+
+
+class Timings(object):
+    """SQL queries and time spent in a request."""
+
+    def __init__(self, repeated_threshold):
+        """Start timing."""
+        self.start = time.perf_counter()
+        self.repeated_threshold = repeated_threshold
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        # Number of runs and call site of every SQL statement (with placeholders for parameters).
+        self.statements = collections.Counter()
+        self.call_sites = {}
+
+    @contextlib.contextmanager
+    def query(self, sql):
+        """Time a query."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+            if self.statements[sql] == self.repeated_threshold:
+                self.call_sites[sql] = call_site()
+
+    @contextlib.contextmanager
+    def template(self):
+        """Time rendering a template; templates rendered by other templates are not counted twice."""
+        start = time.perf_counter()
+        self.template_depth += 1
+        try:
+            yield
+        finally:
+            self.template_depth -= 1
+            if not self.template_depth:
+                self.template_time += time.perf_counter() - start
+
+    @property
+    def total_time(self):
+        """Get the time since the start."""
+        return time.perf_counter() - self.start
+
+    def repeated(self):
+        """Get the statements run at least `repeated_threshold` times, as (SQL, count, call site), most first."""
+        return [(sql, count, self.call_sites[sql]) for sql, count in self.statements.most_common()
+                if count >= self.repeated_threshold]
+
+    def server_timing(self):
+        """Format the timings as a Server-Timing header."""
+        metrics = [
+            'db;dur={0:.1f};desc="{1} queries"'.format(self.sql_time * 1000, self.queries),
+            'tpl;dur={0:.1f};desc="Templates"'.format(self.template_time * 1000),
+            'total;dur={0:.1f}'.format(self.total_time * 1000),
+        ]
+        repeated = self.repeated()
+        if repeated:
+            metrics.append('repeated;desc="{0} statements, up to {1}x"'.format(len(repeated), repeated[0][1]))
+        return ', '.join(metrics)
+
+
+class TimedCursor(object):
+    """A database cursor wrapper that records queries in Timings."""
+
+    def __init__(self, cursor, timings):
+        self.cursor = cursor
+        self.timings = timings
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def callproc(self, procname, params=None):
+        with self.timings.query(procname):
+            return self.cursor.callproc(procname, params)
+
+    def execute(self, sql, params=None):
+        with self.timings.query(sql):
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with self.timings.query(sql):
+            return self.cursor.executemany(sql, param_list)
+
+
+@contextlib.contextmanager
+def recording(timings):
+    """Record the queries and template rendering of the current thread in `timings`.
+
+    Every cursor the connections make in the block is wrapped in a
+    TimedCursor (like connection.execute_wrapper() in newer Django versions).
+    """
+    wrapped = []
+    for connection in connections.all():
+        for name in ('make_cursor', 'make_debug_cursor'):
+            make = getattr(connection, name)
+            setattr(connection, name, lambda cursor, make=make: TimedCursor(make(cursor), timings))
+        wrapped.append(connection)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = None
+        for connection in wrapped:
+            # Back to the methods of the class.
+            del connection.make_cursor
+            del connection.make_debug_cursor
+
+
+def timed_render(render):
+    """Wrap the render() method of a template class to record the time in the current Timings."""
+    @functools.wraps(render)
+    def timed(self, *args, **kwargs):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return render(self, *args, **kwargs)
+        with timings.template():
+            return render(self, *args, **kwargs)
+    timed.timed = True
+    return timed
+
+
+def time_templates():
+    """Record the rendering time of the Django and Jinja2 templates (once per process)."""
+    template_classes = [django_backend.Template]
+    try:
+        from achieve import jinja
+    except ImportError:  # Jinja2 is not installed
+        pass
+    else:
+        template_classes.append(jinja.Template)
+    for cls in template_classes:
+        if not getattr(cls.render, 'timed', False):
+            cls.render = timed_render(cls.render)
+
+
+class TimingMiddleware(object):
+    """Middleware to measure requests (enabled with ACHIEVE_TIMING).
+
+    The number of SQL queries, the time spent in them, in rendering templates
+    and in the whole request are sent in a Server-Timing header and logged to
+    the achieve.timing logger as JSON.  SQL statements that run at least
+    ACHIEVE_TIMING_REPEATED_QUERIES times (usually a query per row, N+1) are
+    logged as warnings, with their call site.  Streaming responses only
+    include the time until the response starts.
+    """
+    def __init__(self, get_response):
+        if not settings.ACHIEVE_TIMING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        time_templates()
+
+    def __call__(self, request):
+        with recording(Timings(settings.ACHIEVE_TIMING_REPEATED_QUERIES)) as timings:
+            response = self.get_response(request)
+        response['Server-Timing'] = timings.server_timing()
+        user = getattr(request, 'user', None)
+        logger.info(json.dumps(collections.OrderedDict([
+            ('event', 'request'),
+            ('method', request.method),
+            ('path', request.path),
+            ('status', response.status_code),
+            ('user', user.pk if user is not None else None),
+            ('queries', timings.queries),
+            ('sql_ms', round(timings.sql_time * 1000, 1)),
+            ('template_ms', round(timings.template_time * 1000, 1)),
+            ('total_ms', round(timings.total_time * 1000, 1)),
+        ])))
+        for sql, count, site in timings.repeated():
+            logger.warning(json.dumps(collections.OrderedDict([
+                ('event', 'repeated_query'),
+                ('path', request.path),
+                ('count', count),
+                ('call_site', site),
+                ('sql', sql),
+            ])))
+        return response
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:28
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def parse_suffix(slug, slugbase):
+    """Parse the numeric suffix of a slug, or return None if it does not have a valid one."""
+    if slug == slugbase:
+        return 0
+    prefix = slugbase + '-'
+    rest = slug[len(prefix):]
+    if slug.startswith(prefix) and rest.isdigit() and not rest.startswith('0'):
+        return int(rest)
+    return None
+
+
+def backfill_suffixes(apps, schema_editor):
+    """Fill in slug_suffix from existing slugs, renaming duplicate slugs."""
+    for name in ('Tag', 'Project', 'Task'):
+        model = apps.get_model('achieve', name)
+        used_slugs = set()
+        max_suffix = {}
+        invalid = []
+        rows = model.objects.order_by('pk').values_list('pk', 'user_id', 'slug', 'slugbase')
+        for pk, user_id, slug, slugbase in rows.iterator():
+            suffix = parse_suffix(slug, slugbase)
+            if suffix is None or (user_id, slug) in used_slugs:
+                invalid.append((pk, user_id, slugbase))
+                continue
+            used_slugs.add((user_id, slug))
+            max_suffix[user_id, slugbase] = max(max_suffix.get((user_id, slugbase), 0), suffix)
+            if suffix:
+                model.objects.filter(pk=pk).update(slug_suffix=suffix)
+
+        for pk, user_id, slugbase in invalid:
+            suffix = max_suffix.get((user_id, slugbase), 0) + 1
+            slug = '{0}-{1}'.format(slugbase, suffix)
+            while (user_id, slug) in used_slugs:
+                suffix += 1
+                slug = '{0}-{1}'.format(slugbase, suffix)
+            used_slugs.add((user_id, slug))
+            max_suffix[user_id, slugbase] = suffix
+            model.objects.filter(pk=pk).update(slug=slug, slug_suffix=suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('achieve', '0002_stored_markdown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='slug_suffix',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='slug_suffix',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='slug_suffix',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_suffixes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='project',
+            unique_together=set([('user', 'slug')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tag',
+            unique_together=set([('user', 'slug')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together=set([('user', 'slug')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('user', 'slugbase', 'slug_suffix')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tag',
+            index_together=set([('user', 'slugbase', 'slug_suffix')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('user', 'slugbase', 'slug_suffix')]),
+        ),
+    ]
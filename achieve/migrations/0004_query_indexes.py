@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:30
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+# Partial index for queries.reminders_soon.  SQLite cannot use partial indexes
+# with boolean conditions, as Django passes booleans as query parameters.
+REMINDER_INDEX = {
+    'sqlite': 'CREATE INDEX "achieve_task_reminder_partial" ON "achieve_task" ("user_id", "reminder") '
+              'WHERE "reminder" IS NOT NULL',
+    'postgresql': 'CREATE INDEX "achieve_task_reminder_partial" ON "achieve_task" ("user_id", "reminder") '
+                  'WHERE "reminder" IS NOT NULL AND "reminder_seen" = false AND "done" = false',
+}
+
+
+def create_partial_indexes(apps, schema_editor):
+    """Create partial indexes, if supported by the database."""
+    sql = REMINDER_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_partial_indexes(apps, schema_editor):
+    """Drop partial indexes."""
+    if schema_editor.connection.vendor in REMINDER_INDEX:
+        schema_editor.execute('DROP INDEX "achieve_task_reminder_partial"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('achieve', '0003_slug_suffix'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('user', 'pinned'), ('user', 'slugbase', 'slug_suffix'), ('user', 'open')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tag',
+            index_together=set([('user', 'pinned'), ('user', 'slugbase', 'slug_suffix')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('user', 'folder', 'done'), ('user', 'slugbase', 'slug_suffix'), ('user', 'pinned'), ('user', 'done', 'due')]),
+        ),
+        migrations.RunPython(create_partial_indexes, drop_partial_indexes),
+    ]
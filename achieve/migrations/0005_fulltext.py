@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 21:10
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+# The searched tables and their search fields at the time of this migration.
+# The SQL is spelled out here (and not taken from achieve.fulltext) so that
+# replaying the migration does not change with the current code.
+SEARCH_TABLES = (
+    ('achieve_task', ('title', 'description', 'resolution')),
+    ('achieve_project', ('title', 'description')),
+    ('achieve_tag', ('title',)),
+)
+POSTGRESQL_CONFIG = 'english'
+POSTGRESQL_WEIGHTS = ('A', 'B', 'C')
+
+
+def sqlite_install(table, fields):
+    """Return statements that create the FTS5 table and triggers for a table."""
+    fts = table + '_fts'
+    columns = ', '.join(fields)
+    new = ', '.join('new.' + f for f in fields)
+    old = ', '.join('old.' + f for f in fields)
+    insert = "INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    delete = "INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    return [s.format(table=table, fts=fts, columns=columns, new=new, old=old) for s in (
+        "CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN " + insert + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN " + delete + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN " + delete + " " + insert +
+        " END",
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    )]
+
+
+def sqlite_uninstall(table, fields):
+    """Return statements that drop the FTS5 table and triggers for a table."""
+    fts = table + '_fts'
+    return ["DROP TRIGGER IF EXISTS {0}_{1}".format(fts, t) for t in ('ai', 'ad', 'au')] + [
+        "DROP TABLE IF EXISTS {0}".format(fts)]
+
+
+def postgresql_vector(fields, record):
+    """Return an SQL expression that builds the search vector of a record."""
+    return ' || '.join(
+        "setweight(to_tsvector('pg_catalog.{config}', coalesce({record}.{field}, '')), '{weight}')".format(
+            config=POSTGRESQL_CONFIG, record=record, field=field, weight=weight)
+        for field, weight in zip(fields, POSTGRESQL_WEIGHTS))
+
+
+def postgresql_install(table, fields):
+    """Return statements that create the search vector column, index and trigger for a table."""
+    return [
+        "ALTER TABLE {table} ADD COLUMN search_vector tsvector".format(table=table),
+        "UPDATE {table} SET search_vector = {vector}".format(table=table, vector=postgresql_vector(fields, table)),
+        "CREATE INDEX {table}_search_vector ON {table} USING gin(search_vector)".format(table=table),
+        """CREATE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {vector};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""".format(table=table, vector=postgresql_vector(fields, 'NEW')),
+        "CREATE TRIGGER {table}_search_vector_trigger BEFORE INSERT OR UPDATE OF {fields} ON {table} "
+        "FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update()".format(
+            table=table, fields=', '.join(fields)),
+    ]
+
+
+def postgresql_uninstall(table, fields):
+    """Return statements that drop the search vector column and trigger for a table."""
+    return [
+        "DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}".format(table=table),
+        "DROP FUNCTION IF EXISTS {table}_search_vector_update()".format(table=table),
+        "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector".format(table=table),
+    ]
+
+
+STATEMENTS = {
+    ('sqlite', True): sqlite_install,
+    ('sqlite', False): sqlite_uninstall,
+    ('postgresql', True): postgresql_install,
+    ('postgresql', False): postgresql_uninstall,
+}
+
+
+def statements(vendor, install):
+    """Return the statements that install (or uninstall) full-text search on a database."""
+    make = STATEMENTS.get((vendor, install))
+    if make is None:
+        return []
+    return [s for table, fields in SEARCH_TABLES for s in make(table, fields)]
+
+
+def install_fulltext(apps, schema_editor):
+    """Create full-text search tables/columns, triggers and indexes."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute("CREATE VIRTUAL TABLE achieve_fts5_check USING fts5(x)")
+            schema_editor.execute("DROP TABLE achieve_fts5_check")
+        except OperationalError:
+            # SQLite built without FTS5, substring search will be used.
+            return
+    for statement in statements(vendor, True):
+        schema_editor.execute(statement)
+
+
+def uninstall_fulltext(apps, schema_editor):
+    """Drop full-text search tables/columns and triggers."""
+    for statement in statements(schema_editor.connection.vendor, False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achieve', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_fulltext, uninstall_fulltext),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achieve', '0005_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achieveprofile',
+            name='badge_due_soon',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='achieveprofile',
+            name='badge_due_soon_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 22:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achieve', '0006_due_soon_badge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achieveprofile',
+            name='changed',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='achieveprofile',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_project_tags_indexes(apps, schema_editor):
+    """Create the indexes of the Project.tags table, if they are missing.
+
+    On SQLite, 0001_initial remakes the project table after creating the
+    Project.tags table, and Django drops the deferred index statements of
+    every table whose name contains the project table's name.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    through = apps.get_model('achieve', 'Project')._meta.get_field('tags').remote_field.through
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, through._meta.db_table)
+    if any(constraint['index'] for constraint in constraints.values()):
+        return
+    schema_editor.execute(schema_editor._create_unique_sql(through, ['project_id', 'tag_id']))
+    for sql in schema_editor._model_indexes_sql(through):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('achieve', '0007_profile_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_project_tags_indexes, migrations.RunPython.noop),
+    ]
@@ -3,10 +3,11 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.html import mark_safe, format_html
+import hashlib
 import markdown
 import bleach
 
@@ -14,17 +15,129 @@ ALLOWED_TAGS = bleach.ALLOWED_TAGS + ['br', 'p', 'abbr', 'img', 'h1', 'h2', 'h3'
 ALLOWED_ATTRIBUTES = bleach.ALLOWED_ATTRIBUTES.copy()
 ALLOWED_ATTRIBUTES['img'] = ['src', 'alt', 'title']
 MD_EXTENSIONS = ['markdown.extensions.abbr', 'markdown.extensions.smart_strong', 'markdown.extensions.nl2br', 'mdx_linkify', 'markdown.extensions.toc']
+# Bump this if the rendering changes in a way that is not covered by the settings above.
+MD_RENDERER_REVISION = 1
+# Stored HTML rendered with a different version is stale and gets re-rendered.
+MD_VERSION = hashlib.sha1(repr((
+    MD_RENDERER_REVISION, markdown.version, bleach.__version__, MD_EXTENSIONS,
+    sorted(ALLOWED_TAGS), sorted(ALLOWED_ATTRIBUTES.items()))).encode('utf-8')).hexdigest()[:12]
 
 
-class Tag(models.Model):
+def render_markdown(text):
+    """Render Markdown text to sanitized HTML."""
+    if not text.strip():
+        return ''
+    return bleach.clean(markdown.markdown(text, extensions=MD_EXTENSIONS),
+                        tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+
+
+def stored_markdown(obj, source, dest):
+    """Return stored HTML for a Markdown field, rendering it if it is stale."""
+    if obj.md_version == MD_VERSION:
+        return getattr(obj, dest)
+    else:
+        return render_markdown(getattr(obj, source))
+
+
+# How many times to try picking a new slug if another item took it.
+SLUG_ATTEMPTS = 5
+
+
+class AchieveModel(models.Model):
+    """A slugged model that remembers the values it was loaded from the database with."""
+
+    _loaded_values = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Create an instance from a database row."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save the object and remember the saved values."""
+        for attempt in range(1, SLUG_ATTEMPTS + 1):
+            try:
+                self._save_once(*args, **kwargs)
+                break
+            except IntegrityError:
+                if attempt == SLUG_ATTEMPTS or not self.slug_taken():
+                    raise
+                # Someone else took our slug, pick the next free one.
+                achieve.helpers.update_slug(self, force=True, save=False, min_suffix=self.slug_suffix + 1)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields
+                               if f.attname in self.__dict__}
+
+    def _save_once(self, *args, **kwargs):
+        """Save the object in a transaction (or a savepoint), starting from the row it replaces."""
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk is not None and not kwargs.get('force_insert'):
+                self.lock_loaded_values(kwargs.get('using'))
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Delete the object, unless someone else already did."""
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk is not None and not self.lock_loaded_values(kwargs.get('using')):
+                return 0, {}
+            return super().delete(*args, **kwargs)
+
+    def lock_loaded_values(self, using=None):
+        """Lock the row of the object and load its current values, return False if there is none.
+
+        Signal receivers (like achieve.counters) compare the saved or deleted
+        values with the loaded ones.  Another copy of the object may have
+        been saved since this one was loaded, so they are loaded again.
+        """
+        fields = [f.attname for f in self._meta.concrete_fields]
+        row = type(self).objects.using(using or self._state.db).select_for_update().filter(pk=self.pk).values(
+            *fields).first()
+        self._loaded_values = row
+        return row is not None
+
+    def slug_taken(self):
+        """Check if the slug of this object is used by another object of the same user."""
+        return type(self).objects.filter(user_id=self.user_id, slug=self.slug).exclude(pk=self.pk).exists()
+
+    def loaded_value(self, field, default=None):
+        """Return the value of a field as it was loaded from the database."""
+        if self._loaded_values is None:
+            return default
+        return self._loaded_values.get(field, default)
+
+    def has_changed(self, *fields):
+        """Check if any of the fields changed since the object was loaded or saved."""
+        if self._loaded_values is None:
+            return True
+        for field in fields:
+            if field not in self._loaded_values or self._loaded_values[field] != getattr(self, field):
+                return True
+        return False
+
+
+class Tag(AchieveModel):
     """A tag that can be attached to Tasks and Projects."""
 
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200)
     slugbase = models.SlugField(max_length=200)
+    slug_suffix = models.PositiveIntegerField(default=0, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     pinned = models.BooleanField(default=False)
 
+    search_fields = ('title',)
+
+    class Meta:
+        unique_together = (('user', 'slug'),)
+        index_together = (
+            ('user', 'slugbase', 'slug_suffix'),
+            ('user', 'pinned'),
+        )
+
     def __str__(self):
         """Return the name of a tag."""
         return self.title
@@ -42,13 +155,16 @@ class Tag(models.Model):
         return format_html('<a href="{0}" class="label label-default tag">{1}</a>', self.get_absolute_url(), self.title)
 
 
-class Project(models.Model):
+class Project(AchieveModel):
     """A project, which organizes multiple tasks with a common goal."""
 
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200)
     slugbase = models.SlugField(max_length=200)
+    slug_suffix = models.PositiveIntegerField(default=0, editable=False)
     description = models.TextField(blank=True)
+    description_html = models.TextField(blank=True, editable=False)
+    md_version = models.CharField(max_length=40, blank=True, editable=False)
     priority = models.PositiveSmallIntegerField(default=1, null=True)
     tags = models.ManyToManyField(Tag, blank=True)
     added = models.DateTimeField(auto_now_add=True)
@@ -57,6 +173,17 @@ class Project(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     pinned = models.BooleanField(default=False)
 
+    markdown_fields = (('description', 'description_html'),)
+    search_fields = ('title', 'description')
+
+    class Meta:
+        unique_together = (('user', 'slug'),)
+        index_together = (
+            ('user', 'slugbase', 'slug_suffix'),
+            ('user', 'open'),
+            ('user', 'pinned'),
+        )
+
     def __str__(self):
         """Return the title of a project."""
         return self.title
@@ -71,14 +198,18 @@ class Project(models.Model):
 
     def progress(self):
         """Return a two-tuple of (done tasks, all tasks) in a project."""
-        t = self.task_set
-        return (t.filter(done=True).count(), t.count())
+        # Use annotations from queries.with_progress if available.
+        if hasattr(self, 'tasks_total'):
+            return (self.tasks_done, self.tasks_total)
+        counts = self.task_set.aggregate(
+            done=models.Sum(models.Case(models.When(done=True, then=1), default=0, output_field=models.IntegerField())),
+            total=models.Count('pk'))
+        return (counts['done'] or 0, counts['total'])
 
     def description_md(self):
         """Return Markdown-formatted description."""
         if self.description.strip():
-            return mark_safe(bleach.clean(markdown.markdown(self.description, extensions=MD_EXTENSIONS),
-                                          tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES))
+            return mark_safe(stored_markdown(self, 'description', 'description_html'))
         else:
             return ''
 
@@ -93,14 +224,18 @@ class Project(models.Model):
         return format_html('<div class="progress"><div class="progress-bar" role="progressbar" aria-valuenow="{0}" aria-valuemin="0" aria-valuemax="{1}" style="width: {2}%">{3}% ({0}/{1})</div></div>', v, m, perc, pf)
 
 
-class Task(models.Model):
+class Task(AchieveModel):
     """A task, the most basic unit of productivity."""
 
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200)
     slugbase = models.SlugField(max_length=200)
+    slug_suffix = models.PositiveIntegerField(default=0, editable=False)
     description = models.TextField(blank=True)
+    description_html = models.TextField(blank=True, editable=False)
     resolution = models.TextField(blank=True)
+    resolution_html = models.TextField(blank=True, editable=False)
+    md_version = models.CharField(max_length=40, blank=True, editable=False)
     project = models.ForeignKey(Project, blank=True, null=True, on_delete=models.SET_NULL)
     priority = models.PositiveSmallIntegerField(default=1, blank=True)
     done = models.BooleanField(default=False)
@@ -118,6 +253,20 @@ class Task(models.Model):
     reminder_seen = models.BooleanField(default=False)
     pinned = models.BooleanField(default=False)
 
+    markdown_fields = (('description', 'description_html'), ('resolution', 'resolution_html'))
+    search_fields = ('title', 'description', 'resolution')
+
+    class Meta:
+        unique_together = (('user', 'slug'),)
+        # Indexes for the queries in achieve.queries.  Reminders use a partial
+        # index, created in the 0004_query_indexes migration.
+        index_together = (
+            ('user', 'slugbase', 'slug_suffix'),
+            ('user', 'folder', 'done'),
+            ('user', 'done', 'due'),
+            ('user', 'pinned'),
+        )
+
     def __str__(self):
         """Return the title of a task."""
         return self.title
@@ -138,16 +287,14 @@ class Task(models.Model):
     def description_md(self):
         """Return Markdown-formatted description."""
         if self.description.strip():
-            return mark_safe(bleach.clean(markdown.markdown(self.description, extensions=MD_EXTENSIONS),
-                                          tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES))
+            return mark_safe(stored_markdown(self, 'description', 'description_html'))
         else:
             return mark_safe('<p class="text-muted">No description provided.</p>')
 
     def resolution_md(self):
         """Return Markdown-formatted resolution information."""
         if self.resolution.strip():
-            return mark_safe(bleach.clean(markdown.markdown(self.resolution, extensions=MD_EXTENSIONS),
-                                          tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES))
+            return mark_safe(stored_markdown(self, 'resolution', 'resolution_html'))
         else:
             return ''
 
@@ -159,6 +306,12 @@ class AchieveProfile(models.Model):
     badge_all_tasks = models.IntegerField(default=0)
     badge_trash = models.IntegerField(default=0)
     badge_projects = models.IntegerField(default=0)
+    # Cached, see achieve.counters.due_soon_badge
+    badge_due_soon = models.IntegerField(default=0)
+    badge_due_soon_expires = models.DateTimeField(null=True, blank=True)
+    # Bumped on every change to the user's data, see achieve.counters
+    generation = models.PositiveIntegerField(default=0)
+    changed = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Achieve Profile"
@@ -167,9 +320,11 @@ class AchieveProfile(models.Model):
     def __str__(self):
         return self.user.username
 
-# Signal handlers (slug and badge updating)
+# Signal handlers (slug, Markdown, badge and event updating)
 import achieve.helpers  # NOQA
 import achieve.queries  # NOQA
+import achieve.counters  # NOQA
+import achieve.events  # NOQA
 
 
 @receiver(models.signals.pre_save, sender=Tag)
@@ -180,11 +335,50 @@ def update_slug_on_save(sender, **kwargs):
     achieve.helpers.update_slug(kwargs['instance'], save=False)
 
 
+@receiver(models.signals.pre_save, sender=Project)
+@receiver(models.signals.pre_save, sender=Task)
+def update_markdown_on_save(sender, instance, **kwargs):
+    """Render Markdown fields when an object is saved."""
+    achieve.helpers.update_markdown(instance)
+
+
+# Connected before the badge receivers, so that reminder changes are published
+# before the data generation they belong to (see achieve.scheduler).
+@receiver(models.signals.post_save, sender=Task)
+def publish_reminders_on_save(sender, instance, created, **kwargs):
+    """Publish reminder changes when a Task is saved."""
+    achieve.events.task_saved(instance, created)
+
+
+@receiver(models.signals.post_delete, sender=Task)
+def publish_reminders_on_delete(sender, instance, **kwargs):
+    """Publish reminder cancellations when a Task is deleted."""
+    achieve.events.task_deleted(instance)
+
+
+@receiver(models.signals.post_save, sender=Tag)
 @receiver(models.signals.post_save, sender=Task)
 @receiver(models.signals.post_save, sender=Project)
 def update_badges_on_save(sender, instance, created, **kwargs):
-    """Update badges when a Task/Project is saved."""
-    achieve.helpers.update_badges(instance.user)
+    """Update badges when a Task/Project/Tag is saved."""
+    achieve.counters.item_saved(instance, created)
+
+
+@receiver(models.signals.post_delete, sender=Tag)
+@receiver(models.signals.post_delete, sender=Task)
+@receiver(models.signals.post_delete, sender=Project)
+def update_badges_on_delete(sender, instance, **kwargs):
+    """Update badges when a Task/Project/Tag is deleted."""
+    achieve.counters.item_deleted(instance)
+
+
+@receiver(models.signals.m2m_changed, sender=Task.tags.through)
+@receiver(models.signals.m2m_changed, sender=Project.tags.through)
+def update_generation_on_tags_change(sender, instance, action, **kwargs):
+    """Record a change when tags are added to or removed from an item."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # Tags do not affect reminders.
+        achieve.counters.touch(instance.user_id, signalled=True)
 
 
 @receiver(models.signals.post_save, sender=settings.AUTH_USER_MODEL)
@@ -1,9 +1,14 @@
 """Commonly used queries."""
 
 from achieve.models import Task, Project, Tag
+from django.db.models import Case, Count, IntegerField, Sum, When
 from django.utils import timezone
 from datetime import timedelta
 
+# Tasks due within this time are due soon.
+DUE_SOON = timedelta(days=1)
+REMINDERS_SOON = timedelta(days=2)
+
 
 def inbox(request):
     """Get all tasks in the inbox that belong to the current user."""
@@ -25,14 +30,51 @@ def incomplete_tasks_user(user):
     return Task.objects.filter(user=user, done=False).exclude(folder='trash')
 
 
+def with_progress(projects):
+    """Annotate projects with the number of done tasks (tasks_done) and all tasks (tasks_total)."""
+    return projects.annotate(
+        tasks_done=Sum(Case(When(task__done=True, then=1), default=0, output_field=IntegerField())),
+        tasks_total=Count('task'))
+
+
 def projects_with_tag(request, tag):
     """Get all projects with a tag that belong to the current user."""
-    return tag.project_set.filter(user=request.user)
+    return with_progress(tag.project_set.filter(user=request.user))
 
 
 def tasks_with_tag(request, tag):
     """Get all tasks with a tag that belong to the current user."""
-    return tag.task_set.filter(user=request.user).exclude(folder='trash')
+    return with_any_tags(all_tasks(request), [tag.pk])
+
+
+def tags_by_slug(request, slugs):
+    """Get the tags of the current user with the specified slugs."""
+    return Tag.objects.filter(user=request.user, slug__in=slugs)
+
+
+def tagged_tasks(tag_ids):
+    """Get the IDs of tasks with any of the specified tags, as a subquery."""
+    return Task.tags.through.objects.filter(tag_id__in=tag_ids).values('task_id')
+
+
+def with_any_tags(tasks, tag_ids):
+    """Filter tasks to those with any of the specified tags (a semi-join, without duplicates)."""
+    return tasks.filter(pk__in=tagged_tasks(tag_ids))
+
+
+def with_all_tags(tasks, tag_ids):
+    """Filter tasks to those with all of the specified tags."""
+    tag_ids = set(tag_ids)
+    if len(tag_ids) == 1:
+        return with_any_tags(tasks, tag_ids)
+    # Tasks that have as many of the tags as there are tags, counted per task.
+    return tasks.filter(pk__in=tagged_tasks(tag_ids).annotate(tag_count=Count('tag_id')).filter(
+        tag_count=len(tag_ids)).values('task_id'))
+
+
+def without_tags(tasks, tag_ids):
+    """Filter tasks to those with none of the specified tags."""
+    return tasks.exclude(pk__in=tagged_tasks(tag_ids))
 
 
 def tasks_in_project(request, project):
@@ -50,6 +92,17 @@ def trash_user(user):
     return Task.objects.select_related('project').filter(user=user, folder='trash')
 
 
+def expired_trash_user(user, before):
+    """Get all tasks in the trash of the specified user that were last modified before `before`."""
+    return Task.objects.filter(user=user, folder='trash', modified__lt=before)
+
+
+def expired_trash_users(before):
+    """Get the IDs of all users with tasks in the trash that were last modified before `before`."""
+    return Task.objects.filter(folder='trash', modified__lt=before).order_by('user_id').values_list(
+        'user_id', flat=True).distinct()
+
+
 def tags(request):
     """Get all tags that belong to the current user."""
     return Tag.objects.filter(user=request.user)
@@ -57,33 +110,54 @@ def tags(request):
 
 def open_projects(request):
     """Get all open projects that belong to the current user."""
-    return Project.objects.prefetch_related('task_set').filter(user=request.user, open=True)
+    return with_progress(Project.objects.filter(user=request.user, open=True))
 
 
 def open_projects_user(user):
     """Get all open projects that belong to the specified user."""
-    return Project.objects.prefetch_related('task_set').filter(user=user, open=True)
+    return Project.objects.filter(user=user, open=True)
 
 
 def projects(request):
     """Get all projects that belong to the current user."""
-    return Project.objects.prefetch_related('task_set').filter(user=request.user)
+    return with_progress(Project.objects.filter(user=request.user))
 
 
 def due_soon(request):
     """Get all tasks that are due within one day or that are overdue."""
-    soon = timezone.now() + timedelta(days=1)
+    soon = timezone.now() + DUE_SOON
     return Task.objects.select_related('project').filter(user=request.user, due__lt=soon, done=False).exclude(folder='trash')
 
 
+def due_soon_user(user, now):
+    """Get all tasks of the specified user that are due within one day of `now` or that are overdue."""
+    return incomplete_tasks_user(user).filter(due__lt=now + DUE_SOON)
+
+
+def due_later_user(user, now):
+    """Get all tasks of the specified user that are due later than one day from `now`."""
+    return incomplete_tasks_user(user).filter(due__gte=now + DUE_SOON)
+
+
 def reminders_soon(request):
     """Get all tasks that have reminders due within 2 days."""
     now = timezone.now()
-    soon = now + timedelta(days=2)
+    soon = now + REMINDERS_SOON
     return Task.objects.filter(
         user=request.user, reminder__lt=soon, reminder_seen=False, done=False).exclude(folder='trash')
 
 
+def pending_reminders():
+    """Get all tasks of all users that have pending reminders."""
+    return Task.objects.filter(reminder__isnull=False, reminder_seen=False, done=False).exclude(folder='trash')
+
+
+def pending_reminders_user(user):
+    """Get all tasks of the specified user that have pending reminders."""
+    return Task.objects.filter(
+        user=user, reminder__isnull=False, reminder_seen=False, done=False).exclude(folder='trash')
+
+
 def pinned_tasks(request):
     """Get all pinned tasks of the current user that are not in the Trash."""
     return Task.objects.filter(pinned=True, user=request.user).exclude(folder='trash')
@@ -92,3 +166,43 @@ def pinned_tasks(request):
 def pinned_tasks_srp(request):
     """Get all pinned tasks of the current user that are not in the Trash (with Project data)."""
     return Task.objects.select_related('project').filter(pinned=True, user=request.user).exclude(folder='trash')
+
+
+def pinned_tasks_user(user):
+    """Get all pinned tasks of the specified user that are not in the Trash."""
+    return Task.objects.filter(pinned=True, user=user).exclude(folder='trash')
+
+
+def pinned_open_projects_user(user):
+    """Get all pinned open projects of the specified user."""
+    return Project.objects.filter(pinned=True, user=user, open=True)
+
+
+def pinned_tags_user(user):
+    """Get all pinned tags of the specified user."""
+    return Tag.objects.filter(pinned=True, user=user)
+
+
+def tasks_user(user):
+    """Get all tasks of the specified user, including the Trash."""
+    return Task.objects.filter(user=user)
+
+
+def projects_user(user):
+    """Get all projects of the specified user."""
+    return Project.objects.filter(user=user)
+
+
+def tags_user(user):
+    """Get all tags of the specified user."""
+    return Tag.objects.filter(user=user)
+
+
+def task_tags(task_ids):
+    """Get the links between the specified tasks and their tags."""
+    return Task.tags.through.objects.filter(task_id__in=task_ids)
+
+
+def project_tags(project_ids):
+    """Get the links between the specified projects and their tags."""
+    return Project.tags.through.objects.filter(project_id__in=project_ids)
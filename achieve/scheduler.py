@@ -0,0 +1,158 @@
+"""In-process queue of upcoming reminders.
+
+Pending reminders are kept per user, sorted by time, so that the reminders
+due before a given time are found with a binary search instead of a query.
+The queue is loaded with a single query the first time it is used, and
+changes committed in this process are applied to it as they are published
+to achieve.events.hub.
+
+Every user's queue remembers the data generation of the user (see
+achieve.counters) it is current for; callers pass the generation they
+loaded, and a queue with another generation is reloaded from the database.
+achieve.counters publishes the generations committed in this process, and
+a queue that saw the generation just before one moves on to it without a
+reload.  Changes made by other processes or by bulk updates are not seen
+directly: they skip generations (or are not published), so the queue is
+reloaded.
+"""
+
+import bisect
+import threading
+
+import pytz
+from django.db.models import F
+from django.utils import timezone
+
+from achieve import queries
+
+# Fields needed for reminder_data().
+REMINDER_FIELDS = ('id', 'user_id', 'title', 'slug', 'description', 'reminder')
+
+
+def reminder_data(task):
+    """Format a task reminder, as sent to browsers."""
+    return {
+        'id': task.pk,
+        'title': task.title,
+        'timestamp': task.reminder.replace(tzinfo=pytz.UTC).timestamp(),
+        'description': task.description,
+        'url': task.get_absolute_url()
+    }
+
+
+def reminder_active(task, loaded=False):
+    """Check if a task has a pending reminder, in its current or loaded state."""
+    value = task.loaded_value if loaded else lambda field: getattr(task, field)
+    pending = value('reminder') is not None and not value('reminder_seen')
+    return pending and not value('done') and value('folder') != 'trash'
+
+
+class UserQueue(object):
+    """Pending reminders of one user, sorted by time."""
+
+    def __init__(self, generation, reminders=()):
+        """Create a queue."""
+        self.generation = generation
+        self.keys = []
+        self.reminders = {}
+        for data in reminders:
+            self.add(data)
+
+    def add(self, data):
+        """Add or replace a reminder."""
+        self.remove(data['id'])
+        bisect.insort(self.keys, (data['timestamp'], data['id']))
+        self.reminders[data['id']] = data
+
+    def remove(self, pk):
+        """Remove the reminder of a task, if it has one."""
+        data = self.reminders.pop(pk, None)
+        if data is not None:
+            del self.keys[bisect.bisect_left(self.keys, (data['timestamp'], pk))]
+
+    def before(self, timestamp):
+        """Get the reminders due before `timestamp`, in time order."""
+        end = bisect.bisect_left(self.keys, (timestamp,))
+        return [self.reminders[pk] for _, pk in self.keys[:end]]
+
+
+class ReminderQueue(object):
+    """Pending reminders of all users."""
+
+    def __init__(self):
+        """Create an empty queue."""
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.loaded = False
+
+    def load(self):
+        """(Re)load the queues of all users with a single query."""
+        reminders = {}
+        generations = {}
+        tasks = queries.pending_reminders().only(*REMINDER_FIELDS).annotate(
+            generation=F('user__achieveprofile__generation'))
+        for task in tasks.iterator():
+            reminders.setdefault(task.user_id, []).append(reminder_data(task))
+            generations[task.user_id] = task.generation
+        queues = {user_id: UserQueue(generations[user_id], data) for user_id, data in reminders.items()}
+        with self.lock:
+            self.queues = queues
+            self.loaded = True
+
+    def load_user(self, user, generation):
+        """(Re)load the queue of a user, current for `generation`."""
+        tasks = queries.pending_reminders_user(user).only(*REMINDER_FIELDS)
+        queue = UserQueue(generation, (reminder_data(task) for task in tasks))
+        with self.lock:
+            self.queues[user.pk] = queue
+        return queue
+
+    def reset(self):
+        """Forget all queues; they are loaded again when needed."""
+        with self.lock:
+            self.queues = {}
+            self.loaded = False
+
+    def upcoming(self, user, generation, until):
+        """Get the reminders of a user due before `until`, for data generation `generation`."""
+        if not self.loaded:
+            self.load()
+        timestamp = until.timestamp()
+        with self.lock:
+            queue = self.queues.get(user.pk)
+            # Users without reminders are not loaded by load().
+            if queue is not None and queue.generation == generation:
+                return queue.before(timestamp)
+        return self.load_user(user, generation).before(timestamp)
+
+    def reminders_soon(self, user, generation):
+        """Get the reminders of a user due soon (like queries.reminders_soon)."""
+        return self.upcoming(user, generation, timezone.now() + queries.REMINDERS_SOON)
+
+    def apply(self, user_id, event, data):
+        """Apply a committed change published to achieve.events.hub or by achieve.counters."""
+        with self.lock:
+            queue = self.queues.get(user_id)
+            if queue is None:
+                return
+            if event == 'reminder':
+                queue.add(data)
+            elif event == 'cancel':
+                queue.remove(data['id'])
+            elif event == 'generation' and data['generation'] == queue.generation + 1:
+                # The queue has seen all the changes of the new generation.
+                queue.generation = data['generation']
+
+    def verify(self):
+        """Compare the queues with the database and return the IDs of users whose queues differ."""
+        with self.lock:
+            queues = dict(self.queues)
+        expected = {}
+        for task in queries.pending_reminders().only(*REMINDER_FIELDS).iterator():
+            expected.setdefault(task.user_id, {})[task.pk] = reminder_data(task)
+        actual = {user_id: queue.reminders for user_id, queue in queues.items() if queue.reminders}
+        return sorted(user_id for user_id in set(expected) | set(actual)
+                      if expected.get(user_id) != actual.get(user_id))
+
+
+queue = ReminderQueue()
@@ -12,10 +12,14 @@ $(".filter-show-btn").click(function() {
 });
 
 var reminderTimeout = -1;
-var timeoutIds = [];
+var reminderTimeouts = {};
+var reminderSource = null;
+// setTimeout() cannot wait longer than this
+var MAX_TIMEOUT = 2147483647;
 
 function makeNotification(task) {
     return function() {
+        delete reminderTimeouts[task.id];
         n = new Notification(task.title, {
             "body": task.description,
             "icon": "/static/img/achieve128.png",
@@ -28,29 +32,97 @@ function makeNotification(task) {
     }
 }
 
-function setReminders() {
+function cancelReminder(id) {
+    if (id in reminderTimeouts) {
+        clearTimeout(reminderTimeouts[id]);
+        delete reminderTimeouts[id];
+    }
+}
+
+function clearReminders() {
+    for (var id in reminderTimeouts) {
+        clearTimeout(reminderTimeouts[id]);
+    }
+    reminderTimeouts = {};
+}
+
+function scheduleReminder(task) {
+    cancelReminder(task.id);
+    timeoutLength = (task.timestamp * 1000) - Date.now();
+    if (timeoutLength < 1000) {
+        timeoutLength = 1000;
+    }
+    if (timeoutLength < MAX_TIMEOUT) {
+        reminderTimeouts[task.id] = setTimeout(makeNotification(task), timeoutLength);
+    }
+}
+
+function pollReminders() {
     if (localStorage.getItem('showReminders') != '1') return;
     $.getJSON("/api/reminders/soon/").done(function(data) {
-        now = Date.now();
-        for (var i = 0; i < timeoutIds.length; i++) {
-            clearTimeout(timeoutIds);
-        }
+        clearReminders();
         for (var i = 0; i < data.reminders.length; i++) {
-            timeoutLength = (data.reminders[i].timestamp * 1000) - now;
-            if (timeoutLength < 1000) {
-                timeoutLength = 1000;
-            }
-            tid = setTimeout(makeNotification(data.reminders[i]), timeoutLength);
-            timeoutIds.push(tid);
+            scheduleReminder(data.reminders[i]);
         }
-        //
         // check back tomorrow
-        reminderTimeout = setTimeout(setReminders, 86400000);
+        reminderTimeout = setTimeout(pollReminders, 86400000);
     }).fail(function(data) {
         console.log("Failed to update reminders: " + data);
         // check back in 5 minutes
-        reminderTimeout = setTimeout(setReminders, 300000);
+        reminderTimeout = setTimeout(pollReminders, 300000);
+    });
+}
+
+function streamReminders() {
+    // Reminders are pushed by the server as they change, the stream
+    // reconnects (and resumes) on its own.
+    reminderSource = new EventSource("/api/reminders/stream/");
+    reminderSource.addEventListener("snapshot", function(e) {
+        data = JSON.parse(e.data);
+        clearReminders();
+        for (var i = 0; i < data.reminders.length; i++) {
+            scheduleReminder(data.reminders[i]);
+        }
+    });
+    reminderSource.addEventListener("reminder", function(e) {
+        scheduleReminder(JSON.parse(e.data));
+    });
+    reminderSource.addEventListener("cancel", function(e) {
+        cancelReminder(JSON.parse(e.data).id);
     });
+    reminderSource.onerror = function() {
+        if (reminderSource.readyState === EventSource.CLOSED) {
+            // Streaming is disabled or unavailable.
+            reminderSource = null;
+            pollReminders();
+        }
+    };
+    // Start over tomorrow, snapshots only include reminders due soon.
+    reminderTimeout = setTimeout(function() {
+        stopReminders();
+        setReminders();
+    }, 86400000);
+}
+
+function setReminders() {
+    if (localStorage.getItem('showReminders') != '1' || reminderSource !== null) return;
+    if (typeof EventSource !== 'undefined') {
+        streamReminders();
+    } else {
+        pollReminders();
+    }
+}
+
+function stopReminders() {
+    if (reminderSource !== null) {
+        reminderSource.close();
+        reminderSource = null;
+    }
+    if (reminderTimeout !== -1) {
+        clearTimeout(reminderTimeout);
+        reminderTimeout = -1;
+    }
+    clearReminders();
 }
 
 function updatePopover(title, content) {
@@ -106,10 +178,7 @@ function enableReminders() {
 function disableReminders() {
     setReminderStatus("disabled");
     localStorage.setItem('showReminders', '0');
-    if (reminderTimeout !== -1) {
-        clearTimeout(reminderTimeout);
-        reminderTimeout = -1;
-    }
+    stopReminders();
 }
 
 function toggleReminders() {
@@ -142,6 +211,17 @@ $(document).ready(function() {
         $(to1).val($(from1).val());
     });
 
+    // Bulk actions: select all rows, show the value the action needs
+    $(".bulk-select-all").change(function() {
+        $(".bulk-select").prop("checked", this.checked);
+    });
+    $(".bulk-action").change(function() {
+        var action = $(this).val();
+        $("#bulk-form [data-bulk-action]").each(function() {
+            $(this).toggle($(this).attr("data-bulk-action").split(" ").indexOf(action) !== -1);
+        });
+    }).change();
+
     // Collection Mode Ctrl+Enter
     $("#collection-box").keydown(function(event) {
         if ((event.keyCode == 10 || event.keyCode == 13) && event.ctrlKey) {
@@ -2,7 +2,10 @@
 
 from django import template
 from django.core.urlresolvers import reverse
-from django.utils.html import format_html, mark_safe
+from django.template.loader import get_template, render_to_string
+from django.utils.html import conditional_escape, format_html, mark_safe
+from achieve import caching
+from achieve.helpers import KeysetPage
 
 register = template.Library()
 
@@ -10,8 +13,9 @@ register = template.Library()
 @register.simple_tag(takes_context=True)
 def badge(context, b):
     """Produce a numeric badge for an object."""
-    if context['badges'][b]:
-        return format_html(' <span class="badge">{0}</span>', context['badges'][b])
+    value = context['badges'].get(b)
+    if value:
+        return format_html(' <span class="badge">{0}</span>', value)
     else:
         return ''
 
@@ -73,7 +77,7 @@ def navbar_pin(context, item):
 @register.simple_tag(takes_context=True)
 def navbar_badge(context, path, title, b, icon='fa-chevron-right', mobile_only=False):
     """Produce a navbar entry with a badge."""
-    title += badge(context, b)
+    title = conditional_escape(title) + badge(context, b)
     return navbar_entry(context, path, title, icon, mobile_only)
 
 
@@ -96,16 +100,50 @@ def folder_link(folder):
     return format_html('<a href="{0}"><i class="fa {1}"></i> {2}</a>', url, icon, folder.capitalize())
 
 
-@register.inclusion_tag('achieve/inc_task_table.html', takes_context=True)
-def task_table(context, table, empty_msg, sortable=True):
-    """Render a table of tasks."""
-    return {'table': table, 'empty_msg': empty_msg, 'sortable': sortable, 'request': context['request']}
+def render_rows(kind, items, using=None):
+    """Render table rows (with per-request values left as markers)."""
+    markers = {'csrf_input': caching.CSRF_MARKER, 'path': caching.PATH_MARKER}
+    template = get_template('achieve/inc_{0}_row.html'.format(kind), using=using)
+    return [template.render(dict(markers, i=item)) for item in items]
+
+
+def render_table_fragment(kind, rows, empty_msg, sortable, request, using=None):
+    """Render a table from its rows."""
+    return render_to_string('achieve/inc_{0}_table.html'.format(kind), {
+        'rows': rows, 'empty_msg': empty_msg, 'sortable': sortable, 'request': request}, using=using)
+
 
+def render_table(context, kind, table, empty_msg, sortable, row_key, using=None):
+    """Render a table of tasks or projects, using cached fragments."""
+    request = context['request']
 
-@register.inclusion_tag('achieve/inc_project_table.html', takes_context=True)
-def project_table(context, table, empty_msg, sortable=True):
+    def render():
+        rows = caching.cached_rows(table, row_key, lambda item: render_rows(kind, [item], using)[0])
+        return render_table_fragment(kind, rows, empty_msg, sortable, request, using)
+
+    key = caching.table_key(request, kind, using, empty_msg, sortable)
+    return caching.fill_markers(caching.cached_fragment(key, render), context)
+
+
+@register.simple_tag(takes_context=True)
+def task_table(context, table, empty_msg, sortable=True, using=None):
     """Render a table of tasks."""
-    return {'table': table, 'empty_msg': empty_msg, 'sortable': sortable, 'request': context['request']}
+    return render_table(context, 'task', table, empty_msg, sortable, caching.task_row_key, using)
+
+
+@register.simple_tag(takes_context=True)
+def project_table(context, table, empty_msg, sortable=True, using=None):
+    """Render a table of projects."""
+    return render_table(context, 'project', table, empty_msg, sortable, caching.project_row_key, using)
+
+
+@register.simple_tag(takes_context=True)
+def task_bulk(context, bulk_form, using=None):
+    """Render the bulk action form, cached until the data of the user (its projects and tags) changes."""
+    request = context['request']
+    key = caching.fragment_key('bulk', using, request.user.pk, request.user.achieveprofile.generation)
+    return caching.fill_markers(caching.cached_fragment(key, lambda: render_to_string(
+        'achieve/inc_task_bulk.html', {'bulk_form': bulk_form, 'csrf_input': caching.CSRF_MARKER}, using=using)), context)
 
 
 @register.inclusion_tag('achieve/inc_task_filters.html', takes_context=True)
@@ -176,9 +214,28 @@ def format_pagination(current_page, pagecount, table, request):
         yield PAGEFMT_PREVNEXT_OFF.format(None, "Next", "r")
 
 
+def format_keyset_pagination(table, request):
+    """Format pagination with cursors."""
+    links = (('before', table.previous_cursor, "Previous", "l"), ('after', table.next_cursor, "Next", "r"))
+    for param, cursor, label, arrow in links:
+        if cursor is None:
+            yield PAGEFMT_PREVNEXT_OFF.format(None, label, arrow)
+        else:
+            qdict = request.GET.copy()
+            for i in ('page', 'before', 'after'):
+                qdict.pop(i + table.identifier, None)
+            qdict[param + table.identifier] = cursor
+            yield PAGEFMT_PREVNEXT.format(qdict.urlencode(), label, arrow)
+
+
 @register.simple_tag(takes_context=True)
 def pagination(context, table):
     """Render a pagination widget."""
+    if isinstance(table, KeysetPage):
+        if not table.has_previous() and not table.has_next():
+            return ''
+        pages = ''.join(format_keyset_pagination(table, context['request']))
+        return mark_safe('<nav class="pagination-container"><ul class="pagination">' + pages + '</ul></nav>')
     if table.paginator.num_pages == 1:
         # Don’t render a widget if one is unnecessary.
         return ''
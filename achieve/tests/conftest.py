@@ -0,0 +1,14 @@
+"""Fixtures for Achieve tests."""
+
+import pytest
+from django.core.cache import cache
+
+from achieve import scheduler
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Clear the cache and the reminder queue before each test, as database changes are rolled back."""
+    cache.clear()
+    scheduler.queue.reset()
+    yield
@@ -0,0 +1,29 @@
+"""Achieve authentication backend tests."""
+
+from achieve.backends import ProfileModelBackend
+from achieve.middleware import get_timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+
+@pytest.mark.django_db
+def test_profile_model_backend(admin_user):
+    backend = ProfileModelBackend()
+    with CaptureQueriesContext(connection) as ctx:
+        user = backend.get_user(admin_user.pk)
+        assert user.achieveprofile.timezone == "UTC"
+    assert len(ctx.captured_queries) == 1
+    assert backend.get_user(admin_user.pk + 1000) is None
+
+
+@pytest.mark.django_db
+def test_profile_loaded_with_user(admin_client):
+    with CaptureQueriesContext(connection) as ctx:
+        admin_client.get("/tags/")
+    assert not any('FROM "achieve_achieveprofile"' in q['sql'] for q in ctx.captured_queries)
+
+
+def test_get_timezone():
+    assert get_timezone("Europe/Warsaw") is get_timezone("Europe/Warsaw")
+    assert get_timezone("Europe/Warsaw").zone == "Europe/Warsaw"
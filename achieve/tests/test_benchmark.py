@@ -0,0 +1,37 @@
+"""Query budget tests: the number of queries of every view must not grow with the data."""
+
+import random
+
+import pytest
+
+from achieve import benchmark, transfer, urls
+
+
+def test_every_view_has_a_budget():
+    names = {pattern.name for pattern in urls.urlpatterns}
+    assert names == set(benchmark.QUERY_BUDGETS) | set(benchmark.SKIPPED)
+
+
+def test_export_budget():
+    size = transfer.CHUNK_SIZE
+    assert benchmark.query_budget('export', size - 1, size - 1, size - 1) == benchmark.QUERY_BUDGETS['export']
+    assert benchmark.query_budget('export', size, 0, 0) == benchmark.QUERY_BUDGETS['export'] + 1
+    assert benchmark.query_budget('export', size + 1, size + 1, size + 1) == benchmark.QUERY_BUDGETS['export'] + 5
+    assert benchmark.query_budget('index', 10 * size, 10 * size, 10 * size) == benchmark.QUERY_BUDGETS['index']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('size', [5, 60])
+def test_query_budgets(size):
+    projects, tags = benchmark.dataset_sizes(size)
+    user = benchmark.generate_user('budget', size, projects, tags, random.Random(0))
+    client = benchmark.login(user)
+    over = []
+    for name, url in benchmark.view_urls(user):
+        status, queries, cold, warm = benchmark.measure(client, url)
+        assert status < 500, url
+        if len(queries) != benchmark.query_budget(name, size, projects, tags):
+            over.append('{0}: {1} queries, budget {2}\n{3}'.format(
+                name, len(queries), benchmark.query_budget(name, size, projects, tags),
+                '\n'.join(query['sql'] for query in queries)))
+    assert not over, '\n\n'.join(over)
@@ -0,0 +1,101 @@
+"""Achieve cache tests."""
+
+import re
+
+from achieve import caching, counters
+from achieve.models import Task, Project, Tag
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.middleware.csrf import _compare_salted_tokens
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+
+def _pins(user):
+    # A fresh profile, as loaded by a request.
+    user = User.objects.select_related('achieveprofile').get(pk=user.pk)
+    with CaptureQueriesContext(connection) as ctx:
+        pins = caching.pinned_items(user)
+    return [p.title for p in pins], len(ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_pinned_items(admin_user):
+    task = Task.objects.create(user=admin_user, title="PinTask", pinned=True)
+    project = Project.objects.create(user=admin_user, title="PinProject", pinned=True)
+    tag = Tag.objects.create(user=admin_user, title="PinTag")
+
+    assert _pins(admin_user) == (["PinTask", "PinProject"], 3)
+    assert _pins(admin_user) == (["PinTask", "PinProject"], 0)
+
+    # Every change moves on to a new generation, and so to a new key
+    tag.pinned = True
+    tag.save()
+    assert _pins(admin_user) == (["PinTask", "PinProject", "PinTag"], 3)
+
+    task.folder = 'trash'
+    task.save()
+    project.open = False
+    project.save()
+    assert _pins(admin_user) == (["PinTag"], 3)
+
+    # Changes that bypass signals (or are made by other processes) are seen too
+    Tag.objects.filter(pk=tag.pk).update(pinned=False)
+    counters.touch(admin_user.pk)
+    assert _pins(admin_user) == ([], 3)
+
+
+@pytest.mark.django_db
+def test_pinned_items_page(admin_user, admin_client):
+    Task.objects.create(user=admin_user, title="SidebarPin", pinned=True)
+    assert b"SidebarPin" in admin_client.get("/tasks/").content
+    with CaptureQueriesContext(connection) as ctx:
+        assert b"SidebarPin" in admin_client.get("/tasks/").content
+    assert not any('"pinned" = ' in q['sql'] for q in ctx.captured_queries)
+
+
+def _csrf_tokens_valid(content, client):
+    tokens = re.findall(r"name='csrfmiddlewaretoken' value='([^']*)'", content)
+    return tokens and all(_compare_salted_tokens(t, client.cookies['csrftoken'].value) for t in tokens)
+
+
+@pytest.mark.django_db
+def test_table_fragments(admin_user, admin_client, client, django_user_model):
+    project = Project.objects.create(user=admin_user, title="FragProject")
+    task = Task.objects.create(user=admin_user, title="FragTask", project=project)
+    admin_client.get("/")  # set the CSRF cookie
+    content = admin_client.get("/tasks/").content.decode('utf-8')
+    assert "FragTask" in content and "FragProject" in content
+    assert '<!--achieve:' not in content
+    assert _csrf_tokens_valid(content, admin_client)
+    assert '<input type="hidden" name="next" value="/tasks/">' in content
+
+    # Cached tables skip the queries for their rows
+    for url in ("/tasks/", "/projects/"):
+        admin_client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            content = admin_client.get(url).content.decode('utf-8')
+        assert "FragProject" in content and _csrf_tokens_valid(content, admin_client)
+        assert not any(q['sql'].startswith('SELECT "achieve_project"."id"') for q in ctx.captured_queries)
+
+    # Rows are shared by tables on other pages, with their own path
+    content = admin_client.get("/inbox/").content.decode('utf-8')
+    assert '<input type="hidden" name="next" value="/inbox/">' in content
+    assert cache.get(caching.fragment_key('row', caching.task_row_key(task))) is not None
+    assert cache.get(caching.fragment_key('row', caching.project_row_key(project))) is not None
+
+    # Other sessions get their own CSRF token
+    other = django_user_model.objects.create_user('fragother', password='x')
+    Task.objects.create(user=other, title="OtherFrag")
+    client.login(username='fragother', password='x')
+    client.get("/")
+    content = client.get("/tasks/").content.decode('utf-8')
+    assert "OtherFrag" in content and "FragTask" not in content
+    assert _csrf_tokens_valid(content, client)
+
+    # Changes to related objects refresh the tables
+    project.title = "FragRenamed"
+    project.save()
+    content = admin_client.get("/tasks/").content.decode('utf-8')
+    assert "FragRenamed" in content
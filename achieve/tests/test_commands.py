@@ -0,0 +1,113 @@
+"""Achieve management command tests."""
+
+import gzip
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from achieve import models
+
+
+@pytest.mark.django_db
+def test_render_markdown_command(admin_user):
+    p = models.Project()
+    p.user = admin_user
+    p.title = "Markdown project"
+    p.description = "*em*"
+    p.save()
+    models.Project.objects.filter(pk=p.pk).update(md_version='', description_html='')
+
+    call_command('render_markdown', jobs=1, chunk_size=1)
+    p.refresh_from_db()
+    assert p.md_version == models.MD_VERSION
+    assert p.description_html == '<p><em>em</em></p>'
+    p.delete()
+
+
+@pytest.mark.django_db
+def test_explain_queries():
+    call_command('explain_queries', users=2, tasks=2000)
+    assert not models.Task.objects.exists()
+
+
+@pytest.mark.django_db
+def test_reminder_queue_command(admin_user, capsys):
+    models.Task.objects.create(user=admin_user, title="Reminder", reminder=timezone.now())
+    call_command('reminder_queue')
+    out, err = capsys.readouterr()
+    assert "Loaded 1 reminder(s) of 1 user(s)" in out
+    assert "matches the database" in out
+
+
+@pytest.mark.django_db
+def test_benchmark_templates_command(capsys):
+    pytest.importorskip('jinja2')
+    call_command('benchmark_templates', rows=[3], repeat=1)
+    out, err = capsys.readouterr()
+    assert out.splitlines()[1].split()[0] == '3'
+    assert not models.Task.objects.exists()
+
+
+@pytest.mark.django_db
+def test_generate_data_command(capsys):
+    call_command('generate_data', users=2, tasks=20, prefix='generated')
+    out, err = capsys.readouterr()
+    assert "Created generated-1" in out
+    assert models.Task.objects.filter(user__username='generated-2').count() == 20
+    with pytest.raises(CommandError):
+        call_command('generate_data', users=1, tasks=20, prefix='generated')
+
+
+@pytest.mark.django_db
+def test_benchmark_views_command(capsys):
+    call_command('benchmark_views', sizes=[5], repeat=1, views=['index', 'export'])
+    out, err = capsys.readouterr()
+    rows = [line.split() for line in out.splitlines()[1:]]
+    assert [row[:3] for row in rows] == [['5', 'index', '200'], ['5', 'export', '200']]
+    assert "over budget" not in out
+    assert not models.Task.objects.exists()
+    with pytest.raises(CommandError):
+        call_command('benchmark_views', sizes=[5], views=['nonexistent'])
+
+
+@pytest.mark.django_db
+def test_export_data_command(admin_user, capsys, tmpdir):
+    models.Task.objects.create(user=admin_user, title="Exported")
+    call_command('export_data', 'admin', format='csv')
+    out, err = capsys.readouterr()
+    assert out.splitlines()[0].startswith('type,id,title')
+    assert out.splitlines()[1].startswith('task,')
+
+    output = tmpdir.join('export.jsonl.gz')
+    call_command('export_data', 'admin', gzip=True, output=str(output))
+    assert b'"title": "Exported"' in gzip.decompress(output.read_binary())
+
+
+@pytest.mark.django_db
+def test_import_data_command(admin_user, capsys, tmpdir):
+    data = tmpdir.join('tasks.csv')
+    data.write('type,id,title,folder\ntask,1,Imported,tasks\ntask,2,,inbox\n')
+    with pytest.raises(CommandError):
+        call_command('import_data', 'admin', str(data))
+    out, err = capsys.readouterr()
+    assert "Imported 0 tag(s), 0 project(s), 1 task(s)" in out
+    assert "Line 3: title: This field cannot be blank." in err
+    assert models.Task.objects.get(user=admin_user).folder == 'tasks'
+
+
+@pytest.mark.django_db
+def test_expire_trash_command(admin_user, capsys):
+    old = models.Task.objects.create(user=admin_user, title="Old", folder='trash')
+    models.Task.objects.create(user=admin_user, title="New", folder='trash')
+    models.Task.objects.create(user=admin_user, title="Kept", folder='inbox')
+    models.Task.objects.filter(title__in=["Old", "Kept"]).update(modified=timezone.now() - timedelta(days=31))
+    # Users are found by their tasks, even if the Trash badge is out of date.
+    models.AchieveProfile.objects.filter(user=admin_user).update(badge_trash=0)
+    call_command('expire_trash', days=30, sleep=0)
+    out, err = capsys.readouterr()
+    assert "Deleted 1 task(s) older than 30 day(s)" in out
+    assert not models.Task.objects.filter(pk=old.pk).exists()
+    assert sorted(models.Task.objects.values_list('title', flat=True)) == ["Kept", "New"]
+    assert models.AchieveProfile.objects.get(user=admin_user).badge_trash == 1
@@ -0,0 +1,24 @@
+"""Achieve context processor tests."""
+
+from achieve import cproc
+from achieve.models import Task
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+
+@pytest.mark.django_db
+def test_lazy_context(admin_user, rf, django_user_model):
+    Task.objects.create(user=admin_user, title="LazyPin", pinned=True)
+    request = rf.get('/')
+    request.user = django_user_model.objects.get(pk=admin_user.pk)
+    with CaptureQueriesContext(connection) as ctx:
+        badges = cproc.badges(request)['badges']
+        pinned = cproc.pinned(request)['pinned_items']
+    assert len(ctx.captured_queries) == 0
+
+    with CaptureQueriesContext(connection) as ctx:
+        assert badges['inbox'] == 1
+        assert badges['due_soon'] == 0
+    assert len(ctx.captured_queries) == 4  # profile, due soon recount (count, next due date, store)
+    assert [i.title for i in pinned] == ["LazyPin"]
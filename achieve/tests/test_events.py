@@ -0,0 +1,93 @@
+"""Achieve event hub tests."""
+
+import datetime
+import json
+
+from achieve import counters, events
+from achieve.models import Task
+from django.utils import timezone
+import pytest
+
+
+def _parse(stream):
+    """Parse a text/event-stream into (id, event, data) tuples, ignoring comments."""
+    parsed = []
+    for block in ''.join(stream).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if line and not line.startswith(':'))
+        if 'event' in fields:
+            parsed.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return parsed
+
+
+def test_hub():
+    hub = events.Hub(3)
+    hub.publish(1, 'a', {})
+    hub.publish(2, 'b', {})
+    hub.publish(1, 'c', {})
+    assert [e[1] for e in hub.since(1, 0)] == ['a', 'c']
+    assert [e[1] for e in hub.since(1, 1)] == ['c']
+    assert hub.since(3, 0) == []
+    assert hub.wait(1, 3, 0.01) == []
+
+    for i in range(3):
+        hub.publish(1, 'd', {})
+    # The first events were dropped from the buffer
+    assert hub.since(1, 1) is None
+    assert len(hub.since(1, 3)) == 3
+
+    assert hub.parse_id(hub.event_id(5)) == 5
+    assert hub.parse_id('other-5') is None
+    assert hub.parse_id(None) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reminder_stream(transactional_db, admin_user, rf, settings):
+    settings.ACHIEVE_EVENT_STREAM_DURATION = 0.2
+    settings.ACHIEVE_EVENT_HEARTBEAT = 0.05
+    request = rf.get('/api/reminders/stream/')
+    request.user = admin_user
+    soon = timezone.now() + datetime.timedelta(hours=1)
+    t1 = Task.objects.create(user=admin_user, title="Stream1", reminder=soon)
+    Task.objects.create(user=admin_user, title="Stream2")
+
+    stream = _parse(events.reminder_stream(request))
+    assert len(stream) == 1
+    last_id, event, data = stream[0]
+    assert event == 'snapshot'
+    assert [r['title'] for r in data['reminders']] == ["Stream1"]
+
+    t1.title = "Stream1 renamed"
+    t1.save()
+    t3 = Task.objects.create(user=admin_user, title="Stream3", reminder=soon)
+    t1.done = True
+    t1.save()
+    t3_pk = t3.pk
+    t3.delete()
+
+    stream = _parse(events.reminder_stream(request, last_id))
+    assert [(e, d.get('title', d['id'])) for i, e, d in stream[:4]] == [
+        ('reminder', "Stream1 renamed"), ('reminder', "Stream3"), ('cancel', t1.pk), ('cancel', t3_pk)]
+    assert len(stream) == 4
+
+    # Changes made by other processes are noticed at the next heartbeat
+    stream = events.reminder_stream(request, events.hub.event_id(events.hub.seq))
+    assert next(stream).startswith('retry: ')
+    counters.touch(admin_user.pk)
+    assert _parse([next(stream)]) == [(events.hub.event_id(events.hub.seq), 'snapshot', {'reminders': []})]
+
+    # IDs from another process get a snapshot
+    assert _parse(events.reminder_stream(request, 'other-1'))[0][1] == 'snapshot'
+
+
+@pytest.mark.django_db
+def test_reminder_stream_view(admin_client, settings):
+    # Disabled by default, browsers poll instead.
+    assert admin_client.get('/api/reminders/stream/').status_code == 204
+
+    settings.ACHIEVE_REMINDER_STREAM = True
+    settings.ACHIEVE_EVENT_STREAM_DURATION = 0.1
+    settings.ACHIEVE_EVENT_HEARTBEAT = 0.05
+    response = admin_client.get('/api/reminders/stream/')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/event-stream'
+    assert _parse([b''.join(response.streaming_content).decode('utf-8')])[0][1] == 'snapshot'
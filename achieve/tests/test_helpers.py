@@ -90,6 +90,7 @@ def test_update_slug(admin_user):
     assert tag2.slug == 'bar'
     assert tag3.slug == 'foo-1'
     assert tag4.slug == 'foo-2'
+    assert (tag1.slug_suffix, tag3.slug_suffix, tag4.slug_suffix) == (0, 1, 2)
 
     # Recalculation test
     helpers.update_slug(tag1, force=False, save=False)
@@ -99,7 +100,17 @@ def test_update_slug(admin_user):
     helpers.update_slug(tag2, force=True, save=True)
     assert tag2.slug == 'bar'
 
-    for tag in (tag1, tag2, tag3, tag4):
+    # Someone else took the slug in the meantime
+    tag5 = models.Tag()
+    tag5.title = "Foo"
+    tag5.user = admin_user
+    tag5.slugbase = 'foo'
+    tag5.slug = tag4.slug
+    tag5.slug_suffix = tag4.slug_suffix
+    tag5.save()
+    assert tag5.slug == 'foo-3'
+
+    for tag in (tag1, tag2, tag3, tag4, tag5):
         tag.delete()
 
 
@@ -187,3 +198,139 @@ def test_process_pagination(settings, admin_user, rf):
 
     for t in (t1, t2, t3):
         t.delete()
+
+
+def test_process_keyset_pagination(settings, admin_user, rf):
+    import datetime
+    import functools
+    from django.utils import timezone
+    base = timezone.now().replace(microsecond=0)
+    project = models.Project.objects.create(user=admin_user, title="keyset")
+    tasks = []
+    for i in range(11):
+        tasks.append(models.Task.objects.create(
+            user=admin_user, title="keyset{0}".format(i % 5), priority=i % 3,
+            due=None if i % 3 == 0 else base + datetime.timedelta(days=i % 4),
+            project=project if i % 2 else None, done=i % 4 == 0))
+    q = models.Task.objects.filter(user=admin_user)
+    settings.ACHIEVE_ITEMS_PER_PAGE = 3
+
+    def walk(order, direction='after', cursor=None):
+        pages = []
+        while True:
+            request = rf.get('/tasks/', {direction: cursor} if cursor else {})
+            page = helpers.process_keyset_pagination(request, q.order_by(*order))
+            pages.append([t.pk for t in page])
+            cursor = page.next_cursor if direction == 'after' else page.previous_cursor
+            if cursor is None:
+                return page, pages
+
+    def compare(order, a, b):
+        # NULLs sort last, the primary key breaks ties.
+        for name in order + ('pk',):
+            attname = name.lstrip('-').replace('project', 'project_id')
+            x, y = getattr(a, attname), getattr(b, attname)
+            if x == y:
+                continue
+            elif x is None or y is None:
+                return 1 if x is None else -1
+            return (1 if x > y else -1) * (-1 if name.startswith('-') else 1)
+        return 0
+
+    for order in (('done', '-due', '-added'), ('title',), ('-priority', 'due'), ('project', '-title')):
+        expected = [t.pk for t in sorted(tasks, key=functools.cmp_to_key(functools.partial(compare, order)))]
+        last, pages = walk(order)
+        assert sum(pages, []) == expected
+        assert [len(p) for p in pages] == [3, 3, 3, 2]
+        assert not last.has_next()
+
+        middle = models.Task.objects.get(pk=expected[7])
+        first, back = walk(order, 'before', helpers.encode_cursor(helpers.keyset_keys(q.order_by(*order)), middle))
+        assert not first.has_previous()
+        assert sum(reversed(back), []) == expected[:7]
+
+    # Invalid cursors and cursors for another order start at the beginning
+    cursor = helpers.encode_cursor(helpers.keyset_keys(q.order_by('title')), tasks[5])
+    first = [t.pk for t in helpers.process_keyset_pagination(rf.get('/tasks/'), q.order_by('-title'))]
+    for bad in ('garbage', cursor):
+        request = rf.get('/tasks/', {'after': bad})
+        assert [t.pk for t in helpers.process_keyset_pagination(request, q.order_by('-title'))] == first
+
+
+@pytest.mark.django_db
+def test_add_to_inbox_bulk(admin_client, admin_user):
+    request = admin_client.post("/").wsgi_request
+    helpers.add_to_inbox(request, "Bulk")
+    helpers.add_to_inbox(request, "Other 1")
+    helpers.add_to_inbox(request, "Other")
+
+    tasks = helpers.add_to_inbox_bulk(request, ["Bulk", "Bulk", "New", "Other"])
+    assert [t.slug for t in tasks] == ['bulk-1', 'bulk-2', 'new', 'other-2']
+    assert set(models.Task.objects.filter(user=admin_user).values_list('slug', flat=True)) == {
+        'bulk', 'bulk-1', 'bulk-2', 'new', 'other', 'other-1', 'other-2'}
+    assert models.AchieveProfile.objects.get(user=admin_user).badge_inbox == 7
+
+
+@pytest.mark.django_db
+def test_purge_tasks(admin_user, django_user_model):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    tag = models.Tag.objects.create(user=admin_user, title="Purged")
+    tasks = [models.Task.objects.create(user=admin_user, title="Purge {0}".format(i), folder='trash' if i < 5 else 'inbox')
+             for i in range(6)]
+    for t in tasks:
+        t.tags.add(tag)
+    other = models.Task.objects.create(user=django_user_model.objects.create(username='other'), title="Kept", folder='trash')
+
+    with CaptureQueriesContext(connection) as queries:
+        assert helpers.purge_tasks(models.Task.objects.filter(user=admin_user, folder='trash'), batch_size=2) == 5
+    # Three batches of a SELECT and two DELETEs, an empty SELECT, and one badge recount.
+    assert len([q for q in queries if q['sql'].startswith('DELETE')]) == 6
+    assert not any(q['sql'].startswith('SELECT "achieve_task"."id", "achieve_task"."title"') for q in queries)
+    assert list(models.Task.objects.filter(user=admin_user).values_list('title', flat=True)) == ["Purge 5"]
+    assert list(models.Task.tags.through.objects.values_list('task_id', flat=True)) == [tasks[5].pk]
+    assert models.Task.objects.filter(pk=other.pk).exists()
+    profile = models.AchieveProfile.objects.get(user=admin_user)
+    assert (profile.badge_trash, profile.badge_inbox) == (0, 1)
+
+
+@pytest.mark.django_db
+def test_bulk_update_tasks(admin_user):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    tag = models.Tag.objects.create(user=admin_user, title="Bulk")
+    project = models.Project.objects.create(user=admin_user, title="Bulk")
+    tasks = [models.Task.objects.create(user=admin_user, title="Bulk {0}".format(i), folder='inbox' if i < 3 else 'tasks')
+             for i in range(5)]
+    tasks[0].tags.add(tag)
+    selected = models.Task.objects.filter(user=admin_user)
+
+    def values(field):
+        return list(selected.order_by('pk').values_list(field, flat=True))
+
+    for action, value in (('done', None), ('priority', 3), ('project', project), ('pin', None)):
+        with CaptureQueriesContext(connection) as queries:
+            assert helpers.bulk_update_tasks(admin_user.pk, selected, action, value) == 5
+        assert len([q for q in queries if q['sql'].startswith('UPDATE "achieve_task"')]) == 1
+    assert values('folder') == ['tasks'] * 5
+    assert values('done') == [True] * 5
+    assert values('priority') == [3] * 5
+    assert values('project') == [project.pk] * 5
+    assert values('pinned') == [True] * 5
+
+    # Only tasks without the tag get a link
+    with CaptureQueriesContext(connection) as queries:
+        assert helpers.bulk_update_tasks(admin_user.pk, selected, 'add_tag', tag) == 4
+    assert len([q for q in queries if q['sql'].startswith('INSERT')]) == 1
+    assert tag.task_set.count() == 5
+    assert helpers.bulk_update_tasks(admin_user.pk, selected.filter(pk__in=[tasks[0].pk, tasks[1].pk]),
+                                     'remove_tag', tag) == 2
+    assert tag.task_set.count() == 3
+
+    helpers.bulk_update_tasks(admin_user.pk, selected.filter(pk=tasks[4].pk), 'trash')
+    helpers.bulk_update_tasks(admin_user.pk, selected.filter(pk=tasks[3].pk), 'undone')
+    helpers.bulk_update_tasks(admin_user.pk, selected.filter(pk=tasks[3].pk), 'folder', 'inbox')
+    profile = models.AchieveProfile.objects.get(user=admin_user)
+    assert (profile.badge_inbox, profile.badge_all_tasks, profile.badge_trash) == (1, 1, 1)
+    with pytest.raises(ValueError):
+        helpers.bulk_update_tasks(admin_user.pk, selected, 'explode')
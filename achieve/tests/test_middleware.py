@@ -0,0 +1,66 @@
+"""Achieve middleware tests."""
+
+import json
+import logging
+
+import pytest
+from django.db import connection
+
+from achieve.middleware import Timings, recording
+from achieve.models import Project, Task
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+def _server_timing(response):
+    return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+
+@pytest.mark.django_db
+def test_timing_disabled(admin_client):
+    assert 'Server-Timing' not in admin_client.get("/tasks/")
+
+
+@pytest.mark.django_db
+def test_timing_middleware(admin_user, admin_client, settings):
+    settings.ACHIEVE_TIMING = True
+    Task.objects.create(user=admin_user, title="Timed")
+    handler = _Records()
+    logger = logging.getLogger('achieve.timing')
+    logger.addHandler(handler)
+    try:
+        response = admin_client.get("/tasks/")
+    finally:
+        logger.removeHandler(handler)
+    metrics = _server_timing(response)
+    assert set(metrics) == {'db', 'tpl', 'total'}
+    assert metrics['db'].endswith('queries"') and not metrics['db'].endswith('desc="0 queries"')
+    records = handler.records
+    assert len(records) == 1
+    assert records[0]['event'] == 'request' and records[0]['path'] == '/tasks/'
+    assert records[0]['status'] == 200 and records[0]['user'] == admin_user.pk
+    assert records[0]['queries'] == int(metrics['db'].split('"')[1].split()[0])
+    assert records[0]['template_ms'] > 0 and records[0]['total_ms'] >= records[0]['sql_ms']
+    # The connection is back to normal cursors
+    assert 'make_cursor' not in connection.__dict__
+
+
+@pytest.mark.django_db
+def test_repeated_queries(admin_user):
+    projects = [Project.objects.create(user=admin_user, title="Repeated {0}".format(i)) for i in range(4)]
+    with recording(Timings(3)) as timings:
+        for project in Project.objects.filter(user=admin_user):
+            project.progress()  # a query per project
+        Task.objects.count()
+    [(sql, count, site)] = timings.repeated()
+    assert count == len(projects) and 'achieve_task' in sql
+    assert site.startswith('achieve/models.py:') and '(progress) < achieve/tests/test_middleware.py:' in site
+    assert timings.queries == len(projects) + 2
+    assert 'repeated;desc="1 statements, up to 4x"' in timings.server_timing()
@@ -0,0 +1,217 @@
+"""Achieve model tests."""
+
+import pytest
+from achieve import models
+
+
+@pytest.mark.django_db
+def test_stored_markdown(admin_user):
+    t = models.Task()
+    t.user = admin_user
+    t.title = "Markdown"
+    t.description = "**bold**"
+    t.save()
+
+    assert t.md_version == models.MD_VERSION
+    assert t.description_html == '<p><strong>bold</strong></p>'
+    assert t.resolution_html == ''
+    assert t.description_md() == t.description_html
+    assert 'No description' in models.Task(description='').description_md()
+
+    t.resolution = "<script>alert(1)</script>"
+    t.save()
+    assert '<script>' not in t.resolution_html
+
+    # Stale HTML is never shown
+    models.Task.objects.filter(pk=t.pk).update(md_version='old', description_html='stale')
+    t = models.Task.objects.get(pk=t.pk)
+    assert t.description_md() == '<p><strong>bold</strong></p>'
+    t.delete()
+
+
+def _make_project(user, title, done_states):
+    p = models.Project()
+    p.user = user
+    p.title = title
+    p.save()
+    for i, done in enumerate(done_states):
+        t = models.Task()
+        t.user = user
+        t.title = "{0} task {1}".format(title, i)
+        t.project = p
+        t.done = done
+        t.save()
+    return p
+
+
+@pytest.mark.django_db
+def test_project_progress(admin_user, rf):
+    from achieve import queries
+    request = rf.get('/projects/')
+    request.user = admin_user
+    p0 = _make_project(admin_user, "Progress empty", [])
+    p1 = _make_project(admin_user, "Progress half", [True, False])
+
+    assert p0.progress() == (0, 0)
+    assert p1.progress() == (1, 2)
+
+    annotated = {p.pk: p for p in queries.projects(request)}
+    assert annotated[p0.pk].progress() == (0, 0)
+    assert annotated[p1.pk].progress() == (1, 2)
+    assert 'aria-valuenow="1"' in annotated[p1.pk].progressbar()
+
+
+def _badges(user):
+    p = models.AchieveProfile.objects.get(user=user)
+    return (p.badge_inbox, p.badge_all_tasks, p.badge_trash, p.badge_projects)
+
+
+@pytest.mark.django_db
+def test_badge_deltas(admin_user):
+    from achieve import helpers
+    t = models.Task()
+    t.user = admin_user
+    t.title = "Badge task"
+    t.save()
+    assert _badges(admin_user) == (1, 1, 0, 0)
+
+    t.done = True
+    t.save()
+    assert _badges(admin_user) == (0, 0, 0, 0)
+
+    t = models.Task.objects.get(pk=t.pk)
+    t.done = False
+    t.folder = 'tasks'
+    t.save()
+    assert _badges(admin_user) == (0, 1, 0, 0)
+
+    t.folder = 'trash'
+    t.save()
+    assert _badges(admin_user) == (0, 0, 1, 0)
+
+    p = _make_project(admin_user, "Badge project", [])
+    assert _badges(admin_user) == (0, 0, 1, 1)
+    p.open = False
+    p.save()
+    assert _badges(admin_user) == (0, 0, 1, 0)
+
+    models.Task.objects.filter(pk=t.pk).delete()
+    assert _badges(admin_user) == (0, 0, 0, 0)
+
+    # Deltas agree with a full recount
+    _make_project(admin_user, "Badge project 2", [True, False])
+    expected = _badges(admin_user)
+    helpers.update_badges(models.User.objects.get(pk=admin_user.pk))
+    assert _badges(admin_user) == expected == (1, 1, 0, 1)
+
+
+@pytest.mark.django_db
+def test_badge_deltas_stale_copies(admin_user):
+    t = models.Task.objects.create(user=admin_user, title="Copied task")
+    first, second = models.Task.objects.get(pk=t.pk), models.Task.objects.get(pk=t.pk)
+    first.done = True
+    first.save()
+    second.done = True
+    second.save()
+    assert _badges(admin_user) == (0, 0, 0, 0)
+
+    second.done = False
+    second.save()
+    first.delete()
+    assert second.delete() == (0, {})
+    assert _badges(admin_user) == (0, 0, 0, 0)
+    assert not models.Task.objects.filter(pk=t.pk).exists()
+
+
+@pytest.mark.django_db
+def test_deferred_badges(admin_user):
+    from achieve import counters
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        with counters.deferred():
+            for i in range(5):
+                t = models.Task()
+                t.user = admin_user
+                t.title = "Deferred {0}".format(i)
+                t.save()
+            assert _badges(admin_user) == (0, 0, 0, 0)
+    profile_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "achieve_achieveprofile"')]
+    assert len(profile_updates) == 1
+    assert _badges(admin_user) == (5, 5, 0, 0)
+
+    # Changes rolled back with a nested block are discarded
+    with counters.deferred():
+        t.folder = 'trash'
+        t.save()
+        try:
+            with counters.deferred():
+                t2 = models.Task.objects.get(title="Deferred 0")
+                t2.done = True
+                t2.save()
+                raise ValueError
+        except ValueError:
+            pass
+    assert _badges(admin_user) == (4, 4, 1, 0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deferred_badges_on_commit(transactional_db, admin_user):
+    from achieve import counters
+    from django.db import connection
+    user = admin_user
+    assert not connection.in_atomic_block
+    with counters.deferred():
+        t = models.Task()
+        t.user = user
+        t.title = "Deferred until commit"
+        t.save()
+        assert _badges(user) == (0, 0, 0, 0)
+    assert _badges(user) == (1, 1, 0, 0)
+
+
+@pytest.mark.django_db
+def test_due_soon_badge(admin_user, django_user_model):
+    import datetime
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from achieve import counters
+
+    def badge():
+        user = django_user_model.objects.select_related('achieveprofile').get(pk=admin_user.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            value = counters.due_soon_badge(user)
+        return value, len(ctx.captured_queries), user.achieveprofile.badge_due_soon_expires
+
+    now = timezone.now()
+    t1 = models.Task.objects.create(user=admin_user, title="Due1", due=now + datetime.timedelta(hours=2))
+    t2 = models.Task.objects.create(user=admin_user, title="Due2", due=now + datetime.timedelta(hours=30))
+    models.Task.objects.create(user=admin_user, title="Due3")
+
+    count, queries, expires = badge()
+    assert (count, queries) == (1, 3)  # count, next due date, store
+    assert expires == t2.due - datetime.timedelta(days=1)
+    assert badge()[:2] == (1, 0)
+
+    # Unrelated changes keep the stored count
+    t2.title = "Due2 renamed"
+    t2.save()
+    assert badge()[:2] == (1, 0)
+
+    t2.due = now + datetime.timedelta(hours=3)
+    t2.save()
+    count, queries, expires = badge()
+    assert (count, queries) == (2, 3)
+    assert expires > now + datetime.timedelta(days=6)
+
+    t1.done = True
+    t1.save()
+    assert badge()[:2] == (1, 3)
+    t2.delete()
+    assert badge()[:2] == (0, 3)
+
+    # The count changes with time
+    models.AchieveProfile.objects.filter(user=admin_user).update(badge_due_soon_expires=now - datetime.timedelta(seconds=1))
+    assert badge()[:2] == (0, 3)
@@ -0,0 +1,68 @@
+"""Achieve reminder queue tests."""
+
+import datetime
+from unittest import mock
+
+from achieve import counters, scheduler
+from achieve.models import AchieveProfile, Task
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import pytest
+
+
+def test_user_queue():
+    queue = scheduler.UserQueue(0, [{'id': 1, 'timestamp': 30}, {'id': 2, 'timestamp': 10}])
+    queue.add({'id': 3, 'timestamp': 20})
+    assert [r['id'] for r in queue.before(25)] == [2, 3]
+    queue.add({'id': 2, 'timestamp': 40})
+    queue.remove(3)
+    queue.remove(4)
+    assert [r['id'] for r in queue.before(50)] == [1, 2]
+    assert queue.before(30) == []
+
+
+def _generation(user):
+    return AchieveProfile.objects.get(user=user).generation
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reminder_queue(transactional_db, admin_user):
+    queue = scheduler.queue
+    now = timezone.now()
+    t1 = Task.objects.create(user=admin_user, title="Queue1", reminder=now + datetime.timedelta(hours=1))
+    Task.objects.create(user=admin_user, title="Queue2", reminder=now + datetime.timedelta(days=3))
+    Task.objects.create(user=admin_user, title="Queue3", reminder=now, done=True)
+
+    generation = _generation(admin_user)
+    with CaptureQueriesContext(connection) as queries:
+        assert [r['title'] for r in queue.reminders_soon(admin_user, generation)] == ["Queue1"]
+        assert [r['title'] for r in queue.reminders_soon(admin_user, generation)] == ["Queue1"]
+    assert len(queries) == 1
+
+    # Committed changes are applied to the queue, which moves on to the new generation without a reload
+    t1.reminder = now + datetime.timedelta(days=4)
+    t1.save()
+    t4 = Task.objects.create(user=admin_user, title="Queue4", reminder=now - datetime.timedelta(hours=1))
+    t4.tags.create(user=admin_user, title="Tagged")
+    generation = _generation(admin_user)
+    with mock.patch.object(queue, 'load_user', side_effect=AssertionError("reloaded")):
+        assert [r['title'] for r in queue.upcoming(admin_user, generation, now + datetime.timedelta(days=5))] == [
+            "Queue4", "Queue2", "Queue1"]
+        assert [r['title'] for r in queue.reminders_soon(admin_user, generation)] == ["Queue4"]
+    assert queue.verify() == []
+
+    # Changes not seen by the queue are picked up when the generation changes
+    Task.objects.filter(pk=t4.pk).update(reminder_seen=True)
+    assert queue.verify() == [admin_user.pk]
+    assert [r['title'] for r in queue.reminders_soon(admin_user, generation)] == ["Queue4"]
+    counters.touch(admin_user.pk)
+    assert _generation(admin_user) == generation + 1
+    assert queue.reminders_soon(admin_user, generation + 1) == []
+    assert queue.verify() == []
+
+    # Generations committed by other processes are not skipped
+    AchieveProfile.objects.filter(user=admin_user).update(generation=F('generation') + 1)
+    Task.objects.create(user=admin_user, title="Queue5", reminder=now)
+    assert queue.queues[admin_user.pk].generation == generation + 1
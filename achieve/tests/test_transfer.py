@@ -0,0 +1,141 @@
+"""Achieve export and import tests."""
+
+import csv
+import gzip
+import io
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from achieve import transfer
+from achieve.models import MD_VERSION, AchieveProfile, Project, Tag, Task
+import pytest
+
+
+def _seed(user):
+    tag = Tag.objects.create(user=user, title="Work")
+    project = Project.objects.create(user=user, title="Report")
+    project.tags.add(tag)
+    tasks = [Task.objects.create(user=user, title="Export {0}".format(i), project=project if i % 2 else None)
+             for i in range(5)]
+    tasks[0].tags.add(tag)
+    tasks[1].folder = 'trash'
+    tasks[1].save()
+    return tag, project, tasks
+
+
+@pytest.mark.django_db
+def test_export_jsonl(admin_user, admin_client, django_user_model):
+    tag, project, tasks = _seed(admin_user)
+    _seed(django_user_model.objects.create(username='other'))
+
+    response = admin_client.get("/export/")
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert response['Content-Disposition'] == 'attachment; filename="achieve-admin.jsonl"'
+    records = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+    assert [r['type'] for r in records] == ['tag', 'project', 'project_tag'] + ['task'] * 5 + ['task_tag']
+    assert [r['title'] for r in records if r['type'] == 'task'] == ["Export {0}".format(i) for i in range(5)]
+    assert records[4]['project_id'] == project.pk and records[4]['folder'] == 'trash'
+    assert records[-1] == {'type': 'task_tag', 'task_id': tasks[0].pk, 'tag_id': tag.pk}
+
+    # Small chunks give the same export.
+    assert sorted(''.join(transfer.export_text(admin_user, chunk_size=2)).splitlines()) == sorted(
+        ''.join(transfer.export_text(admin_user)).splitlines())
+
+
+@pytest.mark.django_db
+def test_export_csv_gzip(admin_user, admin_client):
+    _seed(admin_user)
+
+    response = admin_client.get("/export/?format=csv&gzip=1")
+    assert response['Content-Type'] == 'application/gzip'
+    assert response['Content-Disposition'] == 'attachment; filename="achieve-admin.csv.gz"'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b''.join(response.streaming_content)).decode('utf-8'))))
+    assert len(rows) == 9
+    task = next(row for row in rows if row['type'] == 'task')
+    assert task['title'] == "Export 0" and task['done'] == 'false' and task['project_id'] == ''
+    records = [json.loads(line) for line in ''.join(transfer.export_text(admin_user)).splitlines()]
+    assert task['added'] == next(r for r in records if r['type'] == 'task')['added']
+
+    assert admin_client.get("/export/?format=xml").status_code == 400
+
+
+def _records(user):
+    """Export the data of a user, without IDs and times."""
+    records = [json.loads(line) for line in ''.join(transfer.export_text(user)).splitlines()]
+    ids = {}
+    for r in records:
+        if r['type'] in transfer.ITEMS:
+            ids[r['type'], r.pop('id')] = len(ids)
+            r.pop('added', None)
+            r.pop('modified', None)
+            r.pop('slug')
+        for kind in transfer.ITEMS:
+            if r.get(kind + '_id') is not None:
+                r[kind + '_id'] = ids[kind, r[kind + '_id']]
+    return sorted(records, key=lambda r: sorted((k, str(v)) for k, v in r.items()))
+
+
+@pytest.mark.django_db
+def test_import_roundtrip(admin_user, django_user_model):
+    _seed(admin_user)
+    Task.objects.filter(title="Export 2").update(pinned=True, done=True, due='2016-01-01T12:00:00Z')
+    other = django_user_model.objects.create(username='other')
+    Task.objects.create(user=other, title="Export 0")
+    export = ''.join(transfer.export_text(admin_user))
+
+    progress = []
+    importer = transfer.import_stream(other, io.StringIO(export), chunk_size=2, progress=progress.append)
+    assert importer.errors == []
+    assert importer.counts == {'tag': 1, 'project': 1, 'task': 5, 'project_tag': 1, 'task_tag': 1}
+    assert len(progress) >= 5
+    # Slugs are allocated for the new user.
+    assert sorted(Task.objects.filter(user=other, title="Export 0").values_list('slug', flat=True)) == [
+        'export-0', 'export-0-1']
+    Task.objects.filter(user=other, title="Export 0", tags=None).delete()
+    assert _records(other) == _records(admin_user)
+
+    profile = AchieveProfile.objects.get(user=other)
+    assert (profile.badge_inbox, profile.badge_all_tasks, profile.badge_trash, profile.badge_projects) == (3, 3, 1, 1)
+
+
+@pytest.mark.django_db
+def test_import_errors(admin_user):
+    data = "\n".join([
+        '{"type": "tag", "id": 1, "title": "Tag"}',
+        'not json',
+        '{"type": "task", "id": 1, "title": "Bad folder", "folder": "archive"}',
+        '{"type": "task", "id": 2, "title": "Orphan", "project_id": 5}',
+        '{"type": "task", "id": 3, "title": "Good", "due": "2016-01-01 12:00", "description": "*em*"}',
+        '{"type": "task", "id": 3, "title": "Duplicate"}',
+        '{"type": "task_tag", "task_id": 3, "tag_id": 2}',
+        '{"type": "task_tag", "task_id": 3, "tag_id": 1}',
+        '{"type": "comment", "id": 1}',
+    ])
+    importer = transfer.import_stream(admin_user, io.StringIO(data))
+    assert importer.counts == {'tag': 1, 'task': 1, 'task_tag': 1}
+    assert [e.split(':')[0] for e in importer.errors] == ['Line 2', 'Line 3', 'Line 4', 'Line 6', 'Line 7', 'Line 9']
+    task = Task.objects.get(user=admin_user)
+    assert task.title == "Good" and [t.title for t in task.tags.all()] == ["Tag"]
+    # Markdown is rendered on import.
+    assert (task.md_version, task.description_html) == (MD_VERSION, '<p><em>em</em></p>')
+    # Naive times are in the time zone of the user.
+    assert task.due.isoformat() == '2016-01-01T12:00:00+00:00'
+
+
+@pytest.mark.django_db
+def test_import_view(admin_user, admin_client, django_user_model):
+    _seed(django_user_model.objects.create(username='other'))
+    other = django_user_model.objects.get(username='other')
+    export = gzip.compress(b''.join(transfer.export_stream(other, 'csv')))
+
+    response = admin_client.post("/import/", {'file': SimpleUploadedFile('achieve-other.csv.gz', export)})
+    assert response.status_code == 200
+    assert b"Imported 1 tag(s), 1 project(s), 5 task(s), 1 project-tag(s), 1 task-tag(s)" in response.content
+    assert Task.objects.filter(user=admin_user).count() == 5
+    assert admin_user.achieveprofile.__class__.objects.get(user=admin_user).badge_all_tasks == 4
+
+    response = admin_client.post("/import/", {'file': SimpleUploadedFile('tasks.xlsx', b'data')})
+    assert b"Unknown import format" in response.content
+    response = admin_client.post("/import/", {'file': SimpleUploadedFile('tasks.jsonl.gz', b'not gzip')})
+    assert b"Cannot read the file" in response.content
@@ -4,7 +4,7 @@ import datetime
 import json
 import pytest
 import pytz
-from achieve.models import Task
+from achieve.models import Task, Project, Tag
 from django.utils import timezone
 
 
@@ -79,6 +79,93 @@ def test_tasklist(admin_user, admin_client):
         t.delete()
 
 
+@pytest.mark.django_db
+def test_tag_filters(admin_user, admin_client):
+    a, b, c = [Tag.objects.create(user=admin_user, title=title) for title in ("Alpha", "Beta", "Gamma")]
+    tasks = {}
+    for name, tags in (("TFOne", [a, b]), ("TFTwo", [a]), ("TFThree", [b, c]), ("TFFour", [])):
+        tasks[name] = Task.objects.create(user=admin_user, title=name, folder='tasks')
+        tasks[name].tags.add(*tags)
+
+    def titles(url):
+        content = admin_client.get(url).content.decode('utf-8')
+        return sorted(name for name in tasks for i in range(content.count('>{0}</a>'.format(name))))
+
+    assert titles("/tasks/") == ["TFFour", "TFOne", "TFThree", "TFTwo"]
+    assert titles("/tasks/?f-tags=alpha,+Beta") == ["TFOne"]
+    assert titles("/tasks/?f-tags=alpha,beta&f-tag_mode=any") == ["TFOne", "TFThree", "TFTwo"]
+    assert titles("/tasks/?f-exclude_tags=beta") == ["TFFour", "TFTwo"]
+    assert titles("/tasks/?f-tags=alpha&f-exclude_tags=beta,gamma") == ["TFTwo"]
+    assert titles("/tasks/?f-tags=alpha,missing") == []
+    assert titles("/tasks/?f-tags=missing&f-tag_mode=any") == []
+    assert titles("/tag/alpha/tasks/") == ["TFOne", "TFTwo"]
+    assert titles("/tag/alpha/tasks/?f-tags=beta") == ["TFOne"]
+
+
+@pytest.mark.django_db
+def test_trash_empty(admin_user, admin_client):
+    tag = Tag.objects.create(user=admin_user, title="Trashed")
+    for i in range(3):
+        Task.objects.create(user=admin_user, title="Trash {0}".format(i), folder='trash' if i else 'inbox').tags.add(tag)
+    # The confirmation page shows the navigation badges.
+    assert '<span class="badge">1</span>' in admin_client.get("/trash/empty/").content.decode('utf-8')
+    assert admin_client.post("/trash/empty/", {"really": "0"}).status_code == 302
+    assert Task.objects.filter(folder='trash').count() == 2
+    assert admin_client.post("/trash/empty/", {"really": "1"}).status_code == 302
+    assert list(Task.objects.values_list('title', flat=True)) == ["Trash 0"]
+    assert Task.tags.through.objects.count() == 1
+    assert admin_user.achieveprofile.__class__.objects.get(user=admin_user).badge_trash == 0
+
+
+@pytest.mark.django_db
+def test_bulk_actions(admin_user, admin_client, django_user_model):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    tag = Tag.objects.create(user=admin_user, title="Triage")
+    project = Project.objects.create(user=admin_user, title="Triage")
+    tasks = [Task.objects.create(user=admin_user, title="Bulk {0}".format(i), priority=1 + i % 2) for i in range(20)]
+    other = Task.objects.create(user=django_user_model.objects.create(username='bulkother'), title="Other")
+    content = admin_client.get("/inbox/").content.decode('utf-8')
+    assert 'id="bulk-form"' in content and 'name="b-tasks" value="{0}"'.format(tasks[-1].pk) in content
+
+    def post(url, tasks=(), **data):
+        data = {'b-' + name: value for name, value in data.items()}
+        data['b-tasks'] = [t.pk for t in tasks]
+        data.setdefault('b-scope', 'selected')
+        return admin_client.post(url, data)
+
+    # The number of queries does not depend on the number of tasks.
+    counts = []
+    for selected in (tasks[:2], tasks[2:12] + [other]):
+        with CaptureQueriesContext(connection) as ctx:
+            response = post("/inbox/", selected, action='project', project=project.pk)
+        assert response.status_code == 302 and response['Location'] == '/inbox/'
+        counts.append(len(ctx.captured_queries))
+    assert counts[0] == counts[1]
+    assert Task.objects.filter(project=project).count() == 12
+    assert Task.objects.get(pk=other.pk).project is None
+
+    # All tasks matching the filters, in one request
+    assert post("/inbox/?f-priority=2", action='add_tag', tag=tag.pk, scope='all').status_code == 302
+    assert sorted(tag.task_set.values_list('priority', flat=True)) == [2] * 10
+    assert post("/inbox/", tasks[:5], action='done').status_code == 302
+    assert Task.objects.filter(done=True, folder='tasks').count() == 5
+    assert admin_user.achieveprofile.__class__.objects.get(user=admin_user).badge_inbox == 15
+    assert post("/tag/triage/tasks/", action='trash', scope='all').status_code == 302
+    assert Task.objects.filter(folder='trash').count() == 10
+    assert post("/trash/", tasks[1:2], action='folder', folder='inbox').status_code == 302
+    assert Task.objects.get(pk=tasks[1].pk).folder == 'inbox'
+    assert post("/project/triage/", tasks[2:4], action='pin').status_code == 302
+    assert list(Task.objects.filter(pinned=True).values_list('pk', flat=True)) == [tasks[2].pk]
+    assert b"Bulk 2" in admin_client.get("/inbox/").content  # pinned in the sidebar
+    assert Project.objects.get(pk=project.pk).title == "Triage"
+
+    assert post("/inbox/", action='done').status_code == 400
+    assert post("/inbox/", tasks[:1], action='add_tag').status_code == 400
+    assert post("/inbox/", tasks[:1], action='explode').status_code == 400
+    assert post("/inbox/", tasks[:1], action='priority', priority=32768).status_code == 400
+
+
 @pytest.mark.django_db
 def test_reminders_soon(admin_user, admin_client):
     title = "ReminderTest"
@@ -118,3 +205,144 @@ def test_reminders_soon(admin_user, admin_client):
     assert len(data['reminders']) == 0
 
     t.delete()
+
+
+@pytest.mark.django_db
+def test_projects_progress_filter(admin_user, admin_client, django_user_model):
+    from achieve.tests.test_models import _make_project
+    _make_project(admin_user, "PFT1", [])
+    _make_project(admin_user, "PFT2", [False, False])
+    _make_project(admin_user, "PFT3", [True, False])
+    _make_project(admin_user, "PFT4", [True, True])
+    other = django_user_model.objects.create(username='progress_other')
+    _make_project(other, "PFT5", [True])
+
+    def visible(progress):
+        content = admin_client.get("/projects/?pf-progress=" + progress).content
+        return [i for i in range(1, 6) if "PFT{0}".format(i).encode('ascii') in content]
+
+    assert visible('0') == [1, 2]
+    assert visible('50') == [3]
+    assert visible('100') == [4]
+
+
+@pytest.mark.django_db
+def test_collection(admin_user, admin_client):
+    request = admin_client.post("/collection/", {"collection-box": "CT1\nCT2\n\n CT3 \n"})
+    assert request.status_code == 200
+    assert b"3 tasks were added." in request.content
+    assert list(Task.objects.filter(user=admin_user).order_by('title').values_list('title', flat=True)) == ['CT1', 'CT2', 'CT3']
+    admin_user.achieveprofile.refresh_from_db()
+    assert admin_user.achieveprofile.badge_inbox == 3
+
+
+@pytest.mark.django_db
+def test_search(admin_user, admin_client, django_user_model):
+    from achieve import fulltext
+    from achieve.models import Project, Tag
+    Task.objects.create(user=admin_user, title="Write report", description="quarterly numbers")
+    Task.objects.create(user=admin_user, title="Call Bob", description="about the report draft")
+    Task.objects.create(user=admin_user, title="Water plants")
+    Task.objects.create(user=admin_user, title="Old report", folder='trash')
+    Project.objects.create(user=admin_user, title="Reporting", description="")
+    Tag.objects.create(user=admin_user, title="reports")
+    other = django_user_model.objects.create(username='search_other')
+    Task.objects.create(user=other, title="Secret report")
+
+    backend = fulltext.get_backend()
+    assert isinstance(backend, fulltext.SQLiteSearchBackend)
+    request = admin_client.get("/search/?q=repor").wsgi_request
+    from achieve import queries
+    assert [t.title for t in backend.search(queries.all_tasks(request), "repor", 10)] == ["Write report", "Call Bob"]
+    assert [t.title for t in backend.search(queries.all_tasks(request), "draft report!", 10)] == ["Call Bob"]
+
+    content = admin_client.get("/search/?q=repor").content
+    assert b"Write report" in content
+    assert b"Call Bob" in content
+    assert b"Reporting" in content
+    assert b"reports" in content
+    assert b"Water plants" not in content
+    assert b"Old report" not in content
+    assert b"Secret report" not in content
+
+    # Edits are picked up by the index
+    Task.objects.filter(title="Water plants").update(description="report on growth")
+    content = admin_client.get("/tasks/?f-search=report").content
+    assert b"Water plants" in content
+    assert b"Old report" not in content
+    Task.objects.filter(title="Write report").delete()
+    assert b"Write report" not in admin_client.get("/tasks/?f-search=report").content
+
+
+@pytest.mark.django_db
+def test_tasks_keyset_pagination(admin_user, admin_client, settings):
+    import re
+    settings.ACHIEVE_ITEMS_PER_PAGE = 2
+    for i in range(3):
+        Task.objects.create(user=admin_user, title="KP{0}".format(i))
+    content = admin_client.get("/tasks/?s_title=asc").content.decode('utf-8')
+    assert "KP0" in content and "KP1" in content and "KP2" not in content
+    next_url = re.search(r'href="\?([^"]*after=[^"]*)"', content).group(1).replace('&amp;', '&')
+    content = admin_client.get("/tasks/?" + next_url).content.decode('utf-8')
+    assert "KP2" in content and "KP0" not in content
+    assert re.search(r'href="\?[^"]*before=', content)
+
+
+@pytest.mark.django_db
+def test_conditional_get(admin_user, admin_client):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    task = Task.objects.create(user=admin_user, title="CondTask")
+    admin_client.get("/")  # set the CSRF cookie
+    for url in ("/inbox/", "/", "/api/reminders/soon/"):
+        response = admin_client.get(url)
+        assert response.status_code == 200
+        assert 'no-cache' in response['Cache-Control']
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert not any('"achieve_task"' in q['sql'] for q in ctx.captured_queries)
+
+    etag = admin_client.get("/inbox/")['ETag']
+    task.title = "CondTask renamed"
+    task.save()
+    response = admin_client.get("/inbox/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"CondTask renamed" in response.content
+
+    etag = response['ETag']
+    task.tags.create(user=admin_user, title="CondTag")
+    assert admin_client.get("/inbox/", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_jinja2_pages(admin_user, admin_client, settings):
+    import re
+    from django.test import override_settings
+    pytest.importorskip('jinja2')
+    project = Project.objects.create(user=admin_user, title="Jinja <Project>", description="*md*")
+    tag = Tag.objects.create(user=admin_user, title="JinjaTag")
+    task = Task.objects.create(user=admin_user, title="Jinja & Task", project=project,
+                               due=timezone.now() - datetime.timedelta(hours=1), pinned=True)
+    task.tags.add(tag)
+    urls = ['/', '/tasks/?s_title=asc', '/projects/', '/tags/', '/trash/', task.get_absolute_url(),
+            project.get_absolute_url(), tag.get_absolute_url(), '/search/?q=Jinja', '/add/', '/profile/',
+            '/import/']
+
+    def render(engine):
+        templates = sorted(settings.TEMPLATES, key=lambda t: t['NAME'] != engine)
+        pages = []
+        with override_settings(TEMPLATES=templates):
+            for url in urls:
+                response = admin_client.get(url)
+                assert response.status_code == 200
+                # The test client only records Django templates
+                assert bool(response.templates) == (engine == 'django')
+                # CSRF tokens are salted differently for every render
+                content = re.sub(r'<input type=.hidden. name=.csrfmiddlewaretoken. [^>]*>', '', response.content.decode())
+                pages.append([line.strip() for line in content.splitlines() if line.strip()])
+        return pages
+
+    assert render('jinja2') == render('django')
@@ -0,0 +1,421 @@
+"""Export and import of user data.
+
+The tasks, projects and tags of a user, and the links between them, are
+exported as JSON Lines (one JSON object per line) or as CSV (one row per
+record, with the columns of all record types).  Every record has a type
+(see RECORDS) and refers to other records by their IDs.
+
+Records are read in primary key order, a chunk at a time, and written as
+they are read, so exports of any size are streamed in constant memory.
+
+Imports read the same formats as a stream.  Records are validated, and
+collected into chunks that are inserted with bulk_create (see Importer).
+The IDs of the records only link them to each other; imported items get
+new IDs and slugs, and the time of the import as their added and modified
+times.
+"""
+
+import collections
+import csv
+import gzip
+import io
+import json
+import time
+
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+from django.utils.text import compress_sequence
+
+from achieve import queries
+from achieve.helpers import bulk_create_slugged, update_badges
+from achieve.models import Task, Project, Tag
+
+TAG_FIELDS = ('id', 'title', 'slug', 'pinned')
+PROJECT_FIELDS = ('id', 'title', 'slug', 'description', 'priority', 'open', 'pinned', 'added', 'modified')
+TASK_FIELDS = ('id', 'title', 'slug', 'description', 'resolution', 'project_id', 'priority', 'done', 'folder', 'due',
+               'reminder', 'reminder_seen', 'pinned', 'added', 'modified')
+
+# Record types, with their queries and fields, in the order they are exported.  The
+# links of projects and tasks to tags are exported after each chunk of them.
+RECORDS = [
+    ('tag', queries.tags_user, TAG_FIELDS, None),
+    ('project', queries.projects_user, PROJECT_FIELDS, ('project_tag', queries.project_tags, ('project_id', 'tag_id'))),
+    ('task', queries.tasks_user, TASK_FIELDS, ('task_tag', queries.task_tags, ('task_id', 'tag_id'))),
+]
+
+# CSV columns: the record type and the fields of all record types.
+CSV_COLUMNS = ['type'] + list(collections.OrderedDict.fromkeys(
+    field for kind, query, fields, links in RECORDS for field in fields + (links[2] if links else ())))
+
+# Number of rows read per query.
+CHUNK_SIZE = 1000
+
+
+def chunked_values(queryset, fields, chunk_size=CHUNK_SIZE):
+    """Get the rows of a queryset as lists of dicts of `fields` (and `pk`), in primary key order."""
+    queryset = queryset.values('pk', *fields).order_by('pk')
+    last = None
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(pk__gt=last))[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1]['pk']
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+
+
+def jsonl_rows(kind, rows):
+    """Format rows of a record type as JSON Lines."""
+    return ''.join(json.dumps(dict(row, type=kind), cls=DjangoJSONEncoder, sort_keys=True) + '\n' for row in rows)
+
+
+def csv_value(value, encoder=DjangoJSONEncoder()):
+    """Format a value for CSV, like it is formatted in JSON."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, str)):
+        return value
+    return encoder.default(value)
+
+
+def csv_rows(kind, rows):
+    """Format rows of a record type as CSV."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow([kind] + [csv_value(row.get(column)) for column in CSV_COLUMNS[1:]])
+    return out.getvalue()
+
+
+def csv_header():
+    """Get the CSV header row."""
+    out = io.StringIO()
+    csv.writer(out).writerow(CSV_COLUMNS)
+    return out.getvalue()
+
+
+# Export formats: content type, file extension, header and row formatter.
+EXPORT_FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl', lambda: '', jsonl_rows),
+    'csv': ('text/csv', 'csv', csv_header, csv_rows),
+}
+
+
+def export_text(user, format='jsonl', chunk_size=CHUNK_SIZE):
+    """Export the data of a user, yielding the text of a chunk of rows at a time."""
+    content_type, extension, header, formatter = EXPORT_FORMATS[format]
+    yield header()
+    for kind, query, fields, links in RECORDS:
+        for rows in chunked_values(query(user), fields, chunk_size):
+            pks = [row.pop('pk') for row in rows]
+            yield formatter(kind, rows)
+            if links:
+                link_kind, link_query, link_fields = links
+                yield formatter(link_kind, link_query(pks).order_by('pk').values(*link_fields))
+
+
+def export_stream(user, format='jsonl', compress=False, chunk_size=CHUNK_SIZE):
+    """Export the data of a user as a stream of bytes, gzip compressed if `compress` is true."""
+    chunks = (text.encode('utf-8') for text in export_text(user, format, chunk_size) if text)
+    return compress_sequence(chunks) if compress else chunks
+
+
+def export_filename(user, format='jsonl', compress=False):
+    """Get the file name of an export."""
+    return 'achieve-{0}.{1}{2}'.format(user.username, EXPORT_FORMATS[format][1], '.gz' if compress else '')
+
+
+# Imported item types: model and the fields set from records.  IDs, slugs and
+# times are not imported, references to other items are mapped separately.
+ITEMS = collections.OrderedDict([
+    ('tag', (Tag, ('title', 'pinned'))),
+    ('project', (Project, ('title', 'description', 'priority', 'open', 'pinned'))),
+    ('task', (Task, ('title', 'description', 'resolution', 'priority', 'done', 'folder', 'due', 'reminder',
+                     'reminder_seen', 'pinned'))),
+])
+
+# Imported link types: through model, and the item types they link.
+LINKS = collections.OrderedDict([
+    ('project_tag', (Project.tags.through, ('project', 'tag'))),
+    ('task_tag', (Task.tags.through, ('task', 'tag'))),
+])
+
+# Stop reporting errors after this many.
+MAX_ERRORS = 20
+
+
+class InvalidRecord(Exception):
+    """Raised for records that cannot be imported."""
+
+
+def read_jsonl(stream):
+    """Read records from a JSON Lines stream, as (line number, record) pairs.
+
+    Lines that are not valid JSON give None.
+    """
+    for lineno, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield lineno, json.loads(line)
+            except ValueError:
+                yield lineno, None
+
+
+def read_csv(stream):
+    """Read records from a CSV stream, as (line number, record) pairs.
+
+    Empty values are read as missing (None).
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {key: value for key, value in row.items() if value != ''}
+
+
+# Import formats: record reader.
+IMPORT_FORMATS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+def import_format(filename):
+    """Get the import format of a file and whether it is gzip compressed, from its name."""
+    name = filename.lower()
+    compressed = name.endswith('.gz')
+    if compressed:
+        name = name[:-3]
+    extension = name.rpartition('.')[2]
+    if extension not in IMPORT_FORMATS:
+        raise ValueError("Unknown import format (expected {0}, optionally with .gz).".format(
+            ', '.join('.' + format for format in sorted(IMPORT_FORMATS))))
+    return extension, compressed
+
+
+def open_import(fileobj, compressed=False):
+    """Open a binary file object for reading records as text."""
+    if compressed:
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    return io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+
+
+def clean_value(field, value, tz):
+    """Validate a value from a record for a model field, and convert it."""
+    if value is None:
+        if field.null:
+            return None
+        value = field.get_default()
+    if isinstance(field, models.BooleanField) and isinstance(value, str):
+        value = {'true': True, 'false': False}.get(value.lower(), value)
+    value = field.clean(value, None)
+    if isinstance(field, models.DateTimeField) and value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, tz)
+    return value
+
+
+def reference(record, name):
+    """Get an ID referenced by a record, or None."""
+    value = record.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord("Invalid {0}: {1!r}.".format(name, value))
+
+
+class Importer(object):
+    """Import records into the data of a user.
+
+    Items are collected into chunks, which are inserted with bulk_create
+    when they are full, or earlier if a later record refers to them.  Links
+    to tags are inserted directly into the through tables.  Badges are
+    recounted once, by finish().
+    """
+
+    def __init__(self, user, chunk_size=CHUNK_SIZE, progress=None):
+        """Create an importer.  `progress` is called with the importer after every chunk."""
+        self.user = user
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.tz = pytz.timezone(user.achieveprofile.timezone)
+        # IDs of records mapped to the IDs of the items imported for them.
+        self.ids = {kind: {} for kind in ITEMS}
+        # Items and links waiting to be inserted, by type.
+        self.pending = {kind: collections.OrderedDict() for kind in ITEMS}
+        self.pending_links = {kind: set() for kind in LINKS}
+        self.linked = {kind: set() for kind in LINKS}
+        self.counts = collections.Counter()
+        self.errors = []
+        self.error_count = 0
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        """Get the time since the import started, in seconds."""
+        return time.perf_counter() - self.start
+
+    @property
+    def imported(self):
+        """Get the number of imported records."""
+        return sum(self.counts.values())
+
+    def add(self, lineno, record):
+        """Validate a record and queue it for import, or record why it is invalid."""
+        try:
+            if not isinstance(record, dict):
+                raise InvalidRecord("Not a JSON object.")
+            kind = record.get('type')
+            if kind in ITEMS:
+                self.add_item(kind, record)
+            elif kind in LINKS:
+                self.add_link(kind, record)
+            else:
+                raise InvalidRecord("Unknown record type: {0!r}.".format(kind))
+        except InvalidRecord as e:
+            self.error(lineno, str(e))
+        except ValidationError as e:
+            self.error(lineno, ' '.join(e.messages))
+
+    def error(self, lineno, message):
+        """Record an invalid record."""
+        self.fail("Line {0}: {1}".format(lineno, message))
+
+    def fail(self, message):
+        """Record an error."""
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def resolve(self, kind, record_id):
+        """Check that a record of type `kind` was imported, inserting it if it is pending."""
+        if record_id in self.pending[kind]:
+            self.flush(kind)
+        if record_id not in self.ids[kind]:
+            raise InvalidRecord("Unknown {0}: {1}.".format(kind, record_id))
+        return self.ids[kind][record_id]
+
+    def add_item(self, kind, record):
+        """Queue an item for import."""
+        model, fields = ITEMS[kind]
+        record_id = reference(record, 'id')
+        if record_id is None:
+            raise InvalidRecord("Missing id.")
+        if record_id in self.ids[kind] or record_id in self.pending[kind]:
+            raise InvalidRecord("Duplicate {0} id: {1}.".format(kind, record_id))
+        obj = model(user=self.user)
+        for name in fields:
+            try:
+                setattr(obj, name, clean_value(model._meta.get_field(name), record.get(name), self.tz))
+            except ValidationError as e:
+                raise InvalidRecord("{0}: {1}".format(name, ' '.join(e.messages)))
+        if kind == 'task':
+            project_id = reference(record, 'project_id')
+            if project_id is not None:
+                obj.project_id = self.resolve('project', project_id)
+        self.pending[kind][record_id] = obj
+        if len(self.pending[kind]) >= self.chunk_size:
+            self.flush(kind)
+
+    def add_link(self, kind, record):
+        """Queue a link to a tag for import."""
+        through, (item_kind, tag_kind) = LINKS[kind]
+        item_id = reference(record, item_kind + '_id')
+        tag_id = reference(record, tag_kind + '_id')
+        if item_id is None or tag_id is None:
+            raise InvalidRecord("Missing {0}_id or {1}_id.".format(item_kind, tag_kind))
+        link = (self.resolve(item_kind, item_id), self.resolve(tag_kind, tag_id))
+        if link in self.linked[kind] or link in self.pending_links[kind]:
+            raise InvalidRecord("Duplicate {0}: {1}, {2}.".format(kind, item_id, tag_id))
+        self.pending_links[kind].add(link)
+        if len(self.pending_links[kind]) >= self.chunk_size:
+            self.flush_links(kind)
+
+    def flush(self, kind):
+        """Insert the pending items of a type."""
+        pending = self.pending[kind]
+        if not pending:
+            return
+        model = ITEMS[kind][0]
+        objs = list(pending.values())
+        bulk_create_slugged(model, self.user.pk, objs)
+        if any(obj.pk is None for obj in objs):
+            # Only PostgreSQL returns the IDs of bulk-created rows, find them by slug.
+            slugs = [obj.slug for obj in objs]
+            size = settings.ACHIEVE_BULK_BATCH_SIZE
+            ids = {}
+            for i in range(0, len(slugs), size):
+                ids.update(model.objects.filter(user=self.user, slug__in=slugs[i:i + size]).values_list('slug', 'pk'))
+            for obj in objs:
+                obj.pk = ids[obj.slug]
+        for record_id, obj in pending.items():
+            self.ids[kind][record_id] = obj.pk
+        self.counts[kind] += len(objs)
+        pending.clear()
+        self.report()
+
+    def flush_links(self, kind):
+        """Insert the pending links of a type."""
+        pending = self.pending_links[kind]
+        if not pending:
+            return
+        through, (item_kind, tag_kind) = LINKS[kind]
+        through.objects.bulk_create(
+            [through(**{item_kind + '_id': item_id, tag_kind + '_id': tag_id}) for item_id, tag_id in sorted(pending)],
+            batch_size=settings.ACHIEVE_BULK_BATCH_SIZE)
+        self.linked[kind] |= pending
+        self.counts[kind] += len(pending)
+        pending.clear()
+        self.report()
+
+    def report(self):
+        """Report progress."""
+        if self.progress is not None:
+            self.progress(self)
+
+    def finish(self):
+        """Insert everything that is pending and update badges and caches."""
+        try:
+            for kind in ITEMS:
+                self.flush(kind)
+            for kind in LINKS:
+                self.flush_links(kind)
+        finally:
+            if self.imported:
+                update_badges(self.user)
+        return self
+
+
+def import_stream(user, stream, format='jsonl', chunk_size=CHUNK_SIZE, progress=None):
+    """Import records from a text stream into the data of a user, and return the Importer."""
+    importer = Importer(user, chunk_size, progress)
+    records = IMPORT_FORMATS[format](stream)
+    try:
+        while True:
+            try:
+                lineno, record = next(records)
+            except StopIteration:
+                break
+            except (ValueError, OSError, EOFError, csv.Error) as e:
+                # Not UTF-8, not gzip compressed, truncated, or broken CSV.
+                importer.fail("Cannot read the file: {0}".format(e))
+                break
+            importer.add(lineno, record)
+    finally:
+        importer.finish()
+    return importer
+
+
+def import_summary(importer):
+    """Describe the result of an import."""
+    counts = ', '.join('{0} {1}(s)'.format(importer.counts[kind], kind.replace('_', '-'))
+                       for kind in list(ITEMS) + list(LINKS))
+    elapsed = importer.elapsed
+    return "Imported {0} in {1:.2f} s ({2:.0f} records/s).".format(
+        counts, elapsed, importer.imported / elapsed if elapsed else 0)
@@ -8,6 +8,7 @@ urlpatterns = [
     url(r'^quick_add/$', views.quick_add, name='quick_add'),
     url(r'^add/$', views.AddTaskView.as_view(), name='add'),
     url(r'^collection/$', views.collection, name='collection'),
+    url(r'^search/$', views.search, name='search'),
     url(r'^tags/$', views.tags, name='tags'),
     url(r'^tag/(?P<slug>[a-zA-Z0-9-_]+)/$', views.tag, name='tag'),
     url(r'^tag/(?P<slug>[a-zA-Z0-9-_]+)/projects/$', views.TagProjectsView.as_view(), name='projects_with_tag'),
@@ -21,5 +22,8 @@ urlpatterns = [
     url(r'^soon/$', views.DueSoonView.as_view(), name='due_soon'),
     url(r'^trash/$', views.TrashView.as_view(), name='trash'),
     url(r'^trash/empty/$', views.trash_empty, name='trash_empty'),
+    url(r'^export/$', views.export, name='export'),
+    url(r'^import/$', views.import_data, name='import_data'),
     url(r'^api/reminders/soon/$', views.api_reminders_soon, name='reminders_soon'),
+    url(r'^api/reminders/stream/$', views.api_reminders_stream, name='reminders_stream'),
 ]
@@ -7,16 +7,18 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect, JsonResponse
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.html import format_html
 from django.views.generic import View
 
-from achieve import queries
-from achieve.forms import AddEditTaskForm, AddEditProjectForm, AddEditTagForm, TaskFilterForm, ProjectFilterForm, AchieveProfileForm
-from achieve.helpers import next_page, undo_btn, add_to_inbox, process_pagination, update_badges
+from achieve import counters, events, fulltext, queries, scheduler, transfer
+from achieve.conditional import conditional_page
+from achieve.forms import AddEditTaskForm, AddEditProjectForm, AddEditTagForm, TaskFilterForm, ProjectFilterForm, AchieveProfileForm, ImportForm, BulkTaskForm
+from achieve.helpers import next_page, undo_btn, add_to_inbox, add_to_inbox_bulk, bulk_update_tasks, process_pagination, process_keyset_pagination, purge_tasks, update_badges
 from achieve.models import Task, Tag, Project
 
 # Generic views
@@ -32,14 +34,20 @@ class AchieveListView(View):
     sortable = ()
     default_sort = ()
     sort_prefix = ''
+    # 'pages' (numbered pages) or 'keyset' (previous/next cursors, no COUNT or OFFSET)
+    pagination = 'pages'
 
     @method_decorator(login_required)
+    @method_decorator(conditional_page)
     def get(self, request, *args, **kwargs):
         filter_form = self.filter_form(request.GET)
         if filter_form.is_valid():
             table = self.process_filters(request, args, kwargs, filter_form)
         table = self.process_sorting(request, table)
-        table = process_pagination(request, table)
+        if self.pagination == 'keyset':
+            table = process_keyset_pagination(request, table)
+        else:
+            table = process_pagination(request, table)
         if len(filter_form.data) > 1:  # filters were used, no pagination
             empty_msg = self.filtered_msg
         else:
@@ -109,11 +117,20 @@ class TaskListView(AchieveListView):
         if priority:
             q = q.filter(priority=int(priority))
 
-        # Filter: tags (select)
-        tags = request.GET.get("TEMP_tags")
-        if tags is not None:
-            # TODO: does this work?
-            q = q.filter(tags__in=tags.split(','))
+        # Filter: tags (all or any of them) and excluded tags (comma-separated slugs)
+        tags = filter_form.cleaned_data['tags']
+        if tags:
+            tag_ids = list(queries.tags_by_slug(request, tags).values_list('pk', flat=True))
+            if filter_form.cleaned_data['tag_mode'] == 'any':
+                q = queries.with_any_tags(q, tag_ids)
+            elif len(tag_ids) < len(tags):
+                # An unknown tag, no task has all of them.
+                q = q.none()
+            else:
+                q = queries.with_all_tags(q, tag_ids)
+        exclude_tags = filter_form.cleaned_data['exclude_tags']
+        if exclude_tags:
+            q = queries.without_tags(q, queries.tags_by_slug(request, exclude_tags).values_list('pk', flat=True))
 
         # Filter: folder (select) -- TODO, is this needed?
 
@@ -146,17 +163,37 @@ class TaskListView(AchieveListView):
             indexes = [int(i) for i in projects.split(',')]
             q = q.filter(project__in=indexes)
 
-        # Search (TODO)
+        # Search
         search = filter_form.cleaned_data['search']
         if search:
-            q = q.filter(title__icontains=search)
+            q = fulltext.get_backend().filter(q, search)
 
         return q
 
     def process_context(self, request, context):
-        """Add new_location to the context."""
+        """Add new_location and the bulk action form to the context."""
         context['new_location'] = self.new_location
         context['show_add_button'] = self.show_add_button
+        context['bulk_form'] = BulkTaskForm(request.user)
+
+    @method_decorator(login_required)
+    def post(self, request, *args, **kwargs):
+        """Apply a bulk action to the selected tasks, or to all tasks matching the filters."""
+        form = BulkTaskForm(request.user, request.POST)
+        if not form.is_valid():
+            errors = [e for field_errors in form.errors.values() for e in field_errors]
+            return render(request, "achieve/error.html", {"message": " ".join(errors)}, status=400)
+        filter_form = self.filter_form(request.GET)
+        if filter_form.is_valid():
+            tasks = self.process_filters(request, args, kwargs, filter_form)
+        else:
+            tasks = self.query(request, *args, **kwargs)
+        if form.cleaned_data['scope'] == 'selected':
+            tasks = tasks.filter(pk__in=form.cleaned_data['tasks'])
+        changed = bulk_update_tasks(request.user.pk, tasks, form.cleaned_data['action'], form.value())
+        messages.success(request, "{0}: {1} task{2} changed.".format(
+            dict(form.fields['action'].choices)[form.cleaned_data['action']], changed, '' if changed == 1 else 's'))
+        return HttpResponseRedirect(request.get_full_path())
 
 
 class AddView(View):
@@ -193,6 +230,7 @@ class AddView(View):
 # List views (implement TaskListView)
 
 
+@conditional_page
 def index(request):
     """Show the public index page or the dashboard."""
     if not request.user.is_authenticated():
@@ -226,6 +264,7 @@ class AllTasksView(TaskListView):
     query = staticmethod(queries.all_tasks)
     badge_name = 'all_tasks'
     empty_msg = "You have no tasks — time to add some!"
+    pagination = 'keyset'
 
 
 class TrashView(TaskListView):
@@ -235,6 +274,7 @@ class TrashView(TaskListView):
     empty_msg = 'The trash is empty.'
     template = 'achieve/trash.html'
     show_add_button = False
+    pagination = 'keyset'
 
 
 class DueSoonView(TaskListView):
@@ -272,26 +312,24 @@ class ProjectsView(AchieveListView):
         if priority:
             q = q.filter(priority=int(priority))
 
-        # Filter: progress
+        # Filter: progress (uses annotations from queries.with_progress)
         progress_f = filter_form.cleaned_data['progress']
         if progress_f == '0':
-            all_false = Project.objects.filter(task__done=False).exclude(task__done=True)
-            empty = Project.objects.filter(task__isnull=True)
-            q = (all_false | empty).distinct()
+            q = q.filter(tasks_done=0)
         elif progress_f == '50':
-            q = Project.objects.filter(task__done=True).filter(task__done=False).distinct()
+            q = q.filter(tasks_done__gt=0, tasks_done__lt=F('tasks_total'))
         elif progress_f == '100':
-            q = Project.objects.filter(task__done=True).exclude(task__done=False).distinct()
+            q = q.filter(tasks_total__gt=0, tasks_done=F('tasks_total'))
 
         # Filter: pinned (bool)
         pinned = filter_form.cleaned_data['pinned']
         if pinned:
             q = q.filter(pinned=True)
 
-        # Search (TODO)
+        # Search
         search = filter_form.cleaned_data['search']
         if search:
-            q = q.filter(title__icontains=search)
+            q = fulltext.get_backend().filter(q, search)
 
         return q
 
@@ -303,7 +341,7 @@ class ProjectView(TaskListView):
 
     def query(self, request, slug):
         """Query the database for the project."""
-        self.p = get_object_or_404(Project, slug=slug, user=request.user)
+        self.p = get_object_or_404(queries.with_progress(Project.objects), slug=slug, user=request.user)
         return queries.tasks_in_project(request, self.p)
 
     def process_context(self, request, context):
@@ -314,18 +352,21 @@ class ProjectView(TaskListView):
 
     def post(self, request, slug):
         """Handle POST requests."""
+        if BulkTaskForm.prefix + '-action' in request.POST:
+            return super().post(request, slug)
         self.query(request, slug)
         if request.POST.get('action') == 'delete':
             if request.POST.get('really') == '1':
-                if request.POST.get('delete_tasks') == 'delete':
-                    self.p.task_set.all().delete()
-                elif request.POST.get('delete_tasks') == 'trash':
-                    self.p.task_set.all().update(project=None, folder='trash')
-                else:
-                    self.p.task_set.clear()
-
-                self.p.delete()
-                update_badges(request.user)
+                with counters.deferred():
+                    if request.POST.get('delete_tasks') == 'delete':
+                        self.p.task_set.all().delete()
+                    elif request.POST.get('delete_tasks') == 'trash':
+                        self.p.task_set.all().update(project=None, folder='trash')
+                    else:
+                        self.p.task_set.clear()
+
+                    self.p.delete()
+                    counters.recount_badges(request.user.pk)
                 messages.success(request, "Project “{0}” deleted permanently.".format(self.p.title))
                 return HttpResponseRedirect(reverse('achieve:projects'))
             elif request.POST.get('really') == '0':
@@ -483,13 +524,9 @@ class AddProjectView(AddView):
 def collection(request):
     """Add new tasks in bulk in collection mode."""
     if request.method == 'POST':
-        tasks = []
-        for i in request.POST['collection-box'].split('\n'):
-            i = i.strip()
-            if i:
-                t = add_to_inbox(request, i, False)
-                t.save()
-                tasks.append(t)
+        titles = [i.strip() for i in request.POST['collection-box'].split('\n')]
+        tasks = add_to_inbox_bulk(request, [i for i in titles if i])
+        request.user.achieveprofile.refresh_from_db(fields=counters.BADGE_FIELDS)
         return render(request, "achieve/collection_results.html", {"tasks": tasks})
     else:
         return render(request, "achieve/collection.html", {})
@@ -511,6 +548,21 @@ def quick_add(request):
         return render(request, "achieve/error.html", {"message": "Task title is empty."}, status=400)
     return next_page(request)
 
+
+@login_required
+def search(request):
+    """Search tasks, projects and tags, best matches first."""
+    terms = request.GET.get('q', '').strip()
+    context = {'title': 'Search', 'terms': terms}
+    if terms:
+        backend = fulltext.get_backend()
+        limit = settings.ACHIEVE_ITEMS_PER_PAGE
+        projects = Project.objects.filter(user=request.user)
+        context['tasks'] = backend.search(queries.all_tasks(request), terms, limit)
+        context['projects'] = backend.search(projects, terms, limit, load=queries.with_progress(projects))
+        context['tags'] = backend.search(queries.tags(request), terms, limit)
+    return render(request, "achieve/search.html", context)
+
 # Actions
 
 
@@ -519,9 +571,8 @@ def trash_empty(request):
     """Empty the Trash."""
     really = request.POST.get('really')
     if really == '1':
-        queries.trash(request).delete()
+        purge_tasks(queries.trash(request))
         messages.success(request, "Trash emptied.")
-        update_badges(request.user)
         return next_page(request, reverse('achieve:trash'))
     elif really == '0':
         return next_page(request, reverse('achieve:trash'))
@@ -679,10 +730,12 @@ def auth_profile(request):
                 tzname = form.cleaned_data['timezone']
                 pytz.timezone(tzname)
                 request.user.achieveprofile.timezone = tzname
-                request.user.achieveprofile.save()
+                # Only the time zone, badges are updated concurrently.
+                request.user.achieveprofile.save(update_fields=['timezone'])
             except pytz.UnknownTimeZoneError:
                 form.errors['timezone'] = 'Unknown time zone.'
             request.user.save()
+            counters.touch(request.user.pk)
     elif request.method == "POST" and request.POST.get('action') == 'update_badges':
         update_badges(request.user)
         messages.success(request, "Badges successfully updated.")
@@ -698,16 +751,59 @@ def auth_profile(request):
 
 
 @login_required
+def export(request):
+    """Stream all data of the user as JSON Lines or CSV, optionally gzip compressed."""
+    format = request.GET.get('format', 'jsonl')
+    if format not in transfer.EXPORT_FORMATS:
+        return HttpResponse("Unknown export format.", status=400, content_type='text/plain')
+    compress = request.GET.get('gzip') == '1'
+    content_type = 'application/gzip' if compress else transfer.EXPORT_FORMATS[format][0]
+    response = StreamingHttpResponse(transfer.export_stream(request.user, format, compress),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+        transfer.export_filename(request.user, format, compress))
+    return response
+
+
+@login_required
+def import_data(request):
+    """Import tasks, projects and tags from an uploaded export."""
+    importer = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = transfer.open_import(form.cleaned_data['file'], form.cleaned_data['compressed'])
+            importer = transfer.import_stream(request.user, stream, form.cleaned_data['format'])
+            request.user.achieveprofile.refresh_from_db(fields=counters.BADGE_FIELDS)
+            form = ImportForm()
+    else:
+        form = ImportForm()
+    context = {
+        'form': form,
+        'summary': importer and transfer.import_summary(importer),
+        'errors': importer.errors if importer else [],
+        'more_errors': importer.error_count - len(importer.errors) if importer else 0,
+    }
+    return render(request, "achieve/import.html", context)
+
+
+@login_required
+@conditional_page
 def api_reminders_soon(request):
     """Return reminders due soon in JSON format."""
-    q = queries.reminders_soon(request)
-    data = []
-    for task in q:
-        data.append({
-            'id': task.pk,
-            'title': task.title,
-            'timestamp': task.reminder.replace(tzinfo=pytz.UTC).timestamp(),
-            'description': task.description,
-            'url': task.get_absolute_url()
-        })
-    return JsonResponse({"reminders": data})
+    reminders = scheduler.queue.reminders_soon(request.user, request.user.achieveprofile.generation)
+    return JsonResponse({"reminders": reminders})
+
+
+@login_required
+def api_reminders_stream(request):
+    """Stream reminders due soon and their changes as Server-Sent Events."""
+    if not settings.ACHIEVE_REMINDER_STREAM:
+        # EventSource does not reconnect after 204, achieve.js falls back to polling.
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(events.reminder_stream(request, request.META.get('HTTP_LAST_EVENT_ID')),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Don’t let nginx buffer the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
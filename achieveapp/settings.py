@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 """
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+import importlib.util
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -43,6 +44,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = [
+    # First, so that it sees all queries; only used with ACHIEVE_TIMING.
+    'achieve.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,24 +58,47 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'achieveapp.urls'
 
+CONTEXT_PROCESSORS = [
+    'django.template.context_processors.debug',
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+    'achieve.cproc.badges',
+    'achieve.cproc.pinned',
+]
+
 TEMPLATES = [
     {
+        'NAME': 'django',
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-                'achieve.cproc.badges',
-                'achieve.cproc.pinned',
-            ],
+            'context_processors': CONTEXT_PROCESSORS,
         },
     },
 ]
 
+# Template engine for the Achieve pages: 'django' or 'jinja2' (needs Jinja2).
+# Pages without a Jinja2 version (like the login pages) always use Django.
+ACHIEVE_TEMPLATE_ENGINE = os.environ.get('ACHIEVE_TEMPLATE_ENGINE', 'django')
+
+if importlib.util.find_spec('jinja2') is not None:
+    JINJA2_TEMPLATES = {
+        'NAME': 'jinja2',
+        'BACKEND': 'achieve.jinja.Jinja2',
+        'DIRS': [os.path.join(BASE_DIR, 'jinja2')],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'environment': 'achieve.jinja.environment',
+            'context_processors': CONTEXT_PROCESSORS,
+        },
+    }
+    if ACHIEVE_TEMPLATE_ENGINE == 'jinja2':
+        TEMPLATES.insert(0, JINJA2_TEMPLATES)
+    else:
+        TEMPLATES.append(JINJA2_TEMPLATES)
+
 WSGI_APPLICATION = 'achieveapp.wsgi.application'
 
 
@@ -99,6 +125,19 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.10/topics/cache/
+# With more than one worker process, use a shared backend (e.g. memcached),
+# otherwise workers will not see each other’s invalidations.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -120,6 +159,11 @@ MESSAGE_TAGS = {
 
 # Authentication
 LOGIN_URL = '/login/'
+# ModelBackend is kept for sessions started before ProfileModelBackend was added.
+AUTHENTICATION_BACKENDS = [
+    'achieve.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_REDIRECT_URL = '/'
 
 # Logging
@@ -151,3 +195,31 @@ STATIC_ROOT = os.environ.get('DJANGO_STATIC_ROOT', '/srv/achieve/static')
 
 # Achieve settings
 ACHIEVE_ITEMS_PER_PAGE = 15
+# Maximum number of rows in a single bulk INSERT/UPDATE/DELETE
+ACHIEVE_BULK_BATCH_SIZE = 500
+# Tasks left in the Trash for this many days are deleted by expire_trash
+ACHIEVE_TRASH_EXPIRY_DAYS = 30
+# Send SQL query counts and timings of every request in a Server-Timing header
+# and log them to the achieve.timing logger (see achieve.middleware.TimingMiddleware)
+ACHIEVE_TIMING = os.environ.get('ACHIEVE_TIMING') == '1'
+# Log SQL statements run at least this many times in one request (N+1 queries)
+ACHIEVE_TIMING_REPEATED_QUERIES = 5
+# Dotted path to the search backend class (None: pick one for the database)
+ACHIEVE_SEARCH_BACKEND = None
+# How long to cache the pinned items of a user, in seconds
+ACHIEVE_PINNED_CACHE_TIMEOUT = 24 * 60 * 60
+# How long to cache rendered task and project tables and their rows, in seconds
+ACHIEVE_FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+# Pages answered with 304 Not Modified can be this old (in seconds), as the
+# due-soon state of tasks changes over time
+ACHIEVE_CONDITIONAL_BUCKET = 5 * 60
+# Push reminder changes to browsers with Server-Sent Events (opt-in).  Each
+# open stream occupies a worker thread for up to ACHIEVE_EVENT_STREAM_DURATION
+# seconds, so only enable it on an async or threaded server; browsers poll
+# for reminders if it is disabled.
+ACHIEVE_REMINDER_STREAM = os.environ.get('ACHIEVE_REMINDER_STREAM') == '1'
+ACHIEVE_EVENT_STREAM_DURATION = 5 * 60
+ACHIEVE_EVENT_HEARTBEAT = 15
+ACHIEVE_EVENT_RETRY = 5
+# Number of events kept per user for clients that reconnect
+ACHIEVE_EVENT_BUFFER_SIZE = 100